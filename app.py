@@ -1,12 +1,25 @@
 import streamlit as st
 import json
 from pymongo import MongoClient
+from bson import json_util
 from openai import OpenAI
 import anthropic
 import pandas as pd
 from datetime import datetime
 import certifi
+import os
+import uuid
+import re
+import threading
 import config
+from schema_catalog import optimize_frame_dtypes
+from result_history import ResultHistory, get_history_stats
+from index_specs import check_timeseries_support, ensure_indexes, tenant_key_field
+from exports import (
+    EXPORT_FORMATS, DISPLAY_EXPORT_FORMATS, FULL_EXPORT_FORMATS,
+    serialize_frame, export_file_name, start_export_job, get_export_job, cleanup_old_exports,
+    read_export_file,
+)
 
 
 # =============================================================================
@@ -320,6 +333,44 @@ def get_user_franchise_filter():
     return None
 
 
+def get_user_tenant_filter():
+    """
+    Get the tenant keys the current user's queries are limited to.
+    Returns None if no tenant filter applies (single-tenant storage, or a
+    user who sees all franchises), otherwise the keys of the tenants mapped
+    to the user's franchise in config.FSM_TENANTS (empty if none are).
+    """
+    if not config.MULTI_TENANT:
+        return None
+    user = st.session_state.get("user") or {}
+    franchise = user.get("franchise")
+    if not franchise or franchise == "All Franchises":
+        return None
+    return [t["key"] for t in config.FSM_TENANTS if t.get("franchise") == franchise]
+
+
+def get_user_filters():
+    """
+    The current user's (franchise states, tenant keys) filters.
+    Must be called on the script thread - background exports are given the
+    filters resolved when they were started.
+    """
+    return get_user_franchise_filter(), get_user_tenant_filter()
+
+
+def apply_tenant_filter_to_query(query, tenant_keys, collection_name):
+    """
+    Limit a query to the given tenants' partition (see get_user_tenant_filter).
+    The tenant key leads every index, so the filter narrows index scans.
+    """
+    if tenant_keys is None:
+        return query
+    tenant_filter = {tenant_key_field(collection_name): {"$in": tenant_keys}}
+    if query:
+        return {"$and": [tenant_filter, query]}
+    return tenant_filter
+
+
 def get_state_field_for_collection(collection_name):
     """
     Get the state field name for a given collection.
@@ -1411,6 +1462,7 @@ OPENAI_API_KEY = "sk-..."
             serverSelectionTimeoutMS=30000,
         )
         client.admin.command("ping")
+        check_timeseries_support(client)
         return client
     except Exception as e:
         st.error(f"Failed to connect to MongoDB: {e}")
@@ -1454,18 +1506,65 @@ def get_collection_schema(db, collection_name):
         return {"error": str(e)}
 
 
+@st.cache_resource
+def start_index_bootstrap(_client):
+    """
+    Apply the index specs (index_specs.py) once per process, on a background
+    thread so the first page load isn't held up by index builds.
+    Returns a dict that receives the report when the run finishes.
+    """
+    status = {"report": None, "error": None}
+
+    def run():
+        try:
+            status["report"] = ensure_indexes(_client[config.MONGODB_DATABASE])
+        except Exception as e:
+            status["error"] = str(e)
+
+    threading.Thread(target=run, daemon=True, name="index-bootstrap").start()
+    return status
+
+
+# List the collections holding FMS data - internal collections (sync state,
+# cache versions) and reload staging/previous copies ("x__staging") are skipped
+def list_data_collections(db):
+    return [
+        name for name in db.list_collection_names()
+        if not name.startswith(("_", "system.")) and "__" not in name
+    ]
+
+
 # Get all collections and their schemas
 def get_database_schema(db):
     schema = {}
-    collections = db.list_collection_names()
+    collections = list_data_collections(db)
     for coll in collections:
         schema[coll] = get_collection_schema(db, coll)
+    # Describe extracted references by their entity's fields (queries on
+    # them are joined in iter_query_cursors), not by the {"id": ...} stub
+    for coll, fields in config.REFERENCE_FIELDS.items():
+        for field, target in fields.items():
+            if coll in schema and target in schema and isinstance(schema[coll], dict) and field in schema[coll]:
+                schema[coll][field] = schema[target]
     return schema
 
 
+def get_data_version(db):
+    """
+    Current data version of every collection, as bumped by the data loader
+    after it changes a collection. Used in cache keys so cached results are
+    dropped as soon as a collection is reloaded.
+    """
+    try:
+        versions = db[config.CACHE_VERSIONS_COLLECTION].find({}, {"version": 1})
+        return tuple(sorted((doc["_id"], doc.get("version", 0)) for doc in versions))
+    except Exception:
+        return ()
+
+
 # Cache database stats to avoid slow queries on every rerun
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def get_database_stats(_db, _collections):
+@st.cache_data(ttl=300)  # Cache for 5 minutes (or until the data version changes)
+def get_database_stats(_db, _collections, data_version=()):
     """Get total document count and per-collection counts (cached)"""
     collection_counts = {}
     total = 0
@@ -1476,6 +1575,143 @@ def get_database_stats(_db, _collections):
     return total, collection_counts
 
 
+# Comparing existing and desired indexes lists the indexes of every
+# collection - cache it instead of repeating that on every admin rerun
+@st.cache_data(ttl=60, show_spinner=False)
+def get_index_report(_db):
+    """Existing vs desired indexes of every FMS collection (cached)"""
+    return ensure_indexes(_db, create=False)
+
+
+# Serialize exports lazily - only runs when a download button is clicked
+@st.cache_data(max_entries=32, show_spinner=False)
+def get_export_bytes(result_id, fmt, _df):
+    """Get export file bytes for a result (memoized per result id and format)"""
+    return serialize_frame(_df, fmt)
+
+
+# Columns that are internal/metadata and hidden from results and exports
+HIDDEN_RESULT_COLUMNS = ['_id', '_importedAt', '_source', '_contentHash', '_source_collection', 'businessLocationId', 'businessLocationDateCreated', 'customerKey']
+# Time-series meta subdocuments only repeat fields of the row
+HIDDEN_RESULT_COLUMNS += [settings["metaField"] for settings in config.TIMESERIES_COLLECTIONS.values()]
+# Loader fields that find queries leave out at the database (see hide_internal_fields):
+# the tenant key and the pre-normalization values (NORMALIZE_KEEP_ORIGINALS)
+INTERNAL_RESULT_FIELDS = [config.TENANT_FIELD, "_original"]
+HIDDEN_RESULT_COLUMNS += INTERNAL_RESULT_FIELDS
+
+
+def hide_internal_fields(projection):
+    """
+    A find projection that also leaves out INTERNAL_RESULT_FIELDS.
+    An inclusion projection is returned as is - it only returns them if asked to.
+    """
+    if projection and any(value not in (0, False) for field, value in projection.items() if field != "_id"):
+        return projection
+    return {**(projection or {}), **{field: 0 for field in INTERNAL_RESULT_FIELDS}}
+
+
+def count_query_records(db, query_obj, user_filters=None):
+    """Number of records a find query matches, or None if it can't be counted"""
+    result = execute_query(db, {**query_obj, "operation": "count"}, user_filters)
+    data = result.get("data") if result.get("success") else None
+    return data[0]["count"] if data else None
+
+
+def start_full_export(db, query_obj, result_id):
+    """Button callback: start a background export of every record matching the query"""
+    fmt = st.session_state.get(f"full_export_fmt_{result_id}", FULL_EXPORT_FORMATS[0])
+    cleanup_old_exports(config.EXPORT_DIR, config.EXPORT_MAX_AGE_HOURS)
+    
+    # The export runs on a background thread, which can't read the session
+    user_filters = get_user_filters()
+    count_fn = None
+    if query_obj.get("operation", "find") == "find":
+        # Count matching records up front so progress can be shown
+        count_fn = lambda: count_query_records(db, query_obj, user_filters)
+    
+    job = start_export_job(
+        lambda: iter_query_cursors(
+            db, query_obj, apply_limits=False, batch_size=config.EXPORT_BATCH_SIZE, user_filters=user_filters
+        ),
+        fmt,
+        config.EXPORT_DIR,
+        hidden_columns=HIDDEN_RESULT_COLUMNS,
+        batch_size=config.EXPORT_BATCH_SIZE,
+        count_fn=count_fn,
+    )
+    if 'export_jobs' not in st.session_state:
+        st.session_state.export_jobs = []
+    st.session_state.export_jobs.append(job.id)
+
+
+def get_session_export_jobs():
+    """This session's full export jobs that are still known to the process"""
+    jobs = [get_export_job(job_id) for job_id in st.session_state.get('export_jobs', [])]
+    return [job for job in jobs if job is not None]
+
+
+def exports_running(jobs):
+    return any(job.status in ("pending", "running") for job in jobs)
+
+
+def show_export_jobs():
+    """
+    Show progress and download links for this session's full exports.
+    Only polls (every 2s) while an export is still running.
+    """
+    jobs = get_session_export_jobs()
+    if not jobs:
+        return
+    if exports_running(jobs):
+        poll_export_jobs()
+    else:
+        render_export_jobs(jobs)
+
+
+@st.fragment(run_every=2)
+def poll_export_jobs():
+    jobs = get_session_export_jobs()
+    render_export_jobs(jobs)
+    if not exports_running(jobs):
+        # Rerun the page once so it renders without the polling fragment
+        st.rerun()
+
+
+def render_export_jobs(jobs):
+    st.markdown("""
+    <div style="margin-top: 1.5rem; margin-bottom: 1rem;">
+        <h4 style="color: #f1f5f9; margin-bottom: 0.75rem; display: flex; align-items: center; gap: 0.5rem;">
+            <span style="font-size: 1.25rem;">📦</span> Full Exports
+        </h4>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    for job in reversed(jobs):
+        label = f"{job.fmt.upper()} • started {job.started_at.strftime('%H:%M:%S')} • {job.processed:,} records"
+        if job.status == "done":
+            col_info, col_dl = st.columns([3, 1])
+            with col_info:
+                st.markdown(f"✅ {label} • {job.file_size / 1024 / 1024:.1f} MB")
+            with col_dl:
+                st.download_button(
+                    label="⬇️ Download",
+                    data=lambda path=job.path: read_export_file(path),
+                    file_name=os.path.basename(job.path),
+                    mime=EXPORT_FORMATS[job.fmt]["mime"],
+                    key=f"full_export_dl_{job.id}",
+                    on_click="ignore",
+                    use_container_width=True
+                )
+        elif job.status == "failed":
+            st.error(f"❌ {label} • {job.error}")
+        else:
+            progress = job.progress
+            if progress is None:
+                st.markdown(f"⏳ {label}")
+            else:
+                st.progress(progress, text=f"⏳ {label} of {job.total:,}")
+
+
 # Generate MongoDB query using AI
 def generate_mongo_query(user_question, schema, ai_provider="openai", model_name="gpt-4o-mini"):
     schema_str = json.dumps(schema, indent=2, default=str)
@@ -1492,6 +1728,7 @@ RULES:
 4. For counting: "operation": "count"
 5. No explanations, just JSON
 6. there are 4 customer collections. so in case user query is related with customer, consider all these 4 collections
+7. Fields of type datetime are stored as dates. Compare them with extended JSON dates, e.g. {{"transactionDate": {{"$gte": {{"$date": "2021-12-01T00:00:00Z"}}}}}}, and use date operators such as $month or $dateToString on them
 
 EXAMPLES:
 - "How many leads?" -> {{"collection": "leads", "operation": "count", "query": {{}}}}
@@ -1534,7 +1771,8 @@ EXAMPLES:
             result = result[:-3]
         result = result.strip()
         
-        return json.loads(result)
+        # Extended JSON, so {"$date": ...} values become real dates
+        return json_util.loads(result)
     except json.JSONDecodeError as e:
         return {"error": f"Failed to parse AI response", "raw": result}
     except Exception as e:
@@ -1624,121 +1862,239 @@ def get_customer_collections_for_query(collection_name):
     return CUSTOMER_COLLECTIONS
 
 
-# Execute MongoDB query
-def execute_query(db, query_obj):
-    try:
-        raw_collection_name = query_obj["collection"]
-        available_collections = db.list_collection_names()
-        collection_name = normalize_collection_name(raw_collection_name, available_collections)
-        print("collection_name: ", collection_name)
-        operation = query_obj.get("operation", "find")
-        
-        # Determine which customer collections to query (if any)
-        customer_collections = get_customer_collections_for_query(raw_collection_name)
-        is_customer_query = customer_collections is not None
-        
-        print("is_customer_query: ", is_customer_query)
-        print("customer_collections: ", customer_collections)
-        
-        # Get franchise filter for role-based data access
-        franchise_states = get_user_franchise_filter()
-        print("franchise_states filter: ", franchise_states)
+# Loader fields dropped from joined reference entities
+REFERENCE_HIDDEN_FIELDS = ["_id", "_importedAt", "_source", "_contentHash", config.TENANT_FIELD, "_original"]
+
+
+def referenced_fields(collection_name, *query_parts):
+    """
+    Reference fields (config.REFERENCE_FIELDS) a query uses beyond their id.
+    Rows only keep {"id": ...} for extracted entities, so filters, groups or
+    projections on e.g. "creditAccount.name" need the entity joined first.
+    """
+    text = json_util.dumps(query_parts)
+    return [
+        field for field in config.REFERENCE_FIELDS.get(collection_name, {})
+        if re.search(rf'"\$?{re.escape(field)}(\.(?!id")[^"]*)?"', text)
+    ]
+
+
+def reference_lookup_stages(collection_name, available_collections, fields=None):
+    """
+    $lookup stages that put extracted entities back into a collection's rows.
+
+    Args:
+        collection_name: Collection being queried
+        available_collections: Existing collections (references are only
+            joined once the loader has created their collection)
+        fields: Reference fields to join (default: all of the collection's)
+
+    Returns:
+        List of pipeline stages (empty if there is nothing to join). Rows
+        whose entity is still embedded, or has no match, keep their value.
+    """
+    references = {
+        field: target for field, target in config.REFERENCE_FIELDS.get(collection_name, {}).items()
+        if target in available_collections and (fields is None or field in fields)
+    }
+    if not references:
+        return []
+    stages = []
+    hidden = {}
+    for field, target in references.items():
+        joined = f"_joined_{field}"
+        if config.MULTI_TENANT:
+            # Entity ids are only unique within a tenant
+            stages.append({"$lookup": {
+                "from": target,
+                "let": {"id": f"${field}.id", "tenant": f"${config.TENANT_FIELD}"},
+                "pipeline": [{"$match": {"$expr": {"$and": [
+                    {"$eq": ["$id", "$$id"]},
+                    {"$eq": [f"${config.TENANT_FIELD}", "$$tenant"]},
+                ]}}}],
+                "as": joined,
+            }})
+        else:
+            stages.append({"$lookup": {"from": target, "localField": f"{field}.id", "foreignField": "id", "as": joined}})
+        stages.append({"$addFields": {field: {"$ifNull": [{"$arrayElemAt": [f"${joined}", 0]}, f"${field}"]}}})
+        hidden[joined] = 0
+        hidden.update({f"{field}.{name}": 0 for name in REFERENCE_HIDDEN_FIELDS})
+    stages.append({"$project": hidden})
+    return stages
+
+
+def count_matching(collection, query, available_collections):
+    """Count a collection's documents matching query, joining references the query needs"""
+    needed = referenced_fields(collection.name, query)
+    if not needed:
+        return collection.count_documents(query)
+    pipeline = reference_lookup_stages(collection.name, available_collections, needed)
+    result = list(collection.aggregate(pipeline + [{"$match": query}, {"$count": "count"}]))
+    return result[0]["count"] if result else 0
+
+
+# Display limits applied when results are materialized for the UI
+CUSTOMER_FIND_LIMIT = 50   # Per customer collection
+FIND_LIMIT = 100           # Single collection
+
+
+def iter_query_cursors(db, query_obj, apply_limits=True, batch_size=None, user_filters=None):
+    """
+    Yield (source_collection, cursor) pairs for a find or aggregate query plan.
+
+    Resolves the target collection(s), applies case-insensitive matching and the
+    franchise filter exactly like execute_query. Cursors are created lazily so
+    callers can stream large results without materializing them.
+
+    Args:
+        db: MongoDB database
+        query_obj: Query plan generated by the AI ({"collection", "operation", ...})
+        apply_limits: Apply the display limits (False streams every matching record)
+        batch_size: Optional cursor batch size for streaming reads
+        user_filters: (franchise states, tenant keys) from get_user_filters()
+            (default: the current user's)
+
+    Yields:
+        (source_collection, cursor) - source_collection is None for single-collection
+        queries and the collection name for multi-collection customer queries
+    """
+    raw_collection_name = query_obj["collection"]
+    available_collections = list_data_collections(db)
+    collection_name = normalize_collection_name(raw_collection_name, available_collections)
+    print("collection_name: ", collection_name)
+    operation = query_obj.get("operation", "find")
+    
+    # Determine which customer collections to query (if any)
+    customer_collections = get_customer_collections_for_query(raw_collection_name)
+    is_customer_query = customer_collections is not None
+    
+    print("is_customer_query: ", is_customer_query)
+    print("customer_collections: ", customer_collections)
+    
+    # Get franchise filter for role-based data access
+    franchise_states, tenant_keys = user_filters or get_user_filters()
+    print("franchise_states filter: ", franchise_states)
+    
+    if is_customer_query:
+        # Search across the determined customer collection(s)
+        target_collections = [c for c in customer_collections if c in available_collections]
+    else:
+        target_collections = [collection_name]
+    
+    for coll_name in target_collections:
+        collection = db[coll_name]
+        source_collection = coll_name if is_customer_query else None
         
         if operation == "find":
             query = query_obj.get("query", {})
             # Make query case-insensitive
             query = make_case_insensitive(query)
-            print("query: ", query)
-            projection = query_obj.get("projection", None)
+            projection = hide_internal_fields(query_obj.get("projection", None))
             print("projection: ", projection)
-            all_results = []
             
-            if is_customer_query:
-                # Search across the determined customer collection(s)
-                for coll_name in customer_collections:
-                    if coll_name in db.list_collection_names():
-                        # Apply franchise filter for this collection
-                        filtered_query = apply_franchise_filter_to_query(query, franchise_states, coll_name)
-                        print(f"filtered_query for {coll_name}: ", filtered_query)
-                        
-                        collection = db[coll_name]
-                        cursor = collection.find(filtered_query, projection).limit(50)
-                        for doc in cursor:
-                            doc['_source_collection'] = coll_name
-                            all_results.append(doc)
-            else:
-                # Apply franchise filter for single collection
-                filtered_query = apply_franchise_filter_to_query(query, franchise_states, collection_name)
-                print("filtered_query: ", filtered_query)
-                
-                # Search single collection
-                collection = db[collection_name]
-                cursor = collection.find(filtered_query, projection).limit(100)
-                all_results = list(cursor)
-                print("all_results count: ", len(all_results))
+            # Apply franchise filter for this collection
+            filtered_query = apply_franchise_filter_to_query(query, franchise_states, coll_name)
+            filtered_query = apply_tenant_filter_to_query(filtered_query, tenant_keys, coll_name)
+            print(f"filtered_query for {coll_name}: ", filtered_query)
             
-            # Convert ObjectId to string for display
-            for doc in all_results:
-                if '_id' in doc:
-                    doc['_id'] = str(doc['_id'])
-            
-            return {"success": True, "data": all_results, "count": len(all_results)}
+            if reference_lookup_stages(coll_name, available_collections):
+                # Rows hold references to extracted entities - join the ones the
+                # filter needs up front and the rest after the limit
+                needed = referenced_fields(coll_name, filtered_query)
+                pipeline = reference_lookup_stages(coll_name, available_collections, needed)
+                pipeline.append({"$match": filtered_query})
+                if apply_limits:
+                    pipeline.append({"$limit": CUSTOMER_FIND_LIMIT if is_customer_query else FIND_LIMIT})
+                remaining = [f for f in config.REFERENCE_FIELDS[coll_name] if f not in needed]
+                pipeline += reference_lookup_stages(coll_name, available_collections, remaining)
+                if projection:
+                    pipeline.append({"$project": projection})
+                options = {"batchSize": batch_size, "allowDiskUse": True} if batch_size else {}
+                cursor = collection.aggregate(pipeline, **options)
+            else:
+                cursor = collection.find(filtered_query, projection)
+                if apply_limits:
+                    cursor = cursor.limit(CUSTOMER_FIND_LIMIT if is_customer_query else FIND_LIMIT)
+                if batch_size:
+                    cursor = cursor.batch_size(batch_size)
         
         elif operation == "aggregate":
             pipeline = query_obj.get("pipeline", [])
             
-            all_results = []
-            if is_customer_query:
-                # Aggregate across the determined customer collection(s)
-                for coll_name in customer_collections:
-                    if coll_name in db.list_collection_names():
-                        # Inject franchise filter as first $match stage
-                        state_field = get_state_field_for_collection(coll_name)
-                        franchise_filter = build_franchise_filter(franchise_states, state_field)
-                        if franchise_filter:
-                            coll_pipeline = [{"$match": franchise_filter}] + pipeline
-                        else:
-                            coll_pipeline = pipeline
-                        
-                        collection = db[coll_name]
-                        cursor = collection.aggregate(coll_pipeline)
-                        for doc in cursor:
-                            doc['_source_collection'] = coll_name
-                            all_results.append(doc)
+            # Inject franchise filter as first $match stage
+            state_field = get_state_field_for_collection(coll_name)
+            franchise_filter = build_franchise_filter(franchise_states, state_field)
+            if franchise_filter:
+                pipeline = [{"$match": franchise_filter}] + pipeline
+                print("Injected franchise filter into aggregate pipeline")
+            
+            # Join extracted entities the pipeline uses (after the franchise match)
+            lookups = reference_lookup_stages(coll_name, available_collections, referenced_fields(coll_name, pipeline))
+            if lookups:
+                position = 1 if franchise_filter else 0
+                pipeline = pipeline[:position] + lookups + pipeline[position:]
+            
+            # The user's tenant partition is matched first, on the leading index key
+            tenant_filter = apply_tenant_filter_to_query({}, tenant_keys, coll_name)
+            if tenant_filter:
+                pipeline = [{"$match": tenant_filter}] + pipeline
+            
+            if batch_size:
+                cursor = collection.aggregate(pipeline, batchSize=batch_size, allowDiskUse=True)
             else:
-                # Inject franchise filter as first $match stage for single collection
-                state_field = get_state_field_for_collection(collection_name)
-                franchise_filter = build_franchise_filter(franchise_states, state_field)
-                if franchise_filter:
-                    pipeline = [{"$match": franchise_filter}] + pipeline
-                    print("Injected franchise filter into aggregate pipeline")
-                
-                collection = db[collection_name]
                 cursor = collection.aggregate(pipeline)
-                all_results = list(cursor)
+        
+        else:
+            raise ValueError(f"Cannot stream operation: {operation}")
+        
+        yield source_collection, cursor
+
+
+# Execute MongoDB query
+def execute_query(db, query_obj, user_filters=None):
+    try:
+        raw_collection_name = query_obj["collection"]
+        operation = query_obj.get("operation", "find")
+        
+        if operation in ("find", "aggregate"):
+            all_results = []
+            for source_collection, cursor in iter_query_cursors(db, query_obj, user_filters=user_filters):
+                for doc in cursor:
+                    if source_collection:
+                        doc['_source_collection'] = source_collection
+                    all_results.append(doc)
+            print("all_results count: ", len(all_results))
             
+            # Convert ObjectId to string for display
             for doc in all_results:
                 if '_id' in doc and not isinstance(doc['_id'], (str, int, float)):
                     doc['_id'] = str(doc['_id'])
+            
             return {"success": True, "data": all_results, "count": len(all_results)}
         
         elif operation == "count":
+            available_collections = list_data_collections(db)
+            collection_name = normalize_collection_name(raw_collection_name, available_collections)
+            customer_collections = get_customer_collections_for_query(raw_collection_name)
+            is_customer_query = customer_collections is not None
+            franchise_states, tenant_keys = user_filters or get_user_filters()
+            
             query = query_obj.get("query", {})
             query = make_case_insensitive(query)
             
             total_count = 0
             if is_customer_query:
                 for coll_name in customer_collections:
-                    if coll_name in db.list_collection_names():
+                    if coll_name in available_collections:
                         # Apply franchise filter for this collection
                         filtered_query = apply_franchise_filter_to_query(query, franchise_states, coll_name)
-                        collection = db[coll_name]
-                        total_count += collection.count_documents(filtered_query)
+                        filtered_query = apply_tenant_filter_to_query(filtered_query, tenant_keys, coll_name)
+                        total_count += count_matching(db[coll_name], filtered_query, available_collections)
             else:
                 # Apply franchise filter for single collection
                 filtered_query = apply_franchise_filter_to_query(query, franchise_states, collection_name)
-                collection = db[collection_name]
-                total_count = collection.count_documents(filtered_query)
+                filtered_query = apply_tenant_filter_to_query(filtered_query, tenant_keys, collection_name)
+                total_count = count_matching(db[collection_name], filtered_query, available_collections)
             
             return {"success": True, "data": [{"count": total_count}], "count": 1}
         
@@ -1838,6 +2194,355 @@ Provide a brief 2-3 sentence summary answering the question with key facts and n
         return f"Summary generation error: {str(e)}"
 
 
+# Show a query result: status header plus query, results and insights tabs
+def show_query_result(db, result_id, meta, df_display):
+    query_obj = meta["query_obj"]
+    results = meta["results"]
+    summary = meta["summary"]
+    
+    # Results Header with status
+    st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
+    
+    if results["success"]:
+        st.markdown(f"""
+        <div style="display: flex; align-items: center; gap: 1rem; margin-bottom: 1.5rem; padding: 1rem 1.5rem; background: linear-gradient(135deg, rgba(34, 197, 94, 0.1) 0%, rgba(16, 185, 129, 0.05) 100%); border: 1px solid rgba(34, 197, 94, 0.3); border-radius: 12px;">
+            <div style="width: 48px; height: 48px; background: linear-gradient(135deg, #22c55e, #10b981); border-radius: 12px; display: flex; align-items: center; justify-content: center; font-size: 1.5rem;">✓</div>
+            <div>
+                <div style="font-size: 1.25rem; font-weight: 600; color: #f1f5f9;">Query Executed Successfully</div>
+                <div style="font-size: 0.9rem; color: #94a3b8;">Found <span style="color: #22c55e; font-weight: 600;">{results['count']}</span> records in <span style="color: #6366f1; font-weight: 500;">{query_obj.get('collection', 'N/A')}</span></div>
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+    else:
+        st.markdown(f"""
+        <div style="display: flex; align-items: center; gap: 1rem; margin-bottom: 1.5rem; padding: 1rem 1.5rem; background: linear-gradient(135deg, rgba(239, 68, 68, 0.1) 0%, rgba(220, 38, 38, 0.05) 100%); border: 1px solid rgba(239, 68, 68, 0.3); border-radius: 12px;">
+            <div style="width: 48px; height: 48px; background: linear-gradient(135deg, #ef4444, #dc2626); border-radius: 12px; display: flex; align-items: center; justify-content: center; font-size: 1.5rem;">✗</div>
+            <div>
+                <div style="font-size: 1.25rem; font-weight: 600; color: #f1f5f9;">Query Execution Failed</div>
+                <div style="font-size: 0.9rem; color: #fca5a5;">{results.get('error', 'Unknown error')}</div>
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    # Create 3 tabs for organized results display (MongoDB Query first, then Results, then AI Insights)
+    tab1, tab2, tab3 = st.tabs(["⚙️ MongoDB Query", "📊 Query Results", "💬 AI Insights"])
+    
+    # Tab 1: Generated MongoDB Query
+    with tab1:
+        st.markdown("""
+        <div style="margin-bottom: 1rem;">
+            <h4 style="color: #f1f5f9; margin-bottom: 0.5rem; display: flex; align-items: center; gap: 0.5rem;">
+                <span style="font-size: 1.25rem;">🔧</span> Generated MongoDB Query
+            </h4>
+            <p style="color: #94a3b8; font-size: 0.875rem; margin: 0;">AI-generated query based on your natural language input</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        st.code(json_util.dumps(query_obj, indent=2), language="json")
+        
+        # Query Details Cards
+        st.markdown("""
+        <div style="margin-top: 1.5rem; margin-bottom: 1rem;">
+            <h4 style="color: #f1f5f9; margin-bottom: 0.75rem; display: flex; align-items: center; gap: 0.5rem;">
+                <span style="font-size: 1.25rem;">📋</span> Query Parameters
+            </h4>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.markdown(f"""
+            <div style="background: linear-gradient(135deg, rgba(99, 102, 241, 0.15) 0%, rgba(139, 92, 246, 0.08) 100%); border: 1px solid rgba(99, 102, 241, 0.3); border-radius: 12px; padding: 1rem; text-align: center;">
+                <div style="font-size: 0.75rem; color: #94a3b8; text-transform: uppercase; letter-spacing: 0.05em; margin-bottom: 0.25rem;">Collection</div>
+                <div style="font-size: 1.1rem; font-weight: 600; color: #a5b4fc;">{query_obj.get("collection", "N/A")}</div>
+            </div>
+            """, unsafe_allow_html=True)
+        with col2:
+            st.markdown(f"""
+            <div style="background: linear-gradient(135deg, rgba(14, 165, 233, 0.15) 0%, rgba(6, 182, 212, 0.08) 100%); border: 1px solid rgba(14, 165, 233, 0.3); border-radius: 12px; padding: 1rem; text-align: center;">
+                <div style="font-size: 0.75rem; color: #94a3b8; text-transform: uppercase; letter-spacing: 0.05em; margin-bottom: 0.25rem;">Operation</div>
+                <div style="font-size: 1.1rem; font-weight: 600; color: #7dd3fc;">{query_obj.get("operation", "N/A")}</div>
+            </div>
+            """, unsafe_allow_html=True)
+        with col3:
+            st.markdown(f"""
+            <div style="background: linear-gradient(135deg, rgba(16, 185, 129, 0.15) 0%, rgba(34, 197, 94, 0.08) 100%); border: 1px solid rgba(16, 185, 129, 0.3); border-radius: 12px; padding: 1rem; text-align: center;">
+                <div style="font-size: 0.75rem; color: #94a3b8; text-transform: uppercase; letter-spacing: 0.05em; margin-bottom: 0.25rem;">Limit</div>
+                <div style="font-size: 1.1rem; font-weight: 600; color: #6ee7b7;">{query_obj.get("limit", "N/A")}</div>
+            </div>
+            """, unsafe_allow_html=True)
+        with col4:
+            st.markdown(f"""
+            <div style="background: linear-gradient(135deg, rgba(245, 158, 11, 0.15) 0%, rgba(251, 191, 36, 0.08) 100%); border: 1px solid rgba(245, 158, 11, 0.3); border-radius: 12px; padding: 1rem; text-align: center;">
+                <div style="font-size: 0.75rem; color: #94a3b8; text-transform: uppercase; letter-spacing: 0.05em; margin-bottom: 0.25rem;">Results</div>
+                <div style="font-size: 1.1rem; font-weight: 600; color: #fcd34d;">{results.get('count', 0)}</div>
+            </div>
+            """, unsafe_allow_html=True)
+    
+    # Tab 2: Query Results
+    with tab2:
+        if results["success"]:
+            if df_display is not None and not df_display.empty:
+                # Memory saved by dtype optimization (see optimize_frame_dtypes)
+                memory_info = ""
+                dtype_report = meta.get("dtype_report")
+                if dtype_report and dtype_report["before_bytes"]:
+                    saved_pct = 100 * dtype_report["saved_bytes"] / dtype_report["before_bytes"]
+                    memory_info = f"""<span style="color: #475569;">|</span>
+                        <span style="color: #94a3b8; font-size: 0.875rem;" title="{len(dtype_report['columns'])} columns converted">🗜️ <span style="color: #6ee7b7; font-weight: 500;">{dtype_report['before_bytes'] / 1024:,.0f} KB → {dtype_report['after_bytes'] / 1024:,.0f} KB</span> ({saved_pct:.0f}% smaller)</span>"""
+                
+                # Results info bar
+                st.markdown(f"""
+                <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 1rem; padding: 0.75rem 1rem; background: rgba(30, 41, 59, 0.6); border-radius: 10px; border: 1px solid #334155;">
+                    <div style="display: flex; align-items: center; gap: 1rem;">
+                        <span style="color: #94a3b8; font-size: 0.875rem;">📊 Showing <span style="color: #f1f5f9; font-weight: 600;">{len(df_display)}</span> records</span>
+                        <span style="color: #475569;">|</span>
+                        <span style="color: #94a3b8; font-size: 0.875rem;">📁 <span style="color: #a5b4fc; font-weight: 500;">{len(df_display.columns)}</span> columns</span>
+                        {memory_info}
+                    </div>
+                </div>
+                """, unsafe_allow_html=True)
+                
+                st.dataframe(df_display, use_container_width=True, height=450)
+                
+                # Export section
+                st.markdown("""
+                <div style="margin-top: 1.5rem; margin-bottom: 1rem;">
+                    <h4 style="color: #f1f5f9; margin-bottom: 0.75rem; display: flex; align-items: center; gap: 0.5rem;">
+                        <span style="font-size: 1.25rem;">📥</span> Export Data
+                    </h4>
+                </div>
+                """, unsafe_allow_html=True)
+                
+                # Exports are serialized only when a download is clicked,
+                # then memoized per result id (see get_export_bytes)
+                export_time = datetime.now()
+                export_cols = st.columns(len(DISPLAY_EXPORT_FORMATS))
+                for export_col, fmt in zip(export_cols, DISPLAY_EXPORT_FORMATS):
+                    with export_col:
+                        st.download_button(
+                            label=EXPORT_FORMATS[fmt]["label"],
+                            data=lambda fmt=fmt: get_export_bytes(result_id, fmt, df_display),
+                            file_name=export_file_name(fmt, export_time),
+                            mime=EXPORT_FORMATS[fmt]["mime"],
+                            on_click="ignore",
+                            use_container_width=True
+                        )
+                
+                # Full export - every matching record, streamed to disk in the background
+                if query_obj.get("operation", "find") in ("find", "aggregate"):
+                    col_fmt, col_btn, col_spacer = st.columns([1, 1, 2])
+                    with col_fmt:
+                        st.selectbox(
+                            "Full export format",
+                            FULL_EXPORT_FORMATS,
+                            format_func=str.upper,
+                            key=f"full_export_fmt_{result_id}",
+                            label_visibility="collapsed"
+                        )
+                    with col_btn:
+                        st.button(
+                            "📦 Export All Records",
+                            key=f"full_export_{result_id}",
+                            on_click=start_full_export,
+                            args=(db, query_obj, result_id),
+                            help="Re-run the query without the display limit and export every matching record",
+                            use_container_width=True
+                        )
+            else:
+                st.markdown("""
+                <div style="text-align: center; padding: 3rem 2rem; background: rgba(30, 41, 59, 0.5); border-radius: 12px; border: 1px dashed #475569;">
+                    <div style="font-size: 3rem; margin-bottom: 1rem;">📭</div>
+                    <div style="font-size: 1.1rem; color: #f1f5f9; font-weight: 500; margin-bottom: 0.5rem;">No Data Found</div>
+                    <div style="font-size: 0.875rem; color: #94a3b8;">The query executed successfully but returned no results.</div>
+                </div>
+                """, unsafe_allow_html=True)
+        else:
+            st.error(f"❌ Query execution failed: {results['error']}")
+    
+    # Tab 3: AI Insights
+    with tab3:
+        if results["success"]:
+            st.markdown("""
+            <div style="margin-bottom: 1rem;">
+                <h4 style="color: #f1f5f9; margin-bottom: 0.5rem; display: flex; align-items: center; gap: 0.5rem;">
+                    <span style="font-size: 1.25rem;">🧠</span> AI Analysis & Insights
+                </h4>
+                <p style="color: #94a3b8; font-size: 0.875rem; margin: 0;">Intelligent summary generated by AI based on your query results</p>
+            </div>
+            """, unsafe_allow_html=True)
+            
+            st.markdown(f"""
+            <div style="background: linear-gradient(135deg, rgba(99, 102, 241, 0.08) 0%, rgba(139, 92, 246, 0.04) 100%); border: 1px solid rgba(99, 102, 241, 0.2); border-left: 4px solid #6366f1; border-radius: 12px; padding: 1.5rem; color: #f1f5f9; font-size: 1rem; line-height: 1.8;">
+                {summary}
+            </div>
+            """, unsafe_allow_html=True)
+            
+            # Quick stats from AI
+            st.markdown("""
+            <div style="margin-top: 1.5rem; padding: 1rem; background: rgba(30, 41, 59, 0.5); border-radius: 10px; border: 1px solid #334155;">
+                <div style="display: flex; align-items: center; gap: 0.5rem; color: #94a3b8; font-size: 0.8rem;">
+                    <span>💡</span>
+                    <span>AI insights are generated based on the query results and may provide additional context and analysis.</span>
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
+        else:
+            st.markdown("""
+            <div style="text-align: center; padding: 3rem 2rem; background: rgba(30, 41, 59, 0.5); border-radius: 12px; border: 1px dashed #475569;">
+                <div style="font-size: 3rem; margin-bottom: 1rem;">⚠️</div>
+                <div style="font-size: 1.1rem; color: #f1f5f9; font-weight: 500; margin-bottom: 0.5rem;">Insights Unavailable</div>
+                <div style="font-size: 0.875rem; color: #94a3b8;">AI insights cannot be generated due to query execution error.</div>
+            </div>
+            """, unsafe_allow_html=True)
+
+
+def build_display_frame(results):
+    """
+    Build the results DataFrame shown in the UI.
+    
+    Returns:
+        (DataFrame, dtype report) - (None, None) when there is no data
+    """
+    if not results.get("success") or not results.get("data"):
+        return None, None
+    df = pd.DataFrame(results["data"])
+    # Remove internal/metadata columns from display
+    df = df.drop(columns=[col for col in HIDDEN_RESULT_COLUMNS if col in df.columns])
+    # Categoricals, downcast numbers and parsed dates keep results small in memory
+    return optimize_frame_dtypes(df)
+
+
+def get_result_history():
+    """Get this session's result history (created on first use)"""
+    if 'result_history' not in st.session_state:
+        user = st.session_state.get('user') or {}
+        st.session_state.result_history = ResultHistory(
+            budget_bytes=config.RESULT_HISTORY_SESSION_MB * 1024 * 1024,
+            spill_dir=config.RESULT_SPILL_DIR,
+            max_entries=config.RESULT_HISTORY_MAX_ENTRIES,
+            process_budget_bytes=config.RESULT_HISTORY_PROCESS_MB * 1024 * 1024,
+            label=user.get("email"),
+        )
+    return st.session_state.result_history
+
+
+def show_result_history_picker(history):
+    """Let the user switch between results from earlier questions in this session"""
+    entries = history.list_entries()
+    if len(entries) < 2:
+        return
+    labels = {}
+    for entry_id, meta, spilled in entries:
+        count = meta["results"].get("count") or 0
+        label = f"🕘 {meta['created_at'].strftime('%H:%M:%S')} • {meta['question'][:80]} ({count} records)"
+        labels[entry_id] = label + (" • 💾 on disk" if spilled else "")
+    entry_ids = list(labels.keys())
+    active_result_id = st.session_state.get('active_result_id')
+    st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
+    st.selectbox(
+        "Result history",
+        entry_ids,
+        index=entry_ids.index(active_result_id) if active_result_id in entry_ids else 0,
+        format_func=labels.get,
+        key="result_history_picker",
+        on_change=lambda: st.session_state.update(active_result_id=st.session_state.result_history_picker),
+        help="Results from earlier questions in this session. Older results are kept on disk and reloaded when selected."
+    )
+
+
+def show_index_report(db):
+    """Admin section: existing vs desired indexes of every FMS collection"""
+    st.markdown("""
+    <div class="glass-card">
+        <div class="card-title">
+            <div class="card-title-icon">🗂️</div>
+            Indexes
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    col_create, col_refresh = st.columns(2)
+    with col_create:
+        if st.button("🔧 Create Missing Indexes", use_container_width=True):
+            with st.spinner("Building indexes..."):
+                for row in ensure_indexes(db):
+                    if row["status"] == "failed":
+                        st.error(f"{row['collection']}.{row['index']}: {row['detail']}")
+                    elif row["status"] == "conflict" and row["detail"]:
+                        st.warning(f"{row['collection']}.{row['index']}: {row['detail']}")
+            get_index_report.clear()
+    with col_refresh:
+        if st.button("🔄 Refresh", key="refresh_index_report", use_container_width=True):
+            get_index_report.clear()
+    
+    df = pd.DataFrame(get_index_report(db))
+    df["keys"] = df["keys"].map(lambda keys: ", ".join(f"{field} {direction}" for field, direction in keys))
+    
+    counts = df["status"].value_counts()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("In Place", int(counts.get("ok", 0)))
+    with col2:
+        st.metric("Missing / Conflicting", int(counts.get("missing", 0) + counts.get("conflict", 0)))
+    with col3:
+        st.metric("Not in Specs", int(counts.get("extra", 0)))
+    
+    st.dataframe(df, use_container_width=True, hide_index=True)
+
+
+def show_admin_page(db):
+    """Admin page: process-level memory accounting and index status"""
+    stats = get_history_stats()
+    
+    st.markdown("""
+    <div class="glass-card">
+        <div class="card-title">
+            <div class="card-title-icon">🛡️</div>
+            Result History Memory
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    mb = 1024 * 1024
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Sessions", len(stats["sessions"]))
+    with col2:
+        st.metric("Results in Memory", f"{stats['memory_bytes'] / mb:.1f} MB",
+                  help=f"Process budget: {config.RESULT_HISTORY_PROCESS_MB} MB")
+    with col3:
+        st.metric("Spilled to Disk", f"{stats['disk_bytes'] / mb:.1f} MB")
+    with col4:
+        rss = stats["process_rss_bytes"]
+        st.metric("Process RSS", f"{rss / mb:.0f} MB" if rss else "N/A")
+    
+    if stats["sessions"]:
+        df = pd.DataFrame(stats["sessions"])
+        for column in ["memory_bytes", "disk_bytes", "budget_bytes"]:
+            df[column.replace("_bytes", "_mb")] = (df.pop(column) / mb).round(2)
+        st.dataframe(df, use_container_width=True, hide_index=True)
+    else:
+        st.info("No active result histories in this process.")
+    
+    show_index_report(db)
+
+
+def show_footer():
+    st.markdown("""
+    <div class="footer">
+        <div class="footer-brand">
+            <span>⚡ FMS Query Engine</span>
+        </div>
+        <div>Powered by OpenAI GPT-4 & Anthropic Claude • MongoDB Backend</div>
+        <div style="margin-top: 0.5rem; font-size: 0.75rem; color: #475
+        569;">
+            © 2025 Enterprise Analytics Suite • Version 2.0
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+
 # Main Application
 def main():
     # Initialize session state for login
@@ -1862,7 +2567,9 @@ def main():
         return
     
     db = mongo_client[config.MONGODB_DATABASE]
-    collections = db.list_collection_names()
+    collections = list_data_collections(db)
+    if config.ENSURE_INDEXES_ON_STARTUP:
+        start_index_bootstrap(mongo_client)
     
     # Hero Header with user info
     st.markdown(f"""
@@ -1895,8 +2602,14 @@ def main():
         if st.button("🚪 Logout", use_container_width=True):
             st.session_state.logged_in = False
             st.session_state.user = None
+            st.session_state.pop('result_history', None)
+            st.session_state.pop('active_result_id', None)
             st.rerun()
         
+        # Admin navigation (Super System4 Admins only)
+        if "system_settings" in user.get("permissions", []):
+            st.radio("Page", ["🔍 Query Engine", "🛡️ Admin"], key="active_page", horizontal=True)
+        
         st.markdown('<div class="sidebar-header">⚙️ Configuration</div>', unsafe_allow_html=True)
         
         # AI Model Selection - 6 options (3 OpenAI + 3 Claude)
@@ -1928,7 +2641,7 @@ def main():
         st.markdown('<div class="sidebar-header">📊 Database</div>', unsafe_allow_html=True)
         
         # Database Stats (cached to avoid slow reloads)
-        total_docs, collection_counts = get_database_stats(db, tuple(collections))
+        total_docs, collection_counts = get_database_stats(db, tuple(collections), get_data_version(db))
         col1, col2 = st.columns(2)
         with col1:
             st.markdown(f"""
@@ -1971,6 +2684,12 @@ def main():
                 st.session_state.question_input = q  # Use the same key as the text_area widget
                 st.rerun()  # Refresh UI to show the new value
     
+    # Admin page replaces the query interface
+    if st.session_state.get('active_page') == "🛡️ Admin":
+        show_admin_page(db)
+        show_footer()
+        return
+    
     # Main Content Area
     st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
     
@@ -2013,6 +2732,7 @@ def main():
                 query_obj = generate_mongo_query(user_question, schema, ai_provider)
         
         if "error" in query_obj:
+            st.session_state.pop('active_result_id', None)
             st.error(f"❌ Error generating query: {query_obj['error']}")
             if "raw" in query_obj:
                 st.code(query_obj["raw"], language="text")
@@ -2020,6 +2740,7 @@ def main():
             # Execute query first to get results
             with st.spinner("⚡ Executing query on database..."):
                 results = execute_query(db, query_obj)
+            result_id = uuid.uuid4().hex
             
             # Generate AI insights
             summary = ""
@@ -2027,195 +2748,29 @@ def main():
                 with st.spinner("🧠 Generating insights..."):
                     summary = generate_summary(user_question, query_obj, results, ai_provider)
             
-            # Results Header with status
-            st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
-            
-            if results["success"]:
-                st.markdown(f"""
-                <div style="display: flex; align-items: center; gap: 1rem; margin-bottom: 1.5rem; padding: 1rem 1.5rem; background: linear-gradient(135deg, rgba(34, 197, 94, 0.1) 0%, rgba(16, 185, 129, 0.05) 100%); border: 1px solid rgba(34, 197, 94, 0.3); border-radius: 12px;">
-                    <div style="width: 48px; height: 48px; background: linear-gradient(135deg, #22c55e, #10b981); border-radius: 12px; display: flex; align-items: center; justify-content: center; font-size: 1.5rem;">✓</div>
-                    <div>
-                        <div style="font-size: 1.25rem; font-weight: 600; color: #f1f5f9;">Query Executed Successfully</div>
-                        <div style="font-size: 0.9rem; color: #94a3b8;">Found <span style="color: #22c55e; font-weight: 600;">{results['count']}</span> records in <span style="color: #6366f1; font-weight: 500;">{query_obj.get('collection', 'N/A')}</span></div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.markdown(f"""
-                <div style="display: flex; align-items: center; gap: 1rem; margin-bottom: 1.5rem; padding: 1rem 1.5rem; background: linear-gradient(135deg, rgba(239, 68, 68, 0.1) 0%, rgba(220, 38, 38, 0.05) 100%); border: 1px solid rgba(239, 68, 68, 0.3); border-radius: 12px;">
-                    <div style="width: 48px; height: 48px; background: linear-gradient(135deg, #ef4444, #dc2626); border-radius: 12px; display: flex; align-items: center; justify-content: center; font-size: 1.5rem;">✗</div>
-                    <div>
-                        <div style="font-size: 1.25rem; font-weight: 600; color: #f1f5f9;">Query Execution Failed</div>
-                        <div style="font-size: 0.9rem; color: #fca5a5;">{results.get('error', 'Unknown error')}</div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            # Create 3 tabs for organized results display (MongoDB Query first, then Results, then AI Insights)
-            tab1, tab2, tab3 = st.tabs(["⚙️ MongoDB Query", "📊 Query Results", "💬 AI Insights"])
-            
-            # Tab 1: Generated MongoDB Query
-            with tab1:
-                st.markdown("""
-                <div style="margin-bottom: 1rem;">
-                    <h4 style="color: #f1f5f9; margin-bottom: 0.5rem; display: flex; align-items: center; gap: 0.5rem;">
-                        <span style="font-size: 1.25rem;">🔧</span> Generated MongoDB Query
-                    </h4>
-                    <p style="color: #94a3b8; font-size: 0.875rem; margin: 0;">AI-generated query based on your natural language input</p>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                st.code(json.dumps(query_obj, indent=2), language="json")
-                
-                # Query Details Cards
-                st.markdown("""
-                <div style="margin-top: 1.5rem; margin-bottom: 1rem;">
-                    <h4 style="color: #f1f5f9; margin-bottom: 0.75rem; display: flex; align-items: center; gap: 0.5rem;">
-                        <span style="font-size: 1.25rem;">📋</span> Query Parameters
-                    </h4>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                col1, col2, col3, col4 = st.columns(4)
-                with col1:
-                    st.markdown(f"""
-                    <div style="background: linear-gradient(135deg, rgba(99, 102, 241, 0.15) 0%, rgba(139, 92, 246, 0.08) 100%); border: 1px solid rgba(99, 102, 241, 0.3); border-radius: 12px; padding: 1rem; text-align: center;">
-                        <div style="font-size: 0.75rem; color: #94a3b8; text-transform: uppercase; letter-spacing: 0.05em; margin-bottom: 0.25rem;">Collection</div>
-                        <div style="font-size: 1.1rem; font-weight: 600; color: #a5b4fc;">{query_obj.get("collection", "N/A")}</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                with col2:
-                    st.markdown(f"""
-                    <div style="background: linear-gradient(135deg, rgba(14, 165, 233, 0.15) 0%, rgba(6, 182, 212, 0.08) 100%); border: 1px solid rgba(14, 165, 233, 0.3); border-radius: 12px; padding: 1rem; text-align: center;">
-                        <div style="font-size: 0.75rem; color: #94a3b8; text-transform: uppercase; letter-spacing: 0.05em; margin-bottom: 0.25rem;">Operation</div>
-                        <div style="font-size: 1.1rem; font-weight: 600; color: #7dd3fc;">{query_obj.get("operation", "N/A")}</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                with col3:
-                    st.markdown(f"""
-                    <div style="background: linear-gradient(135deg, rgba(16, 185, 129, 0.15) 0%, rgba(34, 197, 94, 0.08) 100%); border: 1px solid rgba(16, 185, 129, 0.3); border-radius: 12px; padding: 1rem; text-align: center;">
-                        <div style="font-size: 0.75rem; color: #94a3b8; text-transform: uppercase; letter-spacing: 0.05em; margin-bottom: 0.25rem;">Limit</div>
-                        <div style="font-size: 1.1rem; font-weight: 600; color: #6ee7b7;">{query_obj.get("limit", "N/A")}</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                with col4:
-                    st.markdown(f"""
-                    <div style="background: linear-gradient(135deg, rgba(245, 158, 11, 0.15) 0%, rgba(251, 191, 36, 0.08) 100%); border: 1px solid rgba(245, 158, 11, 0.3); border-radius: 12px; padding: 1rem; text-align: center;">
-                        <div style="font-size: 0.75rem; color: #94a3b8; text-transform: uppercase; letter-spacing: 0.05em; margin-bottom: 0.25rem;">Results</div>
-                        <div style="font-size: 1.1rem; font-weight: 600; color: #fcd34d;">{results.get('count', 0)}</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-            
-            # Tab 2: Query Results
-            with tab2:
-                if results["success"]:
-                    if results["data"]:
-                        df = pd.DataFrame(results["data"])
-                        # Remove internal/metadata columns from display
-                        columns_to_hide = ['_id', '_importedAt', '_source', '_source_collection', 'businessLocationId', 'businessLocationDateCreated', 'customerKey']
-                        df_display = df.drop(columns=[col for col in columns_to_hide if col in df.columns])
-                        
-                        # Results info bar
-                        st.markdown(f"""
-                        <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 1rem; padding: 0.75rem 1rem; background: rgba(30, 41, 59, 0.6); border-radius: 10px; border: 1px solid #334155;">
-                            <div style="display: flex; align-items: center; gap: 1rem;">
-                                <span style="color: #94a3b8; font-size: 0.875rem;">📊 Showing <span style="color: #f1f5f9; font-weight: 600;">{len(df_display)}</span> records</span>
-                                <span style="color: #475569;">|</span>
-                                <span style="color: #94a3b8; font-size: 0.875rem;">📁 <span style="color: #a5b4fc; font-weight: 500;">{len(df_display.columns)}</span> columns</span>
-                            </div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        st.dataframe(df_display, use_container_width=True, height=450)
-                        
-                        # Export section
-                        st.markdown("""
-                        <div style="margin-top: 1.5rem; margin-bottom: 1rem;">
-                            <h4 style="color: #f1f5f9; margin-bottom: 0.75rem; display: flex; align-items: center; gap: 0.5rem;">
-                                <span style="font-size: 1.25rem;">📥</span> Export Data
-                            </h4>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        col_a, col_b, col_c = st.columns([1, 1, 2])
-                        with col_a:
-                            csv = df_display.to_csv(index=False)
-                            st.download_button(
-                                label="📄 Download CSV",
-                                data=csv,
-                                file_name=f"fms_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                                mime="text/csv",
-                                use_container_width=True
-                            )
-                        with col_b:
-                            json_str = df_display.to_json(orient='records', indent=2)
-                            st.download_button(
-                                label="📋 Download JSON",
-                                data=json_str,
-                                file_name=f"fms_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                                mime="application/json",
-                                use_container_width=True
-                            )
-                    else:
-                        st.markdown("""
-                        <div style="text-align: center; padding: 3rem 2rem; background: rgba(30, 41, 59, 0.5); border-radius: 12px; border: 1px dashed #475569;">
-                            <div style="font-size: 3rem; margin-bottom: 1rem;">📭</div>
-                            <div style="font-size: 1.1rem; color: #f1f5f9; font-weight: 500; margin-bottom: 0.5rem;">No Data Found</div>
-                            <div style="font-size: 0.875rem; color: #94a3b8;">The query executed successfully but returned no results.</div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                else:
-                    st.error(f"❌ Query execution failed: {results['error']}")
-            
-            # Tab 3: AI Insights
-            with tab3:
-                if results["success"]:
-                    st.markdown("""
-                    <div style="margin-bottom: 1rem;">
-                        <h4 style="color: #f1f5f9; margin-bottom: 0.5rem; display: flex; align-items: center; gap: 0.5rem;">
-                            <span style="font-size: 1.25rem;">🧠</span> AI Analysis & Insights
-                        </h4>
-                        <p style="color: #94a3b8; font-size: 0.875rem; margin: 0;">Intelligent summary generated by AI based on your query results</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    st.markdown(f"""
-                    <div style="background: linear-gradient(135deg, rgba(99, 102, 241, 0.08) 0%, rgba(139, 92, 246, 0.04) 100%); border: 1px solid rgba(99, 102, 241, 0.2); border-left: 4px solid #6366f1; border-radius: 12px; padding: 1.5rem; color: #f1f5f9; font-size: 1rem; line-height: 1.8;">
-                        {summary}
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    # Quick stats from AI
-                    st.markdown("""
-                    <div style="margin-top: 1.5rem; padding: 1rem; background: rgba(30, 41, 59, 0.5); border-radius: 10px; border: 1px solid #334155;">
-                        <div style="display: flex; align-items: center; gap: 0.5rem; color: #94a3b8; font-size: 0.8rem;">
-                            <span>💡</span>
-                            <span>AI insights are generated based on the query results and may provide additional context and analysis.</span>
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    st.markdown("""
-                    <div style="text-align: center; padding: 3rem 2rem; background: rgba(30, 41, 59, 0.5); border-radius: 12px; border: 1px dashed #475569;">
-                        <div style="font-size: 3rem; margin-bottom: 1rem;">⚠️</div>
-                        <div style="font-size: 1.1rem; color: #f1f5f9; font-weight: 500; margin-bottom: 0.5rem;">Insights Unavailable</div>
-                        <div style="font-size: 0.875rem; color: #94a3b8;">AI insights cannot be generated due to query execution error.</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-    
-    # Footer
-    st.markdown("""
-    <div class="footer">
-        <div class="footer-brand">
-            <span>⚡ FMS Query Engine</span>
-        </div>
-        <div>Powered by OpenAI GPT-4 & Anthropic Claude • MongoDB Backend</div>
-        <div style="margin-top: 0.5rem; font-size: 0.75rem; color: #475
-        569;">
-            © 2025 Enterprise Analytics Suite • Version 2.0
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+            # Keep the result in the session's history so it survives reruns
+            df_display, dtype_report = build_display_frame(results)
+            get_result_history().add(result_id, df_display, {
+                "question": user_question,
+                "query_obj": query_obj,
+                "results": {key: results.get(key) for key in ("success", "count", "error")},
+                "summary": summary,
+                "dtype_report": dtype_report,
+                "created_at": datetime.now(),
+            })
+            st.session_state.active_result_id = result_id
+    
+    # Show the active result from this session's history
+    history = get_result_history()
+    active_result_id = st.session_state.get('active_result_id')
+    if active_result_id and history.get_meta(active_result_id) is not None:
+        show_result_history_picker(history)
+        show_query_result(db, active_result_id, history.get_meta(active_result_id), history.get(active_result_id))
+    
+    # Background full exports keep running (and stay downloadable) across reruns
+    show_export_jobs()
+    
+    show_footer()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+# Shared inputs for the micro-benchmarks (test_hot_helpers.py)
+# Built once per session from the sample responses in data/: the raw rfps
+# records (huge nested proposals), a 10k-row leads result generated from
+# the leads sample's model (generate_synthetic.py) and normalized like loaded
+# records, and deep query filters.
+
+import logging
+import os
+import sys
+
+import pytest
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "data"))
+
+# app.py runs its page setup on import; outside `streamlit run` that only
+# logs "missing ScriptRunContext" warnings
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+from endpoints import ENDPOINTS
+from generate_synthetic import generate_records, learn_endpoint
+from normalize import normalize_records
+from stub_server import load_templates
+
+RESULT_ROWS = 10000
+
+
+def as_results(collection_name, records):
+    """Records as execute_query returns them: normalized, _id as a string"""
+    rows = []
+    for i, record in enumerate(normalize_records(collection_name, records)):
+        rows.append({"_id": f"{i:024x}", **record, "_source": "api"})
+    return rows
+
+
+@pytest.fixture(scope="session")
+def templates():
+    return load_templates()
+
+
+@pytest.fixture(scope="session")
+def collections():
+    """The data collections, as list_data_collections returns them"""
+    return list(dict.fromkeys(endpoint["collection"] for endpoint in ENDPOINTS.values()))
+
+
+@pytest.fixture(scope="session")
+def leads_results(templates):
+    """A 10k-row leads result"""
+    profile = learn_endpoint("leads", templates["leads"][1])
+    return as_results("leads", generate_records(profile, 0, RESULT_ROWS, seed=42))
+
+
+@pytest.fixture(scope="session")
+def rfps_results(templates):
+    """The rfps sample: few records, each with a huge nested proposals tree"""
+    return as_results("rfps", templates["rfps"][1])
+
+
+@pytest.fixture(scope="session")
+def deep_query():
+    """
+    A filter the size of a long multi-condition question: $and of $or
+    branches over string, range and nested $elemMatch conditions, six
+    levels deep.
+    """
+    cities = ["Boston", "Cleveland", "Worcester", "Akron", "Newark", "Dover", "Columbus", "Salem"]
+    statuses = ["Available", "Proposed", "Appointment"]
+    return {
+        "$and": [
+            {"$or": [{"serviceAddressCity": city, "status": status} for city in cities for status in statuses]},
+            {"$or": [
+                {"companyName": f"Company {i}", "contactFirstName": f"Name {i}", "squareFootage": {"$gte": i * 100}}
+                for i in range(50)
+            ]},
+            {"proposals": {"$elemMatch": {
+                "status": "Proposed",
+                "$or": [
+                    {"services": {"$elemMatch": {"name": "Janitorial", "frequency": {"$in": ["Weekly", "Daily"]}}}},
+                    {"services": {"$elemMatch": {"name": "Floor Care", "$nor": [{"frequency": "Monthly"}]}}},
+                ],
+            }}},
+            {"businessLocationDateCreated": {"$gte": "2024-01-01", "$lt": "2025-01-01"}},
+        ]
+    }
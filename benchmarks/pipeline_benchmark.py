@@ -0,0 +1,401 @@
+# End-to-end benchmark of the question pipeline
+# Runs every question of a corpus (questions.json: the sidebar samples and
+# more) through the same steps as the app:
+#
+#   schema    get_database_schema
+#   generate  generate_mongo_query
+#   execute   execute_query
+#   summary   generate_summary
+#   render    build_display_frame + the Arrow serialization st.dataframe does
+#
+# against a MongoDB (MONGODB_URI / MONGODB_DATABASE from config, falling back
+# to a local server - load it with data/upload_to_mongodb.py or, for real
+# volumes, data/generate_synthetic.py). The LLM provider is replaced by a
+# deterministic stub that answers each question with the plan recorded in
+# the corpus and a fixed summary, optionally after a simulated latency, so
+# runs are comparable between versions and need no API keys.
+#
+# Latency is timed on untraced runs (--repeat per question, after --warmup);
+# memory is the Python allocation peak of each stage (tracemalloc), measured
+# on one extra traced run per question. Results are written as JSON to
+# benchmarks/results/; --baseline compares a run with an earlier result and
+# --max-regression fails when a stage's p95 got slower.
+#
+# Usage:
+#   python benchmarks/pipeline_benchmark.py
+#   python benchmarks/pipeline_benchmark.py --repeat 20 --warmup 2 --llm-latency-ms 400
+#   python benchmarks/pipeline_benchmark.py --states MA NH --provider claude
+#   python benchmarks/pipeline_benchmark.py --baseline benchmarks/results/pipeline-20261019-101500.json --max-regression 20
+
+import argparse
+import contextlib
+import json
+import logging
+import math
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from bson import json_util
+from pymongo.errors import PyMongoError
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "data"))
+
+# app.py runs its page setup on import; without `streamlit run` that only
+# logs "missing ScriptRunContext" warnings
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+import app
+from mongo import get_database
+from streamlit.dataframe_util import convert_pandas_df_to_arrow_bytes
+
+QUESTIONS_FILE = os.path.join(BENCHMARK_DIR, "questions.json")
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+STAGES = ("schema", "generate", "execute", "summary", "render")
+PERCENTILES = (50, 95, 99)
+QUERY_PROMPT = "Convert to MongoDB query: "
+
+
+class StubLLM:
+    """
+    Deterministic stand-in for the OpenAI and Anthropic clients.
+
+    Query prompts are answered with the plan recorded for the question,
+    summary prompts with a fixed sentence. Implements the two calls the app
+    makes: client.chat.completions.create (OpenAI) and client.messages.create
+    (Anthropic).
+    """
+
+    def __init__(self, plans, latency_ms=0):
+        self.plans = {question: json_util.dumps(plan) for question, plan in plans.items()}
+        self.latency = latency_ms / 1000
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._openai_create))
+        self.messages = SimpleNamespace(create=self._anthropic_create)
+
+    def __call__(self, **kwargs):
+        # Stands in for the client classes: OpenAI(api_key=...) etc.
+        return self
+
+    def answer(self, messages):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = messages[-1]["content"]
+        if QUERY_PROMPT in prompt:
+            question = prompt.rsplit(QUERY_PROMPT, 1)[1].strip()
+            return self.plans.get(question, json.dumps({"error": f"no plan recorded for {question!r}"}))
+        count = next((line.split(":", 1)[1].strip() for line in prompt.splitlines() if line.startswith("Records found:")), "?")
+        return f"The query returned {count} records. This is a fixed summary from the benchmark's LLM stub."
+
+    def _openai_create(self, messages, **kwargs):
+        message = SimpleNamespace(content=self.answer(messages))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    def _anthropic_create(self, messages, **kwargs):
+        return SimpleNamespace(content=[SimpleNamespace(text=self.answer(messages))])
+
+
+def install_stub(stub):
+    """Route the app's OpenAI and Anthropic clients to the stub"""
+    app.OpenAI = stub
+    app.anthropic = SimpleNamespace(Anthropic=stub)
+
+
+def load_corpus(path):
+    """The benchmark questions: list of {"question", "plan"} entries"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def render(results):
+    """What the app does to show a result: display frame and Arrow bytes"""
+    df, _ = app.build_display_frame(results)
+    if df is None:
+        return 0
+    return len(convert_pandas_df_to_arrow_bytes(df))
+
+
+def run_pipeline(db, question, provider, user_filters, trace_memory=False):
+    """
+    One question through all stages.
+
+    Returns:
+        dict with seconds (per stage), memory (per stage peak bytes, only
+        with trace_memory), collection, operation, records, rendered bytes
+        and error (None if the question went through)
+    """
+    seconds = {}
+    memory = {}
+
+    def stage(name, fn):
+        if trace_memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        value = fn()
+        seconds[name] = time.perf_counter() - start
+        if trace_memory:
+            memory[name] = tracemalloc.get_traced_memory()[1] - base
+        return value
+
+    # execute_query prints its record count
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        schema = stage("schema", lambda: app.get_database_schema(db))
+        query_obj = stage("generate", lambda: app.generate_mongo_query(question, schema, provider))
+        if "error" in query_obj:
+            return {"seconds": seconds, "memory": memory, "error": query_obj["error"]}
+        results = stage("execute", lambda: app.execute_query(db, query_obj, user_filters))
+        if not results.get("success"):
+            return {"seconds": seconds, "memory": memory, "error": results.get("error")}
+        stage("summary", lambda: app.generate_summary(question, query_obj, results, provider))
+        rendered = stage("render", lambda: render(results))
+
+    return {
+        "seconds": seconds,
+        "memory": memory,
+        "collection": query_obj.get("collection"),
+        "operation": query_obj.get("operation", "find"),
+        "records": results["count"],
+        "rendered_bytes": rendered,
+        "error": None,
+    }
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples):
+    """p50/p95/p99, mean and max of a list of seconds"""
+    if not samples:
+        return None
+    stats = {f"p{p}": percentile(samples, p) for p in PERCENTILES}
+    stats.update(mean=statistics.fmean(samples), max=max(samples), samples=len(samples))
+    return stats
+
+
+def benchmark(db, corpus, provider, user_filters, repeat, warmup, trace_memory):
+    """
+    Run the corpus and collect per-stage and per-question statistics.
+
+    Returns:
+        (per-stage stats, per-question results)
+    """
+    stage_seconds = {name: [] for name in STAGES}
+    stage_memory = {name: [] for name in STAGES}
+    questions = []
+    for i, entry in enumerate(corpus, 1):
+        question = entry["question"]
+        print(f"▶️ [{i}/{len(corpus)}] {question}")
+        for _ in range(warmup):
+            run_pipeline(db, question, provider, user_filters)
+        runs = [run_pipeline(db, question, provider, user_filters) for _ in range(repeat)]
+        last = runs[-1]
+        if trace_memory:
+            tracemalloc.start()
+            try:
+                traced = run_pipeline(db, question, provider, user_filters, trace_memory=True)
+            finally:
+                tracemalloc.stop()
+            for name, peak in traced["memory"].items():
+                stage_memory[name].append(peak)
+            last["memory"] = traced["memory"]
+        if last["error"]:
+            print(f"   ❌ {last['error']}")
+        for run in runs:
+            for name, value in run["seconds"].items():
+                stage_seconds[name].append(value)
+        totals = [sum(run["seconds"].values()) for run in runs]
+        questions.append({
+            "question": question,
+            "collection": last.get("collection"),
+            "operation": last.get("operation"),
+            "records": last.get("records"),
+            "rendered_bytes": last.get("rendered_bytes"),
+            "error": last["error"],
+            "total": summarize(totals),
+            "stages": {name: summarize([run["seconds"][name] for run in runs if name in run["seconds"]]) for name in STAGES},
+            "memory": last["memory"],
+        })
+
+    stages = {}
+    for name in STAGES:
+        stats = summarize(stage_seconds[name])
+        if stats is None:
+            continue
+        if stage_memory[name]:
+            stats["memory_p50"] = percentile(stage_memory[name], 50)
+            stats["memory_max"] = max(stage_memory[name])
+        stages[name] = stats
+    return stages, questions
+
+
+def format_ms(seconds):
+    return f"{seconds * 1000:.1f}"
+
+
+def format_bytes(num_bytes):
+    for unit in ("B", "KB", "MB"):
+        if num_bytes < 1024:
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GB"
+
+
+def print_report(stages, questions):
+    """Print the per-stage and per-question tables"""
+    print("\n" + "=" * 96)
+    print("📊 Pipeline benchmark (ms)")
+    print("=" * 96)
+    print(f"{'Stage':<12}{'p50':>10}{'p95':>10}{'p99':>10}{'Mean':>10}{'Max':>10}{'Samples':>9}{'Mem p50':>12}{'Mem max':>12}")
+    print("-" * 96)
+    for name, stats in stages.items():
+        memory = ""
+        if "memory_p50" in stats:
+            memory = f"{format_bytes(stats['memory_p50']):>12}{format_bytes(stats['memory_max']):>12}"
+        print(
+            f"{name:<12}{format_ms(stats['p50']):>10}{format_ms(stats['p95']):>10}{format_ms(stats['p99']):>10}"
+            f"{format_ms(stats['mean']):>10}{format_ms(stats['max']):>10}{stats['samples']:>9}{memory}"
+        )
+    print("-" * 96)
+    print(f"\n{'Question':<58}{'Records':>10}{'Total p50':>12}{'Total p95':>12}")
+    print("-" * 92)
+    for q in questions:
+        label = q["question"] if len(q["question"]) <= 56 else q["question"][:53] + "..."
+        records = "error" if q["error"] else q["records"]
+        print(f"{label:<58}{records:>10}{format_ms(q['total']['p50']):>12}{format_ms(q['total']['p95']):>12}")
+    failed = [q for q in questions if q["error"]]
+    if failed:
+        print(f"\n❌ {len(failed)} question(s) failed")
+
+
+def compare(stages, baseline, max_regression=None, floor_ms=1.0):
+    """
+    Print the change of each stage's p50/p95 against a baseline result.
+
+    A stage regresses when its p95 is more than max_regression percent (and
+    more than floor_ms, so sub-millisecond noise doesn't count) slower.
+
+    Returns:
+        list of regressed stage names
+    """
+    print(f"\n📐 Against baseline {baseline.get('version') or '?'} ({baseline.get('createdAt', '?')})")
+    print(f"{'Stage':<12}{'p50':>12}{'Δ p50':>10}{'p95':>12}{'Δ p95':>10}")
+    regressed = []
+    for name, stats in stages.items():
+        before = baseline.get("stages", {}).get(name)
+        if not before:
+            continue
+        deltas = {}
+        for key in ("p50", "p95"):
+            deltas[key] = (stats[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+        slower = (
+            max_regression is not None
+            and deltas["p95"] > max_regression
+            and (stats["p95"] - before["p95"]) * 1000 > floor_ms
+        )
+        if slower:
+            regressed.append(name)
+        print(
+            f"{name:<12}{format_ms(stats['p50']):>12}{deltas['p50']:>+9.1f}%"
+            f"{format_ms(stats['p95']):>12}{deltas['p95']:>+9.1f}%{'  ❌' if slower else ''}"
+        )
+    return regressed
+
+
+def git_version():
+    """Short commit hash of the working tree (None outside a git checkout)"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the question pipeline with a deterministic LLM stub")
+    parser.add_argument("--questions", default=QUESTIONS_FILE, help="Question corpus (JSON)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per question")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per question first")
+    parser.add_argument("--provider", choices=("openai", "claude"), default="openai", help="Client API the stub answers through")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="Simulated latency of each LLM call")
+    parser.add_argument("--states", nargs="+", help="Franchise states the queries are limited to")
+    parser.add_argument("--tenants", nargs="+", help="Tenant keys the queries are limited to (MULTI_TENANT)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced run measuring memory")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/pipeline-<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier result file to compare with")
+    parser.add_argument("--max-regression", type=float, metavar="PCT", help="Fail when a stage's p95 is this many percent slower than the baseline")
+    args = parser.parse_args(argv)
+
+    if args.max_regression is not None and not args.baseline:
+        parser.error("--max-regression needs --baseline")
+    corpus = load_corpus(args.questions)
+    install_stub(StubLLM({entry["question"]: entry["plan"] for entry in corpus}, args.llm_latency_ms))
+
+    try:
+        db = get_database()
+        db.client.admin.command("ping")
+        print("✅ Connected to MongoDB successfully!")
+    except PyMongoError as e:
+        print(f"❌ Failed to connect to MongoDB: {e}")
+        return 1
+    collections = app.list_data_collections(db)
+    if not collections:
+        print(f"❌ Database {db.name} has no data collections - load the samples or synthetic data first")
+        return 1
+
+    stages, questions = benchmark(
+        db, corpus, args.provider, (args.states, args.tenants), args.repeat, args.warmup, not args.no_memory
+    )
+    print_report(stages, questions)
+
+    created = datetime.now(timezone.utc)
+    result = {
+        "createdAt": created.isoformat(),
+        "version": git_version(),
+        "database": {
+            "name": db.name,
+            "collections": {name: db[name].estimated_document_count() for name in collections},
+        },
+        "settings": {
+            "questions": args.questions,
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+            "provider": args.provider,
+            "llm_latency_ms": args.llm_latency_ms,
+            "states": args.states,
+            "tenants": args.tenants,
+            "python": sys.version.split()[0],
+        },
+        "stages": stages,
+        "questions": questions,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"pipeline-{created:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"💾 Results written to {output}")
+
+    status = 0 if not any(q["error"] for q in questions) else 1
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressed = compare(stages, json.load(f), args.max_regression)
+        if regressed:
+            print(f"❌ Slower than the baseline: {', '.join(regressed)}")
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,121 @@
+# Micro-benchmarks for the pure-Python helpers every question runs through
+# The regression gate is relative: save a baseline on the machine that runs
+# the gate, then compare later runs against it and fail on a slower median.
+# The microsecond-scale helpers vary too much between machines for absolute
+# limits; only the millisecond-scale frame benchmarks also have a loose
+# absolute ceiling (THRESHOLDS, about 10x the medians on a development
+# machine - scale it for slower runners with BENCHMARK_THRESHOLD_SCALE).
+#
+# Usage (pip install -r benchmarks/requirements.txt):
+#   pytest benchmarks/ --benchmark-autosave                      # baseline, saved to .benchmarks/
+#   pytest benchmarks/ --benchmark-compare --benchmark-compare-fail=median:15%
+#   pytest benchmarks/ -k truncate --benchmark-columns=min,median,max,rounds
+#   BENCHMARK_THRESHOLD_SCALE=3 pytest benchmarks/
+
+import os
+
+import pytest
+
+import app
+from exports import frame_to_arrow
+
+THRESHOLD_SCALE = float(os.getenv("BENCHMARK_THRESHOLD_SCALE", "1"))
+
+# Loose median ceilings in milliseconds (millisecond-scale benchmarks only)
+THRESHOLDS = {
+    "build_display_frame/leads_10k": 1500.0,
+    "build_display_frame/rfps": 250.0,
+    "frame_to_arrow/leads_10k": 200.0,
+    "frame_to_arrow/rfps": 400.0,
+}
+
+ALL_FRANCHISE_STATES = sorted({state for states in app.FRANCHISE_STATE_MAPPING.values() for state in states})
+
+
+def run(benchmark, name, fn, *args, **kwargs):
+    """Benchmark fn(*args, **kwargs) and fail if its median is over its ceiling (if it has one)"""
+    benchmark.group = name.split("/")[0]
+    benchmark.name = name
+    result = benchmark(fn, *args, **kwargs)
+    if not benchmark.disabled and name in THRESHOLDS:
+        median_ms = benchmark.stats.stats.median * 1000
+        limit_ms = THRESHOLDS[name] * THRESHOLD_SCALE
+        assert median_ms <= limit_ms, f"{name}: median {median_ms:.4f} ms is over the {limit_ms:.4f} ms threshold"
+    return result
+
+
+def test_make_case_insensitive_simple(benchmark):
+    query = {"serviceAddressState": "MA", "status": "Available"}
+    result = run(benchmark, "make_case_insensitive/simple", app.make_case_insensitive, query)
+    assert result["status"] == {"$regex": "Available", "$options": "i"}
+
+
+def test_make_case_insensitive_deep(benchmark, deep_query):
+    result = run(benchmark, "make_case_insensitive/deep", app.make_case_insensitive, deep_query)
+    assert result["$and"][0]["$or"][0]["serviceAddressCity"]["$options"] == "i"
+
+
+def test_truncate_data_for_summary_leads(benchmark, leads_results):
+    result = run(benchmark, "truncate_data_for_summary/leads_10k", app.truncate_data_for_summary, leads_results)
+    assert len(result) <= 8000 + len("\n... (data truncated for brevity)")
+
+
+def test_truncate_data_for_summary_rfps(benchmark, rfps_results):
+    result = run(benchmark, "truncate_data_for_summary/rfps", app.truncate_data_for_summary, rfps_results)
+    assert result.startswith("[")
+
+
+@pytest.mark.parametrize("case, name, expected", [
+    ("exact", "GeneralLedger", "GeneralLedger"),
+    ("partial", "ledger", "GeneralLedger"),
+    ("unknown", "work_orders", "work_orders"),
+])
+def test_normalize_collection_name(benchmark, collections, case, name, expected):
+    result = run(benchmark, f"normalize_collection_name/{case}", app.normalize_collection_name, name, collections)
+    assert result == expected
+
+
+@pytest.mark.parametrize("case, name, expected", [
+    ("exact", "leads", "serviceAddressState"),
+    ("partial", "customers_active", "serviceAddressState"),
+    ("unknown", "work_orders", "serviceAddressState"),
+])
+def test_get_state_field_for_collection(benchmark, case, name, expected):
+    result = run(benchmark, f"get_state_field_for_collection/{case}", app.get_state_field_for_collection, name)
+    assert result == expected
+
+
+def test_apply_franchise_filter_one_state(benchmark):
+    query = {"status": {"$regex": "Available", "$options": "i"}}
+    result = run(benchmark, "apply_franchise_filter_to_query/one_state", app.apply_franchise_filter_to_query, query, ["MA"], "leads")
+    assert result["$and"][0] is query
+
+
+def test_apply_franchise_filter_all_states(benchmark, deep_query):
+    result = run(
+        benchmark, "apply_franchise_filter_to_query/all_states",
+        app.apply_franchise_filter_to_query, deep_query, ALL_FRANCHISE_STATES, "serviceproviders",
+    )
+    assert len(result["$and"][1]["$or"]) == len(ALL_FRANCHISE_STATES)
+
+
+def test_build_display_frame_leads(benchmark, leads_results):
+    df, _ = run(benchmark, "build_display_frame/leads_10k", app.build_display_frame, {"success": True, "data": leads_results})
+    assert len(df) == len(leads_results)
+
+
+def test_build_display_frame_rfps(benchmark, rfps_results):
+    df, _ = run(benchmark, "build_display_frame/rfps", app.build_display_frame, {"success": True, "data": rfps_results})
+    assert len(df) == len(rfps_results)
+
+
+def test_frame_to_arrow_leads(benchmark, leads_results):
+    df, _ = app.build_display_frame({"success": True, "data": leads_results})
+    table = run(benchmark, "frame_to_arrow/leads_10k", frame_to_arrow, df)
+    assert table.num_rows == len(df)
+
+
+def test_frame_to_arrow_rfps(benchmark, rfps_results):
+    df, _ = app.build_display_frame({"success": True, "data": rfps_results})
+    table = run(benchmark, "frame_to_arrow/rfps", frame_to_arrow, df)
+    assert table.num_rows == len(df)
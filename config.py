@@ -2,6 +2,8 @@
 # Loads sensitive data from environment variables
 
 import os
+import json
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -15,6 +17,41 @@ ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 MONGODB_URI = os.getenv("MONGODB_URI")
 MONGODB_DATABASE = os.getenv("MONGODB_DATABASE", "FMS")
 
+# FSM API (source system for the data/ ingestion scripts)
+FSM_API_BASE_URL = os.getenv("FSM_API_BASE_URL", "https://fsmapi.s4servicesync.com")
+FSM_AUTH_TOKEN = os.getenv("FSM_AUTH_TOKEN")  # AUTH-TOKEN cookie from a logged-in FSM session
+FSM_TENANT = os.getenv("FSM_TENANT", "Boston Train-TAX")
+FSM_POOL_SIZE = int(os.getenv("FSM_POOL_SIZE", "10"))  # Pooled keep-alive connections (cap per host)
+FSM_REQUEST_TIMEOUT = int(os.getenv("FSM_REQUEST_TIMEOUT", "60"))  # Seconds
+FSM_PAGE_SIZE = int(os.getenv("FSM_PAGE_SIZE", "500"))  # Records per page for paged grid endpoints
+FSM_PAGE_WORKERS = int(os.getenv("FSM_PAGE_WORKERS", "4"))  # Pages fetched concurrently per endpoint
+FSM_MAX_RPS = float(os.getenv("FSM_MAX_RPS", "5"))  # Requests per second across all threads (0 = no limit)
+FSM_MAX_RETRIES = int(os.getenv("FSM_MAX_RETRIES", "4"))  # Retries on 429/5xx and connection errors
+FSM_BACKOFF_SECONDS = float(os.getenv("FSM_BACKOFF_SECONDS", "1"))  # First retry delay, doubled each attempt
+FSM_INGEST_WORKERS = int(os.getenv("FSM_INGEST_WORKERS", "4"))  # Endpoints fetched concurrently by ingest.py
+FSM_FULL_SYNC_HOURS = int(os.getenv("FSM_FULL_SYNC_HOURS", "168"))  # Full reconcile interval for incremental endpoints
+FSM_LEDGER_WORKERS = int(os.getenv("FSM_LEDGER_WORKERS", "4"))  # Ledger date-range chunks fetched concurrently (backfill)
+FSM_LEDGER_CHUNK_MAX_ROWS = int(os.getenv("FSM_LEDGER_CHUNK_MAX_ROWS", "20000"))  # Larger chunks are split and refetched
+FSM_LEDGER_CHUNK_MAX_MB = float(os.getenv("FSM_LEDGER_CHUNK_MAX_MB", "50"))  # Same, by response size
+
+# Tenants (franchises) to ingest, as a JSON list in FSM_TENANTS:
+#   [{"key": "boston", "tenant": "Boston Train-TAX", "authToken": "...", "franchise": "Boston"}, ...]
+#   key       - tenant key stored on every document (default: tenant)
+#   tenant    - x-tenant header sent to the API
+#   authToken - AUTH-TOKEN cookie for this tenant (default: FSM_AUTH_TOKEN)
+#   franchise - app users' franchise (see FRANCHISE_STATE_MAPPING in app.py)
+#               whose queries are limited to this tenant
+# Without FSM_TENANTS only FSM_TENANT is ingested.
+FSM_TENANTS = [
+    dict({"key": t["tenant"], "authToken": FSM_AUTH_TOKEN, "franchise": None}, **t)
+    for t in json.loads(os.getenv("FSM_TENANTS") or "[]")
+] or [{"key": FSM_TENANT, "tenant": FSM_TENANT, "authToken": FSM_AUTH_TOKEN, "franchise": None}]
+# Tenant-partitioned storage: every document carries its tenant key in
+# TENANT_FIELD, which leads the natural keys and indexes (on by default with
+# more than one tenant)
+MULTI_TENANT = os.getenv("MULTI_TENANT", str(len(FSM_TENANTS) > 1)).lower() == "true"
+TENANT_FIELD = "_tenant"
+
 # Available Collections (populated from your data)
 COLLECTIONS = [
     "leads",
@@ -29,5 +66,103 @@ COLLECTIONS = [
     "spusers",
     "inspection_dashboard",
     "UsersInspection",
-    "GeneralLedger"
+    "GeneralLedger",
+    # Reference collections (see REFERENCE_FIELDS)
+    "accounts",
+    "ledger_serviceproviders",
+    "ledger_customers",
+    "invoices",
+    "rfp_proposals",
 ]
+
+# Natural key of each collection's documents (dotted paths for nested fields).
+# Uploads upsert on these fields, so reloading the same records is idempotent.
+# General ledger rows share transactionId across the lines of a transaction,
+# so a ledger line is identified by its transaction plus the accounts it
+# posts to - not its amount, so a corrected amount updates the line instead
+# of adding a second one.
+NATURAL_KEYS = {
+    "leads": ["businessLocationId"],
+    "proposals": ["proposalId"],
+    "ServiceContracts": ["serviceAgreementId", "_recordSet"],
+    "rfps": ["id"],
+    "customers_activation": ["customerKey"],
+    "customers_active": ["customerKey"],
+    "customers_suspended": ["customerKey"],
+    "customers_terminated": ["customerKey"],
+    "serviceproviders": ["id"],
+    "spusers": ["id"],
+    "inspection_dashboard": ["period"],
+    "UsersInspection": ["id", "_role"],
+    "GeneralLedger": ["transactionType", "transactionId", "refNum", "creditAccount.id", "debitAccount.id"],
+    "accounts": ["id"],
+    "ledger_serviceproviders": ["id"],
+    "ledger_customers": ["id"],
+    "invoices": ["id"],
+    "rfp_proposals": ["id"],
+}
+
+# Entities embedded in every row that the loader can move into reference
+# collections keyed by id (field -> reference collection). Rows keep only
+# {"id": ...}; the app joins the entity back with $lookup when needed.
+# The API's serviceproviders and proposals endpoints return summaries with
+# other keys, so the full embedded entities get collections of their own.
+REFERENCE_FIELDS = {
+    "GeneralLedger": {
+        "serviceProvider": "ledger_serviceproviders",
+        "creditAccount": "accounts",
+        "debitAccount": "accounts",
+        "customer": "ledger_customers",
+        "invoice": "invoices",
+    },
+    "rfps": {"proposal": "rfp_proposals"},
+}
+EXTRACT_REFERENCES = os.getenv("EXTRACT_REFERENCES", "false").lower() == "true"  # Default for upload_to_mongodb.py --extract-references
+
+# Collections stored as MongoDB time-series collections. Loads replace the
+# date range they cover (rangeParams of the fetch request, else the rows' own
+# range) instead of upserting, deleting by the time field - which needs
+# MongoDB 7.0+ (5.x/6.x only delete on the metaField). Against older servers
+# these collections use the regular layout (see index_specs.check_timeseries_support). metaFields are copied into the metaField
+# subdocument, which MongoDB uses to group documents into buckets.
+USE_TIMESERIES = os.getenv("USE_TIMESERIES", "true").lower() == "true"
+TIMESERIES_COLLECTIONS = {
+    "GeneralLedger": {
+        "timeField": "transactionDate",
+        "metaField": "ledger",
+        "metaFields": {
+            "transactionType": "transactionType",
+            "creditAccountId": "creditAccount.id",
+            "debitAccountId": "debitAccount.id",
+        },
+        "granularity": "hours",
+        "rangeParams": ["startDate", "endDate"],
+    },
+}
+
+# Create missing indexes (index_specs.py) in the background when the app starts
+ENSURE_INDEXES_ON_STARTUP = os.getenv("ENSURE_INDEXES_ON_STARTUP", "true").lower() == "true"
+
+# MongoDB upload settings (data/upload_to_mongodb.py)
+CACHE_VERSIONS_COLLECTION = "_cache_versions"  # Per-collection data versions, bumped on every change (app cache keys)
+RUNS_COLLECTION = "_ingest_runs"  # Run journal: one document per ingestion/upload/backfill run
+RUN_UNITS_COLLECTION = "_ingest_run_units"  # Completed/failed units (endpoint, chunk) of each run
+DEAD_LETTERS_COLLECTION = "_dead_letters"  # Records that failed to load, with the error
+RUN_JOURNAL_TTL_DAYS = int(os.getenv("RUN_JOURNAL_TTL_DAYS", "30"))  # Journal entries expire after this
+DEAD_LETTER_TTL_DAYS = int(os.getenv("DEAD_LETTER_TTL_DAYS", "30"))  # Unretried dead letters expire after this
+FULL_REFRESH_MIN_RATIO = float(os.getenv("FULL_REFRESH_MIN_RATIO", "0.5"))  # Reject reloads shrinking a collection below this share
+NORMALIZE_KEEP_ORIGINALS = os.getenv("NORMALIZE_KEEP_ORIGINALS", "false").lower() == "true"  # Keep pre-conversion values under _original
+UPLOAD_BATCH_SIZE = int(os.getenv("UPLOAD_BATCH_SIZE", "1000"))  # Operations per bulk_write
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))  # Collections written concurrently
+MONGODB_POOL_SIZE = int(os.getenv("MONGODB_POOL_SIZE", "20"))  # Max connections of the data/ scripts' client
+
+# Full-result export settings (streamed to disk in the background)
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "fms_exports"))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+EXPORT_MAX_AGE_HOURS = int(os.getenv("EXPORT_MAX_AGE_HOURS", "24"))
+
+# Session result history (older results spill to compressed files on disk)
+RESULT_HISTORY_SESSION_MB = int(os.getenv("RESULT_HISTORY_SESSION_MB", "64"))
+RESULT_HISTORY_PROCESS_MB = int(os.getenv("RESULT_HISTORY_PROCESS_MB", "512"))
+RESULT_HISTORY_MAX_ENTRIES = int(os.getenv("RESULT_HISTORY_MAX_ENTRIES", "20"))
+RESULT_SPILL_DIR = os.getenv("RESULT_SPILL_DIR", os.path.join(tempfile.gettempdir(), "fms_result_spill"))
@@ -0,0 +1,375 @@
+# General ledger backfill over an arbitrary date range
+# The ledger report endpoint takes a startDate/endDate range and returns the
+# whole range in one response, which is infeasible for multi-year ranges.
+# The range is split into month chunks that are fetched concurrently (sharing
+# the fetch engine's session, rate limiter and retries). A chunk that comes
+# back too large (FSM_LEDGER_CHUNK_MAX_ROWS / FSM_LEDGER_CHUNK_MAX_MB) or
+# times out is split in half and fetched again, down to single days.
+#
+# Completed chunks are kept under .pages/general_ledger_backfill/ so an
+# interrupted backfill resumes. With --upload each chunk is loaded into
+# MongoDB as soon as it lands (replacing its date range, see
+# upload_to_mongodb.replace_time_range). The chunks are also merged into the
+# regular landing file, general_ledger.ndjson.gz.
+# Loaded chunks are recorded in the run journal (see run_journal.py), so
+# --resume does not load the chunks an interrupted run already loaded again.
+# Rows that fail to load are dead-lettered.
+#
+# With config.MULTI_TENANT each tenant (config.FSM_TENANTS, or --tenants) is
+# backfilled in turn with its own credentials, landing files and chunks.
+#
+# Usage:
+#   python backfill_general_ledger.py --start 1/1/2019 --end 12/31/2023
+#   python backfill_general_ledger.py --start 2022-01-01 --end 2022-12-31 --upload
+#   python backfill_general_ledger.py --start 1/1/2020 --end 12/31/2020 --workers 8 --extract-references
+#   python backfill_general_ledger.py --start 1/1/2019 --end 12/31/2023 --upload --resume
+
+import os
+import argparse
+import json
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta, timezone
+
+import ijson
+import requests
+from pymongo.errors import PyMongoError
+
+from fetch_engine import (
+    DATA_DIR, PAGES_DIR, _write_json, build_request, config, fetch_to_file, landing_paths, read_ndjson, tenant_dir,
+)
+from endpoints import ENDPOINTS
+from mongo import bump_cache_version, get_database
+from normalize import normalize_records
+from run_journal import open_journal
+from index_specs import ensure_collection_indexes, is_timeseries_layout, natural_key_fields
+from upload_to_mongodb import (
+    ensure_timeseries_collection, extract_references, replace_time_range, report_index_failures, upsert_records,
+)
+
+ENDPOINT = "general_ledger"
+
+
+def parse_day(value):
+    """Parse a command-line date ("12/1/2021" or "2021-12-01")"""
+    for fmt in ("%m/%d/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"invalid date: {value} (use MM/DD/YYYY or YYYY-MM-DD)")
+
+
+def format_param(day):
+    """Date in the report endpoint's parameter format (12/1/2021)"""
+    return f"{day.month}/{day.day}/{day.year}"
+
+
+def month_chunks(start, end):
+    """Split [start, end] (inclusive dates) into calendar-month ranges"""
+    chunks = []
+    first = start
+    while first <= end:
+        next_month = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+        last = min(end, next_month - timedelta(days=1))
+        chunks.append((first, last))
+        first = last + timedelta(days=1)
+    return chunks
+
+
+def split_chunk(chunk):
+    """Halve a date range (None for a single day)"""
+    start, end = chunk
+    if start == end:
+        return None
+    middle = start + timedelta(days=(end - start).days // 2)
+    return [(start, middle), (middle + timedelta(days=1), end)]
+
+
+def chunk_name(chunk):
+    return f"chunk_{chunk[0]:%Y%m%d}_{chunk[1]:%Y%m%d}"
+
+
+def fetch_chunk(chunk, state_dir, stats=None, tenant=None):
+    """
+    Fetch one date range of the ledger into its own chunk file.
+
+    Returns:
+        dict with start, end, records, bytes and meta, or None if the chunk
+        is too large (or timed out) and should be split
+    """
+    endpoint = ENDPOINTS[ENDPOINT]
+    params = dict(endpoint.get("params") or {}, startDate=format_param(chunk[0]), endDate=format_param(chunk[1]))
+    path = os.path.join(state_dir, chunk_name(chunk) + ".ndjson.gz")
+    chunk_stats = {}
+    try:
+        result = fetch_to_file(build_request(endpoint, params=params, tenant=tenant), endpoint["records"], path, chunk_stats)
+    except (requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError):
+        if split_chunk(chunk) is None:
+            raise
+        return None
+    finally:
+        if stats is not None:
+            for key in ("requests", "retries", "bytes"):
+                stats[key] = stats.get(key, 0) + chunk_stats.get(key, 0)
+
+    too_large = (
+        result["records"] > config.FSM_LEDGER_CHUNK_MAX_ROWS
+        or chunk_stats.get("bytes", 0) > config.FSM_LEDGER_CHUNK_MAX_MB * 1024 * 1024
+    )
+    if too_large and split_chunk(chunk) is not None:
+        os.remove(path)
+        return None
+    summary = {
+        "start": chunk[0].isoformat(),
+        "end": chunk[1].isoformat(),
+        "records": result["records"],
+        "bytes": chunk_stats.get("bytes", 0),
+        "meta": result["meta"],
+    }
+    _write_json(os.path.join(state_dir, chunk_name(chunk) + ".json"), summary)
+    return summary
+
+
+def load_saved_chunks(state_dir):
+    """Chunks completed by an earlier run: {(start, end): summary}"""
+    chunks = {}
+    if not os.path.isdir(state_dir):
+        return chunks
+    for file_name in os.listdir(state_dir):
+        if not (file_name.startswith("chunk_") and file_name.endswith(".json")):
+            continue
+        if not os.path.exists(os.path.join(state_dir, file_name[:-5] + ".ndjson.gz")):
+            continue
+        try:
+            with open(os.path.join(state_dir, file_name), encoding="utf-8") as f:
+                summary = json.load(f)
+            chunks[(date.fromisoformat(summary["start"]), date.fromisoformat(summary["end"]))] = summary
+        except (OSError, ValueError, KeyError):
+            continue
+    return chunks
+
+
+def chunk_unit(chunk, tenant=None):
+    """Run journal unit of a chunk load"""
+    return f"ledger/{tenant['key'] if tenant is not None else '-'}/{chunk_name(chunk)}"
+
+
+def upload_chunk(db, path, chunk, batch_size=None, extract=False, tenant=None, journal=None):
+    """
+    Load one chunk file into the GeneralLedger collection.
+    Time-series layout: the chunk's date range is replaced (for the tenant).
+    Otherwise the rows are upserted on their natural key. With a journal the
+    load is recorded and rows that fail are dead-lettered.
+    """
+    collection_name = ENDPOINTS[ENDPOINT]["collection"]
+    tenant_key = tenant["key"] if tenant is not None else None
+    records = normalize_records(collection_name, read_ndjson(path))
+    if tenant_key is not None:
+        records = (dict(record, **{config.TENANT_FIELD: tenant_key}) for record in records)
+    if extract:
+        records = extract_references(db, collection_name, records, batch_size)
+    on_error = None
+    if journal:
+        def on_error(record, error):
+            journal.dead_letter(collection_name, record, error, tenant_key)
+
+    if is_timeseries_layout(collection_name):
+        time_range = (datetime.combine(chunk[0], datetime.min.time()), datetime.combine(chunk[1], datetime.min.time()))
+        counts = replace_time_range(db, collection_name, records, time_range, batch_size, tenant_key, on_error)
+    else:
+        counts = upsert_records(db[collection_name], records, natural_key_fields(collection_name), batch_size, on_error)
+    if counts["inserted"] or counts["updated"] or counts.get("deleted"):
+        bump_cache_version(db, collection_name)
+    if journal:
+        journal.complete(chunk_unit(chunk, tenant), **{k: counts.get(k, 0) for k in ("records", "inserted", "errors")})
+    return counts
+
+
+def backfill(
+    start, end, workers=None, output_dir=DATA_DIR, resume_dir=PAGES_DIR, db=None, extract=False, stats=None, tenant=None,
+    journal=None,
+):
+    """
+    Fetch the ledger for [start, end] in concurrent month chunks.
+
+    Chunks that are too large are split and fetched again (adaptive
+    granularity). Each completed chunk is loaded into MongoDB right away
+    when db is given. The chunks are merged, in date order, into the
+    endpoint's landing file, whose .meta.json records the whole range.
+
+    Args:
+        start, end: First and last day (datetime.date)
+        workers: Chunks fetched at once (default config.FSM_LEDGER_WORKERS)
+        output_dir: Directory for the landing files
+        resume_dir: Directory for completed chunks
+        db: MongoDB database to load chunks into (None: fetch only)
+        extract: Move embedded entities into reference collections while loading
+        stats: Optional dict accumulating requests, retries, bytes, splits and
+            per-load counts ("loaded", "load_errors")
+        tenant: Optional entry from config.FSM_TENANTS to backfill (landing
+            files and chunks go to its own subdirectories)
+        journal: Run journal (see run_journal.RunJournal) - saved chunks it
+            has as loaded are not loaded again
+
+    Returns:
+        List of chunk summaries in date order
+    """
+    workers = workers or config.FSM_LEDGER_WORKERS
+    stats = stats if stats is not None else {}
+    state_dir = os.path.join(tenant_dir(resume_dir, tenant), ENDPOINT + "_backfill")
+    output_dir = tenant_dir(output_dir, tenant)
+    os.makedirs(state_dir, exist_ok=True)
+
+    done = {chunk: summary for chunk, summary in load_saved_chunks(state_dir).items() if start <= chunk[0] and chunk[1] <= end}
+    # A saved chunk covers a planned month, or part of one that was split earlier
+    todo = []
+    for chunk in month_chunks(start, end):
+        covered = [c for c in done if chunk[0] <= c[0] and c[1] <= chunk[1]]
+        if sum((c[1] - c[0]).days + 1 for c in covered) < (chunk[1] - chunk[0]).days + 1:
+            for c in covered:
+                del done[c]
+            todo.append(chunk)
+    print(f"🗓️ {'[' + tenant['key'] + '] ' if tenant is not None else ''}{format_param(start)} - {format_param(end)}: {len(todo)} chunk(s) to fetch, {len(done)} already fetched")
+
+    collection_name = ENDPOINTS[ENDPOINT]["collection"]
+    if db is not None:
+        if is_timeseries_layout(collection_name):
+            ensure_timeseries_collection(db, collection_name)
+        report_index_failures(ensure_collection_indexes(db[collection_name]))
+        # Chunks fetched by an earlier run may not have been loaded yet
+        for chunk in sorted(done):
+            if journal and journal.is_done(chunk_unit(chunk, tenant)):
+                continue
+            path = os.path.join(state_dir, chunk_name(chunk) + ".ndjson.gz")
+            upload_chunk(db, path, chunk, extract=extract, tenant=tenant, journal=journal)
+
+    def run(chunk):
+        summary = fetch_chunk(chunk, state_dir, stats, tenant)
+        if summary is not None and db is not None:
+            try:
+                path = os.path.join(state_dir, chunk_name(chunk) + ".ndjson.gz")
+                counts = upload_chunk(db, path, chunk, extract=extract, tenant=tenant, journal=journal)
+                stats["loaded"] = stats.get("loaded", 0) + counts["inserted"] + counts["updated"]
+            except PyMongoError as e:
+                stats["load_errors"] = stats.get("load_errors", 0) + 1
+                print(f"❌ Loading {chunk_name(chunk)} failed: {e}")
+                if journal:
+                    try:
+                        journal.fail(chunk_unit(chunk, tenant), e)
+                    except PyMongoError:
+                        pass
+        return summary
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(run, chunk): chunk for chunk in todo}
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                chunk = pending.pop(future)
+                summary = future.result()
+                if summary is None:
+                    stats["splits"] = stats.get("splits", 0) + 1
+                    for part in split_chunk(chunk):
+                        pending[pool.submit(run, part)] = part
+                else:
+                    done[chunk] = summary
+                    print(f"✅ {format_param(chunk[0])} - {format_param(chunk[1])}: {summary['records']} rows")
+
+    # Gzip members can be concatenated, so the merge is a plain byte copy
+    os.makedirs(output_dir, exist_ok=True)
+    records_path, meta_path = landing_paths(ENDPOINT, output_dir)
+    ordered = sorted(done)
+    tmp_path = records_path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        for chunk in ordered:
+            with open(os.path.join(state_dir, chunk_name(chunk) + ".ndjson.gz"), "rb") as f:
+                shutil.copyfileobj(f, out)
+    os.replace(tmp_path, records_path)
+    summaries = [done[chunk] for chunk in ordered]
+    _write_json(meta_path, {
+        "endpoint": ENDPOINT,
+        "collection": collection_name,
+        "tenant": tenant["key"] if tenant is not None else None,
+        "fetchedAt": datetime.now(timezone.utc).isoformat(),
+        "records": sum(s["records"] for s in summaries),
+        "params": dict(ENDPOINTS[ENDPOINT].get("params") or {}, startDate=format_param(start), endDate=format_param(end)),
+        "chunks": [{k: s[k] for k in ("start", "end", "records", "bytes")} for s in summaries],
+    })
+    shutil.rmtree(state_dir, ignore_errors=True)
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill the general ledger over a date range in parallel chunks")
+    parser.add_argument("--start", type=parse_day, required=True, help="First day (MM/DD/YYYY or YYYY-MM-DD)")
+    parser.add_argument("--end", type=parse_day, required=True, help="Last day (MM/DD/YYYY or YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, help="Chunks fetched at once")
+    parser.add_argument("--output-dir", default=DATA_DIR, help="Directory for the landing files")
+    parser.add_argument("--upload", action="store_true", help="Load each chunk into MongoDB as it lands")
+    parser.add_argument(
+        "--extract-references",
+        action="store_true",
+        default=config.EXTRACT_REFERENCES,
+        help="Move embedded entities into reference collections while loading",
+    )
+    parser.add_argument("--tenants", nargs="+", help="Tenant keys to backfill (default: all in FSM_TENANTS)")
+    parser.add_argument("--resume", action="store_true", help="Continue the last unfinished backfill run's loads")
+    args = parser.parse_args(argv)
+    if args.end < args.start:
+        parser.error("--end is before --start")
+    tenants = config.FSM_TENANTS if config.MULTI_TENANT else [None]
+    if args.tenants:
+        if not config.MULTI_TENANT:
+            parser.error("--tenants needs MULTI_TENANT storage (set FSM_TENANTS)")
+        unknown = [k for k in args.tenants if k not in {t["key"] for t in tenants}]
+        if unknown:
+            parser.error(f"unknown tenant(s): {', '.join(unknown)}")
+        tenants = [t for t in tenants if t["key"] in args.tenants]
+
+    db = None
+    if args.upload:
+        try:
+            db = get_database()
+            db.client.admin.command("ping")
+        except PyMongoError as e:
+            print(f"❌ Failed to connect to MongoDB: {e}")
+            return 1
+    journal = open_journal(
+        db, "backfill", args.resume,
+        {"start": args.start.isoformat(), "end": args.end.isoformat(), "tenants": args.tenants},
+    )
+
+    stats = {}
+    started = time.perf_counter()
+    summaries = []
+    try:
+        for tenant in tenants:
+            summaries += backfill(
+                args.start, args.end, args.workers, args.output_dir,
+                db=db, extract=args.extract_references, stats=stats, tenant=tenant, journal=journal,
+            )
+    except (requests.exceptions.RequestException, ijson.JSONError) as e:
+        print(f"❌ Backfill failed (completed chunks are kept for a rerun): {e}")
+        return 1
+    elapsed = time.perf_counter() - started
+
+    rows = sum(s["records"] for s in summaries)
+    print(f"\n📊 {len(summaries)} chunks, {rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)")
+    print(
+        f"   {stats.get('requests', 0)} requests, {stats.get('retries', 0)} retries, "
+        f"{stats.get('splits', 0)} chunks split, {stats.get('bytes', 0) / 1024 / 1024:.1f} MB"
+    )
+    if db is not None:
+        print(f"   {stats.get('loaded', 0)} rows loaded into MongoDB, {stats.get('load_errors', 0)} failed chunk loads")
+    if journal:
+        try:
+            journal.finish()
+        except PyMongoError as e:
+            print(f"⚠️ Could not finish the run journal: {e}")
+    return 0 if not stats.get("load_errors") else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,229 @@
+# Ingestion benchmark against the local FSM stub server
+# Starts stub_server.py in a subprocess with the requested data volume,
+# latency and error injection, runs the concurrent ingestion (ingest.py)
+# against it into a temporary directory, and reports throughput (records
+# and bytes per second), memory and retry behaviour per run.
+#
+# The stub runs in its own process so serializing the responses doesn't
+# compete with the fetch engine for the GIL. Sync state and the run journal
+# are not used - every run is a full fetch.
+#
+# Memory: "Peak heap" is the Python allocation peak of the run (tracemalloc,
+# only with --trace-memory as it slows the run down); "Max RSS" is the
+# process's peak resident size so far.
+#
+# Usage:
+#   python benchmark_ingest.py                                   # all endpoints, sample sizes
+#   python benchmark_ingest.py leads rfps --total 50000 --repeat 3
+#   python benchmark_ingest.py --total 20000 --latency-ms 40 --error-rate 0.05 --drop-rate 0.01
+#   python benchmark_ingest.py --total 100000 --page-size 1000 --page-workers 8 --json results.json
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import requests
+
+import fetch_engine
+from fetch_engine import config, rate_limiter
+from endpoints import ENDPOINTS
+from ingest import format_bytes, run_ingestion
+
+STUB_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_server.py")
+
+
+def start_stub(port, stub_args):
+    """Start stub_server.py and wait until it answers"""
+    process = subprocess.Popen(
+        [sys.executable, STUB_SERVER, "--port", str(port)] + stub_args,
+        stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}/_stub/stats"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"stub server exited with status {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return process
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("stub server did not start")
+
+
+def stub_stats(port, reset=False):
+    """The stub server's counters (reset=True clears them)"""
+    path = "reset" if reset else "stats"
+    return requests.post(f"http://127.0.0.1:{port}/_stub/{path}", timeout=10).json()
+
+
+def max_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def benchmark_run(port, names, workers, trace_memory=False):
+    """
+    One ingestion run into a temporary directory.
+
+    Returns:
+        dict with records, bytes, requests, retries, failed endpoints,
+        seconds, records_per_second, bytes_per_second, peak_heap
+        (None without trace_memory), max_rss and the stub server's counters
+    """
+    stub_stats(port, reset=True)
+    with tempfile.TemporaryDirectory(prefix="fsm_benchmark_") as output_dir:
+        # Resumable page state goes to the temporary directory too
+        fetch_engine.PAGES_DIR = os.path.join(output_dir, ".pages")
+        if trace_memory:
+            tracemalloc.start()
+        results, elapsed = run_ingestion(names, workers, output_dir, db=None, full=True)
+        peak_heap = None
+        if trace_memory:
+            peak_heap = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    records = sum(r["records"] for r in results)
+    received = sum(r.get("bytes", 0) for r in results)
+    return {
+        "records": records,
+        "bytes": received,
+        "requests": sum(r.get("requests", 0) for r in results),
+        "retries": sum(r.get("retries", 0) for r in results),
+        "failed": [r["endpoint"] for r in results if r["status"] != "ok"],
+        "seconds": elapsed,
+        "records_per_second": records / elapsed if elapsed else 0.0,
+        "bytes_per_second": received / elapsed if elapsed else 0.0,
+        "peak_heap": peak_heap,
+        "max_rss": max_rss_bytes(),
+        "server": stub_stats(port),
+        "endpoints": {
+            r["endpoint"]: {k: r.get(k, 0) for k in ("records", "bytes", "requests", "retries", "seconds")}
+            for r in results
+        },
+    }
+
+
+def print_report(runs):
+    """Print the per-run table and the median throughput"""
+    print("\n" + "=" * 112)
+    print("📊 Ingestion benchmark")
+    print("=" * 112)
+    print(
+        f"{'Run':<5}{'Records':>10}{'Bytes':>12}{'Time':>9}{'Records/s':>12}{'MB/s':>8}"
+        f"{'Requests':>10}{'Retries':>9}{'Injected':>10}{'Dropped':>9}{'Peak heap':>11}{'Max RSS':>11}"
+    )
+    print("-" * 112)
+    for i, run in enumerate(runs, 1):
+        peak_heap = format_bytes(run["peak_heap"]) if run["peak_heap"] is not None else "-"
+        print(
+            f"{i:<5}{run['records']:>10}{format_bytes(run['bytes']):>12}{run['seconds']:>8.2f}s"
+            f"{run['records_per_second']:>12.0f}{run['bytes_per_second'] / 1024 / 1024:>8.1f}"
+            f"{run['requests']:>10}{run['retries']:>9}{run['server']['errors']:>10}{run['server']['dropped']:>9}"
+            f"{peak_heap:>11}{format_bytes(run['max_rss']):>11}"
+        )
+    print("-" * 112)
+    median = statistics.median(run["records_per_second"] for run in runs)
+    print(f"Median: {median:.0f} records/s over {len(runs)} run(s)")
+    for i, run in enumerate(runs, 1):
+        if run["failed"]:
+            print(f"❌ Run {i}: failed endpoint(s): {', '.join(run['failed'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion pipeline against the local FSM stub server")
+    parser.add_argument("endpoints", nargs="*", help="Endpoints to fetch (default: all)")
+    parser.add_argument("--repeat", type=int, default=1, help="Benchmark runs")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the stub server")
+    parser.add_argument("--workers", type=int, help="Endpoints fetched at once")
+    parser.add_argument("--page-size", type=int, help="Records per page (FSM_PAGE_SIZE)")
+    parser.add_argument("--page-workers", type=int, help="Pages fetched at once per endpoint (FSM_PAGE_WORKERS)")
+    parser.add_argument("--rps", type=float, default=0, help="Requests-per-second limit (default: none)")
+    parser.add_argument("--backoff", type=float, default=0.05, help="First retry delay in seconds (FSM_BACKOFF_SECONDS)")
+    parser.add_argument("--trace-memory", action="store_true", help="Measure the peak Python heap (slower)")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    stub = parser.add_argument_group("stub server (see stub_server.py)")
+    stub.add_argument("--total", action="append", metavar="[ENDPOINT=]N", help="Records per endpoint (repeatable)")
+    stub.add_argument("--ledger-rows-per-day", type=int)
+    stub.add_argument("--latency-ms", type=float)
+    stub.add_argument("--jitter-ms", type=float)
+    stub.add_argument("--error-rate", type=float)
+    stub.add_argument("--error-status", type=int)
+    stub.add_argument("--retry-after", type=float)
+    stub.add_argument("--drop-rate", type=float)
+    stub.add_argument("--gzip", action="store_true")
+    stub.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    unknown = [n for n in args.endpoints if n not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoint(s): {', '.join(unknown)} (available: {', '.join(ENDPOINTS)})")
+
+    stub_args = []
+    for total in args.total or []:
+        stub_args += ["--total", total]
+    for option in ("ledger_rows_per_day", "latency_ms", "jitter_ms", "error_rate", "error_status", "retry_after", "drop_rate", "seed"):
+        value = getattr(args, option)
+        if value is not None:
+            stub_args += ["--" + option.replace("_", "-"), str(value)]
+    if args.gzip:
+        stub_args.append("--gzip")
+
+    config.FSM_API_BASE_URL = f"http://127.0.0.1:{args.port}"
+    config.FSM_BACKOFF_SECONDS = args.backoff
+    if args.page_size:
+        config.FSM_PAGE_SIZE = args.page_size
+    if args.page_workers:
+        config.FSM_PAGE_WORKERS = args.page_workers
+    rate_limiter.rate = args.rps
+    rate_limiter.capacity = max(1, int(args.rps))
+
+    try:
+        process = start_stub(args.port, stub_args)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"🧪 Stub server on {config.FSM_API_BASE_URL} {' '.join(stub_args)}")
+
+    runs = []
+    try:
+        for i in range(args.repeat):
+            print(f"\n▶️ Run {i + 1}/{args.repeat}")
+            runs.append(benchmark_run(args.port, args.endpoints, args.workers, args.trace_memory))
+    finally:
+        process.terminate()
+        process.wait()
+
+    print_report(runs)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "createdAt": datetime.now(timezone.utc).isoformat(),
+                "endpoints": args.endpoints or list(ENDPOINTS),
+                "stub": stub_args,
+                "settings": {
+                    "page_size": config.FSM_PAGE_SIZE,
+                    "page_workers": config.FSM_PAGE_WORKERS,
+                    "workers": args.workers or config.FSM_INGEST_WORKERS,
+                    "rps": args.rps,
+                    "backoff": args.backoff,
+                    "max_retries": config.FSM_MAX_RETRIES,
+                },
+                "runs": runs,
+            }, f, indent=2)
+        print(f"💾 Results written to {args.json}")
+    return 0 if all(not run["failed"] for run in runs) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
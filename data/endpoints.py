@@ -0,0 +1,171 @@
+# FSM API endpoint table
+# One entry per entity fetched from fsmapi.s4servicesync.com. Adding an
+# endpoint to the ingestion is a new entry here - no new fetch script needed.
+#
+# Entry fields:
+#   path       - API path (joined to config.FSM_API_BASE_URL)
+#   method     - "GET" or "POST"
+#   params     - query string parameters (optional)
+#   payload    - JSON body for POST requests (optional)
+#   pagination - "skip_take" for paged grid endpoints (payload has skip/take
+#                and the response reports totalElements), None otherwise.
+#                Paged endpoints are fetched in full; the payload's "take" is
+#                replaced by config.FSM_PAGE_SIZE
+#   records    - where the records live in the response:
+#                "content" / "rows" (key of a list), a list of such keys
+#                (every list is landed, each record tagged with its key in
+#                RECORD_SET_FIELD), None (the response is a list) or
+#                "by_role" (dict of role -> {"content": [...]}, as returned
+#                by users/byAuthority)
+#   watermark  - field used for incremental sync (paged endpoints only): runs
+#                fetch records with field >= the stored high-water mark, see
+#                sync_state.py. Omitted when the endpoint can't be filtered
+#   collection - target MongoDB collection (one of config.COLLECTIONS)
+#   output     - landing file written by the fetcher: gzip-compressed NDJSON,
+#                one record per line (other top-level response values go to
+#                a .meta.json file of the same name)
+
+# Field tagging records from an endpoint with several record lists with the
+# list they came from (like _role for users by authority)
+RECORD_SET_FIELD = "_recordSet"
+
+ENDPOINTS = {
+    "leads": {
+        "path": "/api/grid-data/leads",
+        "method": "POST",
+        "params": {"startDate": "12/1/2021", "endDate": "12/31/2021"},
+        "payload": {"group": [], "skip": 0, "sort": [], "take": 133},
+        "pagination": "skip_take",
+        "records": "content",
+        "watermark": "businessLocationDateCreated",
+        "collection": "leads",
+        "output": "leads.ndjson.gz",
+    },
+    "proposals": {
+        "path": "/api/proposals",
+        "method": "POST",
+        "payload": {
+            "skip": 0,
+            "take": 70,
+            "sort": [{"field": "proposedDate", "dir": "desc"}],
+            "filter": {"filters": [], "logic": "and"},
+        },
+        "pagination": "skip_take",
+        "records": "content",
+        "watermark": "proposedDate",
+        "collection": "proposals",
+        "output": "proposals.ndjson.gz",
+    },
+    "rfps": {
+        "path": "/api/rfps",
+        "method": "POST",
+        "payload": {
+            "skip": 0,
+            "filter": {
+                "filters": [
+                    {"field": "proposal", "operator": "isnotnull", "value": None},
+                    {"field": "serviceContract", "operator": "isnull", "value": None},
+                ],
+                "logic": "and",
+            },
+            "take": 12,
+        },
+        "pagination": "skip_take",
+        "records": "content",
+        "watermark": "lastUpdated",
+        "collection": "rfps",
+        "output": "rfps.ndjson.gz",
+    },
+    "servicecontracts": {
+        "path": "/api/servicecontracts",
+        "method": "GET",
+        "pagination": None,
+        # On-demand and recurring contracts - an agreement can have both
+        "records": ["onDemand", "recurring"],
+        "collection": "ServiceContracts",
+        "output": "servicecontracts.ndjson.gz",
+    },
+    "customers_activation": {
+        "path": "/api/customerswithservicecontractsbystatus/ACTIVATION",
+        "method": "POST",
+        "payload": {"skip": 0, "take": 20},
+        "pagination": "skip_take",
+        "records": "content",
+        "watermark": "businessLocationDateCreated",
+        "collection": "customers_activation",
+        "output": "customers_activation.ndjson.gz",
+    },
+    "customers_active": {
+        "path": "/api/customerswithservicecontractsbystatus/ACTIVE",
+        "method": "POST",
+        "payload": {"group": [], "skip": 0, "sort": [], "take": 20},
+        "pagination": "skip_take",
+        "records": "content",
+        "watermark": "businessLocationDateCreated",
+        "collection": "customers_active",
+        "output": "customers_active.ndjson.gz",
+    },
+    "customers_suspended": {
+        "path": "/api/customerswithservicecontractsbystatus/SUSPENDED",
+        "method": "POST",
+        "payload": {"skip": 0, "take": 20},
+        "pagination": "skip_take",
+        "records": "content",
+        "watermark": "businessLocationDateCreated",
+        "collection": "customers_suspended",
+        "output": "customers_suspended.ndjson.gz",
+    },
+    "customers_terminated": {
+        "path": "/api/customerswithservicecontractsbystatus/TERMINATED",
+        "method": "POST",
+        "payload": {"skip": 0, "take": 20},
+        "pagination": "skip_take",
+        "records": "content",
+        "watermark": "businessLocationDateCreated",
+        "collection": "customers_terminated",
+        "output": "customers_terminated.ndjson.gz",
+    },
+    "serviceproviders": {
+        "path": "/api/serviceproviders",
+        "method": "GET",
+        "pagination": None,
+        "records": None,
+        "collection": "serviceproviders",
+        "output": "serviceproviders.ndjson.gz",
+    },
+    "spusers": {
+        "path": "/api/spusers",
+        "method": "GET",
+        "pagination": None,
+        "records": None,
+        "collection": "spusers",
+        "output": "spusers.ndjson.gz",
+    },
+    "inspection_dashboard": {
+        "path": "/api/inspection/summarydashboard",
+        "method": "GET",
+        "params": {"year": 2025, "scale": "Monthly", "assignedId": 3361},
+        "pagination": None,
+        "records": None,
+        "collection": "inspection_dashboard",
+        "output": "inspection_dashboard.ndjson.gz",
+    },
+    "users_inspection": {
+        "path": "/api/users/byAuthority/forinspection",
+        "method": "POST",
+        "payload": [2, 6, 7, 10],  # Authority IDs
+        "pagination": None,
+        "records": "by_role",
+        "collection": "UsersInspection",
+        "output": "users_inspection.ndjson.gz",
+    },
+    "general_ledger": {
+        "path": "/api/report/generalledger/new",
+        "method": "GET",
+        "params": {"startDate": "12/1/2021", "endDate": "12/31/2021"},
+        "pagination": None,
+        "records": "rows",
+        "collection": "GeneralLedger",
+        "output": "general_ledger.ndjson.gz",
+    },
+}
@@ -0,0 +1,567 @@
+import os
+import sys
+import gzip
+import json
+import math
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+import ijson
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+# Make the project root importable (config.py) when run from data/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from endpoints import ENDPOINTS, RECORD_SET_FIELD
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Completed pages of interrupted paged fetches, kept so a rerun can resume
+PAGES_DIR = os.path.join(DATA_DIR, ".pages")
+
+# Headers the FSM web client sends (the API expects browser-like requests)
+BROWSER_HEADERS = {
+    "Accept": "application/json, text/plain, */*",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Origin": "https://fsm.s4servicesync.com",
+    "Referer": "https://fsm.s4servicesync.com/",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36",
+    "sec-ch-ua": '"Chromium";v="142", "Google Chrome";v="142", "Not_A Brand";v="99"',
+    "sec-ch-ua-mobile": "?0",
+    "sec-ch-ua-platform": '"Windows"',
+}
+
+# Responses worth retrying (rate limited / transient server errors)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every thread making FSM API requests.
+    Allows bursts of up to `burst` requests, then `rate` requests per second.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+rate_limiter = RateLimiter(config.FSM_MAX_RPS)
+
+
+def get_session():
+    """
+    Get the shared requests.Session used for every FSM API call.
+
+    One pooled session means TCP/TLS connections are kept alive and reused
+    across requests and endpoints. The pool is blocking, so at most
+    FSM_POOL_SIZE connections are open to any one host however many threads
+    are fetching. Accept-Encoding is left to requests so it only advertises
+    compressions it can decode (gzip/deflate, plus br/zstd when those
+    libraries are installed).
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=config.FSM_POOL_SIZE, pool_block=True)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(BROWSER_HEADERS)
+            session.headers["x-tenant"] = config.FSM_TENANT
+            if config.FSM_AUTH_TOKEN:
+                session.cookies.set("AUTH-TOKEN", config.FSM_AUTH_TOKEN)
+            _session = session
+        return _session
+
+
+def build_request(endpoint, payload=None, params=None, tenant=None):
+    """
+    Build the keyword arguments for session.request() from an endpoint entry.
+
+    Args:
+        endpoint: Entry from ENDPOINTS
+        payload: Optional JSON body replacing the endpoint's payload
+        params: Optional query parameters replacing the endpoint's params
+        tenant: Optional entry from config.FSM_TENANTS whose x-tenant header
+            and AUTH-TOKEN replace the session's defaults
+    """
+    request = {
+        "method": endpoint["method"],
+        "url": config.FSM_API_BASE_URL.rstrip("/") + endpoint["path"],
+        "timeout": config.FSM_REQUEST_TIMEOUT,
+    }
+    params = params if params is not None else endpoint.get("params")
+    if params:
+        request["params"] = params
+    payload = payload if payload is not None else endpoint.get("payload")
+    if endpoint["method"] == "POST" and payload is not None:
+        request["json"] = payload
+    if tenant is not None:
+        request["headers"] = {"x-tenant": tenant["tenant"]}
+        if tenant.get("authToken"):
+            request["cookies"] = {"AUTH-TOKEN": tenant["authToken"]}
+    return request
+
+
+def _retry_delay(response, attempt):
+    """Seconds to wait before the next attempt - Retry-After if the server sent one"""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return config.FSM_BACKOFF_SECONDS * (2 ** attempt)
+
+
+def open_response(request, stats=None):
+    """
+    Send a request built by build_request() and return the streamed response.
+
+    Every attempt waits for the shared rate limiter. 429 and 5xx responses
+    and connection errors are retried up to FSM_MAX_RETRIES times with
+    exponential backoff, honouring Retry-After. The body is not read - the
+    caller must consume and close the response.
+
+    Args:
+        request: Keyword arguments for session.request()
+        stats: Optional dict accumulating "requests" and "retries"
+    """
+    attempt = 0
+    while True:
+        rate_limiter.acquire()
+        response = None
+        try:
+            response = get_session().request(stream=True, **request)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt >= config.FSM_MAX_RETRIES:
+                raise
+        if stats is not None:
+            stats["requests"] = stats.get("requests", 0) + 1
+        if response is not None and response.status_code not in RETRY_STATUSES:
+            break
+        if response is not None and attempt >= config.FSM_MAX_RETRIES:
+            break
+        if response is not None:
+            response.close()
+        time.sleep(_retry_delay(response, attempt))
+        attempt += 1
+        if stats is not None:
+            stats["retries"] = stats.get("retries", 0) + 1
+
+    try:
+        response.raise_for_status()
+    except requests.exceptions.HTTPError:
+        response.close()
+        raise
+    return response
+
+
+def iter_records(stream, records, meta=None):
+    """
+    Parse records incrementally from a JSON response stream.
+
+    Only one record is held in memory at a time (one role's users for
+    "by_role" responses). When `records` lists several keys, each record is
+    tagged with the key of its list in RECORD_SET_FIELD. Top-level values
+    other than the records, such as totalElements, are collected into `meta`.
+
+    Args:
+        stream: File-like object with the response body
+        records: The endpoint's "records" setting (see endpoints.py)
+        meta: Optional dict receiving the response's other top-level values
+    """
+    events = ijson.parse(stream, use_float=True)
+
+    if records is None:
+        yield from ijson.items(events, "item")
+        return
+
+    if records == "by_role":
+        # Users by authority - flatten all users from all roles
+        for role_name, role_data in ijson.kvitems(events, ""):
+            if isinstance(role_data, dict):
+                for user in role_data.get("content") or []:
+                    user["_role"] = role_name
+                    yield user
+        return
+
+    # Build each record of the records array(s) on its own and everything
+    # else into the metadata object
+    keys = [records] if isinstance(records, str) else list(records)
+    builder = ijson.ObjectBuilder()
+    item, depth = None, 0
+    for prefix, event, value in events:
+        key = prefix.split(".", 1)[0]
+        if key not in keys:
+            if not (prefix == "" and event == "map_key" and value in keys):
+                builder.event(event, value)
+            continue
+        if prefix == key:
+            continue  # The array itself
+        if item is None:
+            item = ijson.ObjectBuilder()
+        item.event(event, value)
+        if event in ("start_map", "start_array"):
+            depth += 1
+        elif event in ("end_map", "end_array"):
+            depth -= 1
+        if not depth:
+            # End of the item (or a scalar item)
+            record = item.value
+            item = None
+            if isinstance(records, list) and isinstance(record, dict):
+                record[RECORD_SET_FIELD] = key
+            yield record
+    if meta is not None and isinstance(getattr(builder, "value", None), dict):
+        meta.update(builder.value)
+
+
+def write_ndjson(path, records):
+    """
+    Write records to a gzip-compressed NDJSON file, one record per line.
+    The file is written under a temporary name and moved into place when
+    complete, so readers never see a partial file.
+
+    Returns:
+        Number of records written
+    """
+    tmp_path = path + ".tmp"
+    count = 0
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, default=str))
+            f.write("\n")
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+def read_ndjson(path):
+    """Iterate the records of a gzip-compressed NDJSON landing file"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def add_since_filter(payload, field, since):
+    """
+    Add a "field >= since" condition to a grid payload's filter.
+    Uses the API's filter structure ({"logic": ..., "filters": [...]}).
+    """
+    condition = {"field": field, "operator": "gte", "value": since}
+    current = payload.get("filter")
+    if not current or not current.get("filters"):
+        new_filter = {"logic": "and", "filters": [condition]}
+    elif current.get("logic", "and") == "and":
+        new_filter = dict(current, filters=current["filters"] + [condition])
+    else:
+        new_filter = {"logic": "and", "filters": [current, condition]}
+    return dict(payload, filter=new_filter)
+
+
+def fetch_to_file(request, records, path, stats=None, watermark_field=None):
+    """
+    Stream one response into an NDJSON landing file.
+
+    A connection dropped while the body is read fetches the response again,
+    up to FSM_MAX_RETRIES times with the same backoff as open_response.
+
+    Args:
+        request: Keyword arguments for session.request()
+        records: The endpoint's "records" setting (see endpoints.py)
+        path: Landing file path
+        stats: Optional dict accumulating request statistics (see open_response)
+        watermark_field: Field whose highest value is tracked
+
+    Returns:
+        dict with records (count), meta (the response's other top-level
+        values) and watermark (highest watermark_field value, or None)
+    """
+    def track(items):
+        for record in items:
+            value = record.get(watermark_field) if isinstance(record, dict) else None
+            if value is not None and (high[0] is None or value > high[0]):
+                high[0] = value
+            yield record
+
+    attempt = 0
+    while True:
+        meta = {}
+        high = [None]
+        response = open_response(request, stats)
+        try:
+            response.raw.decode_content = True
+            items = iter_records(response.raw, records, meta)
+            count = write_ndjson(path, track(items) if watermark_field else items)
+            if stats is not None:
+                stats["bytes"] = stats.get("bytes", 0) + response.raw.tell()
+            break
+        except urllib3.exceptions.HTTPError as e:
+            # Reading response.raw directly bypasses requests' wrapping of a
+            # connection dropped mid-body
+            if attempt >= config.FSM_MAX_RETRIES:
+                raise requests.exceptions.ChunkedEncodingError(e) from e
+        finally:
+            response.close()
+        time.sleep(_retry_delay(None, attempt))
+        attempt += 1
+        if stats is not None:
+            stats["retries"] = stats.get("retries", 0) + 1
+    return {"records": count, "meta": meta, "watermark": high[0]}
+
+
+def tenant_dir(base_dir, tenant):
+    """Per-tenant subdirectory of a landing/state directory (base_dir itself for no tenant)"""
+    if tenant is None:
+        return base_dir
+    return os.path.join(base_dir, "tenants", tenant["key"])
+
+
+def landing_paths(name, output_dir=DATA_DIR):
+    """Paths of an endpoint's landing files: (records .ndjson.gz, metadata .meta.json)"""
+    records_path = os.path.join(output_dir, ENDPOINTS[name]["output"])
+    return records_path, records_path[: -len(".ndjson.gz")] + ".meta.json"
+
+
+def _write_json(path, data):
+    # Write to a temp file first so an interrupted run never leaves a partial file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+    os.replace(tmp_path, path)
+
+
+def _load_saved_pages(state_dir, plan):
+    """
+    Load the pages a previous run of the same plan completed.
+    Pages saved under a different plan (page size, params or filters changed)
+    are discarded.
+    """
+    plan_path = os.path.join(state_dir, "plan.json")
+    try:
+        with open(plan_path, encoding="utf-8") as f:
+            saved_plan = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        saved_plan = None
+
+    if saved_plan != plan:
+        shutil.rmtree(state_dir, ignore_errors=True)
+        os.makedirs(state_dir, exist_ok=True)
+        _write_json(plan_path, plan)
+        return {}
+
+    # A page is complete once its summary file exists next to its records
+    pages = {}
+    for file_name in os.listdir(state_dir):
+        if not (file_name.startswith("page_") and file_name.endswith(".json")):
+            continue
+        if not os.path.exists(os.path.join(state_dir, file_name[:-5] + ".ndjson.gz")):
+            continue
+        try:
+            with open(os.path.join(state_dir, file_name), encoding="utf-8") as f:
+                pages[int(file_name[5:-5])] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    return pages
+
+
+def fetch_all_pages(name, output_path, payload=None, page_size=None, workers=None, resume_dir=PAGES_DIR, stats=None, tenant=None):
+    """
+    Fetch every page of a "skip_take" endpoint into one landing file.
+
+    The first page reports totalElements, which is used to plan the remaining
+    pages. Those are fetched concurrently by a bounded worker pool, each
+    streamed to its own compressed NDJSON file under resume_dir. An
+    interrupted fetch picks up from the pages it already has when run again.
+    The page files are concatenated in page order into output_path.
+
+    Args:
+        name: Key in ENDPOINTS
+        output_path: Landing file for the merged records
+        payload: Request body replacing the endpoint's payload (e.g. with a filter)
+        page_size: Records per page (default config.FSM_PAGE_SIZE)
+        workers: Pages fetched at once (default config.FSM_PAGE_WORKERS)
+        resume_dir: Directory for saved pages
+        stats: Optional dict accumulating request statistics (see open_response)
+        tenant: Optional entry from config.FSM_TENANTS to fetch for
+
+    Returns:
+        dict with records (total count), meta (first page's top-level values
+        such as totalElements) and watermark (highest value across pages)
+    """
+    endpoint = ENDPOINTS[name]
+    page_size = page_size or config.FSM_PAGE_SIZE
+    workers = workers or config.FSM_PAGE_WORKERS
+    payload = payload if payload is not None else endpoint["payload"]
+    base_payload = {k: v for k, v in payload.items() if k not in ("skip", "take")}
+
+    state_dir = os.path.join(resume_dir, name)
+    plan = {"page_size": page_size, "params": endpoint.get("params"), "payload": base_payload}
+    pages = _load_saved_pages(state_dir, plan)
+
+    def page_path(index):
+        return os.path.join(state_dir, f"page_{index:05d}.ndjson.gz")
+
+    def fetch_page(index):
+        payload = dict(base_payload, skip=index * page_size, take=page_size)
+        request = build_request(endpoint, payload=payload, tenant=tenant)
+        summary = fetch_to_file(request, endpoint["records"], page_path(index), stats, endpoint.get("watermark"))
+        _write_json(os.path.join(state_dir, f"page_{index:05d}.json"), summary)
+        return summary
+
+    if 0 not in pages:
+        pages[0] = fetch_page(0)
+    total = pages[0]["meta"].get("totalElements") or 0
+    page_count = max(1, math.ceil(total / page_size))
+
+    missing = [i for i in range(1, page_count) if i not in pages]
+    if page_count > 1:
+        print(f"Pages: {page_count} x {page_size} ({page_count - len(missing)} already fetched)")
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(workers, len(missing))) as pool:
+            for index, summary in zip(missing, pool.map(fetch_page, missing)):
+                pages[index] = summary
+
+    # Gzip members can be concatenated, so the merge is a plain byte copy
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        for index in range(page_count):
+            with open(page_path(index), "rb") as f:
+                shutil.copyfileobj(f, out)
+    os.replace(tmp_path, output_path)
+    shutil.rmtree(state_dir, ignore_errors=True)
+    watermarks = [pages[i]["watermark"] for i in range(page_count) if pages[i].get("watermark") is not None]
+    return {
+        "records": sum(pages[i]["records"] for i in range(page_count)),
+        "meta": pages[0]["meta"],
+        "watermark": max(watermarks) if watermarks else None,
+    }
+
+
+def fetch_endpoint(name, output_dir=DATA_DIR, stats=None, since=None, tenant=None):
+    """
+    Fetch one endpoint from the FSM API into its landing files.
+
+    Records are parsed from the response stream and written to a
+    gzip-compressed NDJSON file (one record per line); the response's other
+    top-level values (totalElements, report summaries) go to a .meta.json
+    file next to it.
+
+    Args:
+        name: Key in ENDPOINTS
+        output_dir: Directory for the landing files
+        stats: Optional dict accumulating request statistics (see open_response)
+        since: Only fetch records whose watermark field is >= this value
+            (endpoints with a "watermark" setting only)
+        tenant: Optional entry from config.FSM_TENANTS - fetched with its
+            credentials into its own subdirectory (see tenant_dir)
+
+    Returns:
+        dict with records (count), path, meta and watermark (highest
+        watermark field value seen), or None if the fetch failed
+    """
+    endpoint = ENDPOINTS[name]
+    payload = endpoint.get("payload")
+    if since is not None:
+        payload = add_since_filter(payload, endpoint["watermark"], since)
+    request = build_request(endpoint, payload=payload, tenant=tenant)
+    output_dir = tenant_dir(output_dir, tenant)
+    os.makedirs(output_dir, exist_ok=True)
+    records_path, meta_path = landing_paths(name, output_dir)
+
+    try:
+        print(
+            (f"[{tenant['key']}] " if tenant is not None else "")
+            + f"Sending request to: {request['url']}"
+            + (f" ({endpoint['watermark']} >= {since})" if since is not None else "")
+        )
+        if endpoint["pagination"] == "skip_take":
+            result = fetch_all_pages(
+                name, records_path, payload=payload, resume_dir=tenant_dir(PAGES_DIR, tenant), stats=stats, tenant=tenant
+            )
+        else:
+            result = fetch_to_file(request, endpoint["records"], records_path, stats, endpoint.get("watermark"))
+
+        _write_json(meta_path, {
+            "endpoint": name,
+            "collection": endpoint["collection"],
+            "tenant": tenant["key"] if tenant is not None else None,
+            "fetchedAt": datetime.now(timezone.utc).isoformat(),
+            "records": result["records"],
+            "params": endpoint.get("params"),
+            "sync": {
+                "mode": "full" if since is None else "incremental",
+                "field": endpoint.get("watermark"),
+                "since": since,
+                "watermark": result["watermark"],
+                # Committed to the sync state once the upload has loaded it
+                "status": "pending",
+            },
+            "response": result["meta"],
+        })
+        print(f"Records saved to {os.path.basename(records_path)}")
+
+        # Display record count
+        if "totalElements" in result["meta"]:
+            print(f"Total elements: {result['meta']['totalElements']}")
+        print(f"Records received: {result['records']}")
+
+        return dict(result, path=records_path)
+
+    except requests.exceptions.RequestException as e:
+        print(f"Request failed: {e}")
+        if stats is not None:
+            stats["error"] = str(e)
+        return None
+    except ijson.JSONError as e:
+        print(f"Failed to parse JSON response: {e}")
+        if stats is not None:
+            stats["error"] = f"Invalid JSON: {e}"
+        return None
+
+
+def main(names):
+    """Fetch the given endpoints (all endpoints when none are given)"""
+    unknown = [n for n in names if n not in ENDPOINTS]
+    if unknown:
+        print(f"Unknown endpoint(s): {', '.join(unknown)}")
+        print(f"Available: {', '.join(ENDPOINTS)}")
+        return
+    for name in names or list(ENDPOINTS):
+        print(f"\n=== {name} ===")
+        fetch_endpoint(name)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
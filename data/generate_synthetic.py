@@ -0,0 +1,424 @@
+# Synthetic FMS data for scale testing
+# The sample responses (data/*_response.json) hold 1 to 133 records per
+# entity - too few to see how queries, stats and the app behave on real
+# volumes. This script learns a model of every endpoint's records from its
+# sample and bulk-loads any number of synthetic records into MongoDB:
+#
+#   - categorical fields (states, statuses, types) keep their observed
+#     values and frequencies
+#   - numbers, numeric strings (amounts), epoch-millisecond and string dates
+#     are drawn from their observed ranges
+#   - null rates, optional fields, list lengths and nested objects (rfps
+#     proposals, ledger accounts) follow the samples' shapes
+#   - natural keys (config.NATURAL_KEYS) are unique, so the loader's
+#     indexes and upserts work on the result
+#
+# Fields are modelled independently (no correlations between fields).
+# Generated records are normalized like loaded ones (normalize.py), tagged
+# _source "synthetic" and, with config.MULTI_TENANT, spread over the
+# configured tenants.
+#
+# Generation is seeded per chunk of records, so the same --seed and counts
+# produce the same data however many --workers load it.
+#
+# Usage:
+#   python generate_synthetic.py --count 1000000                       # every endpoint
+#   python generate_synthetic.py leads proposals --count 2000000 --drop
+#   python generate_synthetic.py --count 500000 --count rfps=20000 --seed 7 --workers 8
+#   python generate_synthetic.py general_ledger --count 5000000 --date-span 1825   # 5 years of ledger
+#   python generate_synthetic.py rfps --show-model
+
+import argparse
+import json
+import multiprocessing
+import random
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timezone
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from fetch_engine import config
+from endpoints import ENDPOINTS
+from mongo import bump_cache_version, get_database
+from normalize import DATE_FORMATS, normalize_records
+from index_specs import ensure_collection_indexes, is_timeseries_layout
+from stub_server import load_templates, parse_totals
+from upload_to_mongodb import ensure_timeseries_collection, get_path, report_index_failures
+
+# Values with at most this many distinct values (and repeats) are categorical
+MAX_CATEGORIES = 30
+
+# Records generated and inserted per worker task
+CHUNK_SIZE = 10000
+
+_NUMERIC_STRING = re.compile(r"^-?\d+\.\d+$")  # Amounts ("2500.00")
+_ID_FIELD = re.compile(r"(^id|Id|Key)$")
+
+# Integers in this range are taken to be epoch-millisecond dates (2000-2100)
+_EPOCH_MS_RANGE = (946684800000, 4102444800000)
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def _parse_date(value):
+    """(date, format) of a date string in one of DATE_FORMATS, or None"""
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date(), fmt
+        except ValueError:
+            continue
+    return None
+
+
+def learn(values):
+    """
+    Learn a model of a field from its sample values.
+
+    Returns:
+        dict with "kind" (choice, int, float, date, text, list, object,
+        mixed or null), the kind's parameters and "null" (share of None
+        values)
+    """
+    present = [v for v in values if v is not None]
+    null = 1 - len(present) / len(values) if values else 1.0
+    if not present:
+        return {"kind": "null", "null": 1.0}
+
+    by_type = {}
+    for value in present:
+        kind = "bool" if isinstance(value, bool) else "number" if isinstance(value, (int, float)) else type(value).__name__
+        by_type.setdefault(kind, []).append(value)
+    if len(by_type) > 1:
+        options = [(len(vs) / len(present), learn(vs)) for vs in by_type.values()]
+        return {"kind": "mixed", "options": options, "null": null}
+
+    kind, present = next(iter(by_type.items()))
+    if kind == "dict":
+        return dict(learn_object(present), null=null)
+    if kind == "list":
+        items = [item for value in present for item in value]
+        return {
+            "kind": "list",
+            "lengths": [len(value) for value in present],
+            "item": learn(items) if items else {"kind": "null", "null": 1.0},
+            "null": null,
+        }
+
+    # Dates and amounts are ranges even when the samples repeat a few values
+    if kind == "number" and all(isinstance(v, int) for v in present):
+        if _EPOCH_MS_RANGE[0] <= min(present) and max(present) <= _EPOCH_MS_RANGE[1]:
+            return {"kind": "int", "min": min(present), "max": max(present), "epoch_ms": True, "null": null}
+    if kind == "str":
+        if all(_NUMERIC_STRING.match(v) for v in present):
+            numbers = [float(v) for v in present]
+            decimals = max(len(v.partition(".")[2]) for v in present)
+            return {"kind": "float", "min": min(numbers), "max": max(numbers), "decimals": decimals, "string": True, "null": null}
+        dates = [_parse_date(v) for v in present]
+        if all(dates):
+            # The API mixes formats in some fields - generate the most common one
+            days = [day.toordinal() for day, _ in dates]
+            fmt = Counter(fmt for _, fmt in dates).most_common(1)[0][0]
+            return {"kind": "date", "format": fmt, "min": min(days), "max": max(days), "null": null}
+
+    counts = Counter(json.dumps(v) for v in present)
+    categorical = len(counts) <= MAX_CATEGORIES and len(counts) < len(present)
+    if kind == "bool" or (categorical and (kind == "str" or len(counts) <= 10)):
+        return {
+            "kind": "choice",
+            "values": [json.loads(v) for v in counts],
+            "weights": list(counts.values()),
+            "null": null,
+        }
+    if kind == "number":
+        if all(isinstance(v, int) for v in present):
+            return {"kind": "int", "min": min(present), "max": max(present), "null": null}
+        return {"kind": "float", "min": min(present), "max": max(present), "decimals": 2, "null": null}
+    if kind == "str":
+        return {"kind": "text", "values": sorted(set(present)), "null": null}
+    return {"kind": "choice", "values": present, "weights": [1] * len(present), "null": null}
+
+
+def learn_object(records):
+    """Model of a list of objects: each field's presence share and value model"""
+    fields = {}
+    for record in records:
+        for key in record:
+            fields.setdefault(key, None)
+    return {
+        "kind": "object",
+        "fields": {
+            key: {
+                "present": sum(key in r for r in records) / len(records),
+                "model": learn([r[key] for r in records if key in r]),
+            }
+            for key in fields
+        },
+    }
+
+
+def learn_endpoint(name, records):
+    """
+    Model of an endpoint's records, with how their natural keys are made unique.
+
+    Returns:
+        dict with endpoint, collection, samples, model and keys ({field:
+        first synthetic value}). One top-level key field - an id/key field
+        if there is one, otherwise the one with the most distinct sample
+        values - is made unique: integers count up from past the samples'
+        largest key, strings get a counter
+    """
+    collection_name = ENDPOINTS[name]["collection"]
+    candidates = {}
+    for field in config.NATURAL_KEYS.get(collection_name, []):
+        values = [r.get(field) for r in records if r.get(field) is not None]
+        if "." not in field and values:
+            candidates[field] = values
+    keys = {}
+    if candidates:
+        field = max(
+            candidates,
+            key=lambda f: (bool(_ID_FIELD.search(f)), len({json.dumps(v) for v in candidates[f]})),
+        )
+        values = candidates[field]
+        if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+            keys[field] = max(values) + 1
+        else:
+            keys[field] = re.sub(r"\d+$", "", str(values[0])) + "SYN"
+    return {"endpoint": name, "collection": collection_name, "samples": len(records), "model": learn_object(records), "keys": keys}
+
+
+def widen_dates(model, days):
+    """
+    Stretch a model's date ranges (string and epoch-millisecond dates) to
+    cover at least `days` days up to their latest sample date. The samples
+    are often one report period, too narrow for time-range queries at scale.
+    """
+    kind = model["kind"]
+    if kind == "date":
+        model["min"] = min(model["min"], model["max"] - days)
+    elif kind == "int" and model.get("epoch_ms"):
+        model["min"] = min(model["min"], model["max"] - days * DAY_MS)
+    elif kind == "object":
+        for field in model["fields"].values():
+            widen_dates(field["model"], days)
+    elif kind == "list":
+        widen_dates(model["item"], days)
+    elif kind == "mixed":
+        for _, option in model["options"]:
+            widen_dates(option, days)
+
+
+def generate(model, rng):
+    """Draw one value from a model (see learn)"""
+    if model.get("null") and rng.random() < model["null"]:
+        return None
+    kind = model["kind"]
+    if kind == "null":
+        return None
+    if kind == "choice":
+        return rng.choices(model["values"], model["weights"])[0]
+    if kind == "int":
+        return rng.randint(model["min"], model["max"])
+    if kind == "float":
+        value = round(rng.uniform(model["min"], model["max"]), model["decimals"])
+        return f"{value:.{model['decimals']}f}" if model.get("string") else value
+    if kind == "date":
+        return date.fromordinal(rng.randint(model["min"], model["max"])).strftime(model["format"])
+    if kind == "text":
+        return rng.choice(model["values"])
+    if kind == "list":
+        return [generate(model["item"], rng) for _ in range(rng.choice(model["lengths"]))]
+    if kind == "object":
+        return {
+            key: generate(field["model"], rng)
+            for key, field in model["fields"].items()
+            if field["present"] >= 1 or rng.random() < field["present"]
+        }
+    if kind == "mixed":
+        weights = [weight for weight, _ in model["options"]]
+        return generate(rng.choices(model["options"], weights)[0][1], rng)
+    raise ValueError(f"unknown model kind: {kind}")
+
+
+def generate_records(profile, start, count, seed):
+    """
+    Generate records start..start+count-1 of an endpoint (raw API shape).
+    The records depend only on the seed, the endpoint and start.
+    """
+    rng = random.Random(f"{seed}:{profile['endpoint']}:{start}")
+    for index in range(start, start + count):
+        record = generate(profile["model"], rng)
+        for field, first in profile["keys"].items():
+            record[field] = first + index if isinstance(first, int) else f"{first}{index}"
+        yield record
+
+
+def load_chunk(profile, start, count, seed, tenant_key=None, batch_size=None):
+    """
+    Generate one chunk of records and insert it (runs in a worker process).
+
+    Returns:
+        dict with inserted and errors counts
+    """
+    collection_name = profile["collection"]
+    collection = get_database()[collection_name]
+    batch_size = batch_size or config.UPLOAD_BATCH_SIZE
+    now = datetime.now(timezone.utc)
+    timeseries = config.TIMESERIES_COLLECTIONS.get(collection_name) if is_timeseries_layout(collection_name) else None
+    counts = {"inserted": 0, "errors": 0}
+
+    def write(batch):
+        try:
+            counts["inserted"] += len(collection.insert_many(batch, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            counts["inserted"] += e.details.get("nInserted", 0)
+            counts["errors"] += len(e.details.get("writeErrors", []))
+
+    batch = []
+    for record in normalize_records(collection_name, generate_records(profile, start, count, seed)):
+        record.update(_source="synthetic", _importedAt=now)
+        if tenant_key is not None:
+            record[config.TENANT_FIELD] = tenant_key
+        if timeseries:
+            if not isinstance(record.get(timeseries["timeField"]), datetime):
+                counts["errors"] += 1
+                continue
+            meta = {name: get_path(record, path) for name, path in timeseries["metaFields"].items()}
+            if tenant_key is not None:
+                meta[config.TENANT_FIELD] = tenant_key
+            record[timeseries["metaField"]] = meta
+        batch.append(record)
+        if len(batch) >= batch_size:
+            write(batch)
+            batch = []
+    if batch:
+        write(batch)
+    return counts
+
+
+def generate_endpoint(db, pool, profile, count, seed, drop=False, batch_size=None):
+    """
+    Load count synthetic records of one endpoint, in chunks on the process pool.
+    Indexes (index_specs.py) are built after the load, which is faster than
+    maintaining them during it.
+
+    Returns:
+        dict with endpoint, collection, count, inserted, errors and seconds
+    """
+    collection_name = profile["collection"]
+    start = time.perf_counter()
+    if drop:
+        db[collection_name].drop()
+    if is_timeseries_layout(collection_name):
+        ensure_timeseries_collection(db, collection_name)
+
+    tenants = [t["key"] for t in config.FSM_TENANTS] if config.MULTI_TENANT else [None]
+    futures = [
+        pool.submit(
+            load_chunk, profile, offset, min(CHUNK_SIZE, count - offset), seed,
+            tenants[(offset // CHUNK_SIZE) % len(tenants)], batch_size,
+        )
+        for offset in range(0, count, CHUNK_SIZE)
+    ]
+    stats = {"endpoint": profile["endpoint"], "collection": collection_name, "count": count, "inserted": 0, "errors": 0}
+    for done, future in enumerate(as_completed(futures), 1):
+        counts = future.result()
+        stats["inserted"] += counts["inserted"]
+        stats["errors"] += counts["errors"]
+        print(f"   {collection_name}: {stats['inserted']:,} / {count:,} ({done}/{len(futures)} chunks)", end="\r", flush=True)
+    print()
+
+    report_index_failures(ensure_collection_indexes(db[collection_name]))
+    bump_cache_version(db, collection_name)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def learn_profiles(names):
+    """Models of the given endpoints' samples (endpoints without one are skipped)"""
+    templates = load_templates()
+    profiles = {}
+    for name in names:
+        if ENDPOINTS[name]["records"] == "by_role":
+            # No sample response (the stub server fills it with spusers)
+            print(f"⚠️ {name}: no sample response, skipped")
+            continue
+        records = [r for r in templates[name][1] if isinstance(r, dict)]
+        if records:
+            profiles[name] = learn_endpoint(name, records)
+    return profiles
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load synthetic FMS records learned from the sample responses")
+    parser.add_argument("endpoints", nargs="*", help="Endpoints to generate (default: all with a sample)")
+    parser.add_argument(
+        "--count", action="append", metavar="[ENDPOINT=]N",
+        help="Records per endpoint (repeatable; default: 100000)",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (same seed and counts, same data)")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="Generating processes")
+    parser.add_argument("--batch-size", type=int, help="Documents per insert_many")
+    parser.add_argument("--drop", action="store_true", help="Drop the collections first")
+    parser.add_argument(
+        "--date-span", type=int, metavar="DAYS", help="Spread dates over at least this many days before the samples' latest"
+    )
+    parser.add_argument("--show-model", action="store_true", help="Print the learned models and exit")
+    args = parser.parse_args(argv)
+
+    unknown = [n for n in args.endpoints if n not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoint(s): {', '.join(unknown)} (available: {', '.join(ENDPOINTS)})")
+    try:
+        default_count, counts = parse_totals(args.count)
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+
+    profiles = learn_profiles(args.endpoints or list(ENDPOINTS))
+    if args.date_span:
+        for profile in profiles.values():
+            widen_dates(profile["model"], args.date_span)
+    if args.show_model:
+        print(json.dumps(profiles, indent=2, default=str))
+        return 0
+
+    try:
+        db = get_database()
+        db.client.admin.command("ping")
+        print("✅ Connected to MongoDB successfully!")
+    except PyMongoError as e:
+        print(f"❌ Failed to connect to MongoDB: {e}")
+        return 1
+
+    results = []
+    started = time.perf_counter()
+    # spawn: workers open their own MongoClient instead of inheriting this one
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for name, profile in profiles.items():
+            count = counts.get(name, default_count if default_count is not None else 100000)
+            print(f"🧪 {name} → '{profile['collection']}': {count:,} records (model from {profile['samples']} samples)")
+            try:
+                results.append(generate_endpoint(db, pool, profile, count, args.seed, args.drop, args.batch_size))
+            except PyMongoError as e:
+                print(f"❌ {name}: {e}")
+                return 1
+    elapsed = time.perf_counter() - started
+
+    print("\n" + "=" * 72)
+    print(f"📊 Synthetic data (seed {args.seed})")
+    print("=" * 72)
+    print(f"{'Collection':<24}{'Inserted':>12}{'Errors':>9}{'Time':>10}{'Docs/s':>12}")
+    print("-" * 72)
+    for r in results:
+        rate = r["inserted"] / r["seconds"] if r["seconds"] else 0
+        print(f"{r['collection']:<24}{r['inserted']:>12,}{r['errors']:>9}{r['seconds']:>9.1f}s{rate:>12,.0f}")
+    print("-" * 72)
+    total = sum(r["inserted"] for r in results)
+    print(f"{'Total':<24}{total:>12,}{sum(r['errors'] for r in results):>9}{elapsed:>9.1f}s{total / elapsed if elapsed else 0:>12,.0f}")
+    return 0 if not any(r["errors"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,196 @@
+# Concurrent ingestion run for all FSM endpoints
+# Endpoints are fetched on a thread pool. All requests share the fetch
+# engine's pooled session (capped connections per host) and its global
+# requests-per-second limiter, and back off on 429/5xx responses.
+# Endpoints with a watermark are fetched incrementally from their stored
+# sync state (see sync_state.py); the new watermark is committed by the
+# upload once the fetched records are loaded.
+# With config.MULTI_TENANT every configured tenant (config.FSM_TENANTS) is
+# fetched with its own credentials into data/tenants/<key>/, all tenants'
+# endpoints sharing the same worker pool.
+# Each run is journaled in MongoDB (see run_journal.py); --resume continues
+# the last unfinished run and skips the endpoints it already fetched.
+#
+# Usage:
+#   python ingest.py                       # all endpoints
+#   python ingest.py leads proposals       # selected endpoints
+#   python ingest.py --full                # full fetch, ignoring watermarks
+#   python ingest.py --base-url http://127.0.0.1:8000 --rps 20
+#   python ingest.py --tenants boston cleveland
+#   python ingest.py --resume              # after an interrupted run
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo.errors import PyMongoError
+
+from fetch_engine import DATA_DIR, config, fetch_endpoint, landing_paths, rate_limiter, tenant_dir
+from endpoints import ENDPOINTS
+from mongo import get_database
+from run_journal import open_journal
+from sync_state import load_sync_state, plan_sync
+
+
+def ingest_endpoint(name, output_dir=DATA_DIR, db=None, full=False, tenant=None, journal=None):
+    """
+    Fetch one endpoint and collect its run statistics.
+
+    With a database, the endpoint is fetched incrementally when its sync
+    state allows. The sync state itself only moves when the upload loads
+    the landing file (see sync_state.commit_landing_sync).
+    With a journal, an endpoint already fetched in the (resumed) run is
+    skipped if its landing file is still there.
+
+    Returns:
+        dict with endpoint, tenant, status, mode, records, bytes, requests,
+        retries, seconds and error
+    """
+    stats = {"endpoint": name, "tenant": tenant["key"] if tenant is not None else None}
+    unit = f"fetch/{stats['tenant'] or '-'}/{name}"
+    if journal and journal.is_done(unit) and os.path.exists(landing_paths(name, tenant_dir(output_dir, tenant))[0]):
+        stats.update(status="skipped", mode="-", records=0, seconds=0.0)
+        return stats
+    start = time.perf_counter()
+    since = plan_sync(name, load_sync_state(db, name, tenant), full) if db is not None else None
+    stats["mode"] = "full" if since is None else "incr"
+    result = fetch_endpoint(name, output_dir, stats=stats, since=since, tenant=tenant)
+    stats["seconds"] = time.perf_counter() - start
+    stats["status"] = "ok" if result is not None else "failed"
+    stats["records"] = result["records"] if result is not None else 0
+    if journal:
+        try:
+            if result is not None:
+                journal.complete(unit, records=stats["records"], mode=stats["mode"])
+            else:
+                journal.fail(unit, stats.get("error", "fetch failed"))
+        except PyMongoError as e:
+            print(f"⚠️ {name}: could not journal the fetch: {e}")
+    return stats
+
+
+def run_ingestion(names=None, workers=None, output_dir=DATA_DIR, db=None, full=False, tenants=None, journal=None):
+    """
+    Fetch the given endpoints (default: all) concurrently.
+
+    Args:
+        names: Endpoint names from ENDPOINTS
+        workers: Endpoints fetched at once (default config.FSM_INGEST_WORKERS)
+        output_dir: Directory for the landing files
+        db: MongoDB database holding the sync state (None: always fetch in full)
+        full: Fetch everything, ignoring stored watermarks
+        tenants: Entries from config.FSM_TENANTS to fetch (default: all of
+            them with config.MULTI_TENANT, otherwise the single default tenant)
+        journal: Run journal (see run_journal.RunJournal)
+
+    Returns:
+        (list of per-endpoint stats in request order, wall-clock seconds)
+    """
+    names = list(names or ENDPOINTS)
+    if tenants is None:
+        tenants = config.FSM_TENANTS if config.MULTI_TENANT else [None]
+    units = [(tenant, name) for tenant in tenants for name in names]
+    workers = workers or config.FSM_INGEST_WORKERS
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(workers, len(units))) as pool:
+        results = list(pool.map(lambda unit: ingest_endpoint(unit[1], output_dir, db, full, unit[0], journal), units))
+    return results, time.perf_counter() - start
+
+
+def format_bytes(num_bytes):
+    for unit in ("B", "KB", "MB"):
+        if num_bytes < 1024:
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GB"
+
+
+def print_summary(results, elapsed):
+    """Print the per-endpoint run summary table"""
+    print("\n" + "=" * 84)
+    print("📊 Ingestion summary")
+    print("=" * 84)
+    print(f"{'Endpoint':<24}{'Status':<8}{'Mode':<6}{'Records':>9}{'Bytes':>12}{'Requests':>10}{'Retries':>9}{'Time':>9}")
+    print("-" * 84)
+    for r in results:
+        label = f"{r['tenant']}/{r['endpoint']}" if r.get("tenant") else r["endpoint"]
+        print(
+            f"{label:<24}{r['status']:<8}{r['mode']:<6}{r['records']:>9}{format_bytes(r.get('bytes', 0)):>12}"
+            f"{r.get('requests', 0):>10}{r.get('retries', 0):>9}{r['seconds']:>8.2f}s"
+        )
+    print("-" * 84)
+    total_bytes = sum(r.get("bytes", 0) for r in results)
+    print(
+        f"{'Total':<24}{'':<14}{sum(r['records'] for r in results):>9}{format_bytes(total_bytes):>12}"
+        f"{sum(r.get('requests', 0) for r in results):>10}{sum(r.get('retries', 0) for r in results):>9}"
+        f"{elapsed:>8.2f}s"
+    )
+    failed = [r for r in results if r["status"] not in ("ok", "skipped")]
+    if failed:
+        print(f"\n❌ {len(failed)} endpoint(s) failed:")
+        for r in failed:
+            label = f"{r['tenant']}/{r['endpoint']}" if r.get("tenant") else r["endpoint"]
+            print(f"   {label}: {r.get('error', 'unknown error')}")
+    else:
+        skipped = sum(r["status"] == "skipped" for r in results)
+        note = f" ({skipped} already fetched in the resumed run)" if skipped else ""
+        print(f"\n✅ All {len(results)} endpoints fetched{note}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch all FSM endpoints concurrently")
+    parser.add_argument("endpoints", nargs="*", help="Endpoints to fetch (default: all)")
+    parser.add_argument("--workers", type=int, help="Endpoints fetched at once")
+    parser.add_argument("--rps", type=float, help="Global requests-per-second limit (0 = no limit)")
+    parser.add_argument("--base-url", help="FSM API base URL (e.g. a local stub server)")
+    parser.add_argument("--output-dir", default=DATA_DIR, help="Directory for the landing files")
+    parser.add_argument("--full", action="store_true", help="Full fetch of every endpoint (reconcile)")
+    parser.add_argument("--no-sync-state", action="store_true", help="Don't read or update sync state in MongoDB (always fetch in full)")
+    parser.add_argument("--tenants", nargs="+", help="Tenant keys to fetch (default: all in FSM_TENANTS)")
+    parser.add_argument("--resume", action="store_true", help="Continue the last unfinished ingestion run")
+    args = parser.parse_args(argv)
+
+    unknown = [n for n in args.endpoints if n not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoint(s): {', '.join(unknown)} (available: {', '.join(ENDPOINTS)})")
+    tenants = None
+    if args.tenants:
+        if not config.MULTI_TENANT:
+            parser.error("--tenants needs MULTI_TENANT storage (set FSM_TENANTS)")
+        by_key = {t["key"]: t for t in config.FSM_TENANTS}
+        unknown = [k for k in args.tenants if k not in by_key]
+        if unknown:
+            parser.error(f"unknown tenant(s): {', '.join(unknown)} (available: {', '.join(by_key)})")
+        tenants = [by_key[k] for k in args.tenants]
+    if args.base_url:
+        config.FSM_API_BASE_URL = args.base_url
+    if args.rps is not None:
+        rate_limiter.rate = args.rps
+        rate_limiter.capacity = max(1, int(args.rps))
+
+    # MongoDB holds the run journal, and the sync state unless --no-sync-state
+    db = None
+    try:
+        db = get_database()
+        db.client.admin.command("ping")
+    except PyMongoError as e:
+        print(f"⚠️ Sync state and run journal unavailable, fetching everything in full: {e}")
+        db = None
+
+    journal = open_journal(
+        db, "ingest", args.resume, {"endpoints": args.endpoints, "full": args.full, "tenants": args.tenants}
+    )
+    sync_db = None if args.no_sync_state else db
+    results, elapsed = run_ingestion(args.endpoints, args.workers, args.output_dir, sync_db, args.full, tenants, journal)
+    print_summary(results, elapsed)
+    if journal:
+        try:
+            journal.finish()
+        except PyMongoError as e:
+            print(f"⚠️ Could not finish the run journal: {e}")
+    return 0 if all(r["status"] in ("ok", "skipped") for r in results) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
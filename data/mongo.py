@@ -0,0 +1,52 @@
+# Shared MongoDB connection for the data/ ingestion scripts
+# Uses MONGODB_URI / MONGODB_DATABASE from config (.env), falling back to a
+# local server. One client (with its connection pool) is shared per process.
+
+import os
+import sys
+import threading
+import certifi
+from pymongo import MongoClient
+
+# Make the project root importable (config.py) when run from data/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from index_specs import check_timeseries_support
+
+DEFAULT_MONGODB_URI = "mongodb://localhost:27017/"
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Get the shared MongoClient (connects on first use)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            uri = (config.MONGODB_URI or DEFAULT_MONGODB_URI).strip()
+            options = {"serverSelectionTimeoutMS": 30000, "maxPoolSize": config.MONGODB_POOL_SIZE}
+            if uri.startswith("mongodb+srv://"):
+                # Atlas - same TLS setup as the app
+                options.update(tls=True, tlsCAFile=certifi.where())
+            _client = MongoClient(uri, **options)
+            check_timeseries_support(_client)
+        return _client
+
+
+def get_database():
+    """Get the FMS database on the shared client"""
+    return get_client()[config.MONGODB_DATABASE]
+
+
+def bump_cache_version(db, collection_name):
+    """
+    Mark a collection's data as changed.
+    The app includes these versions in its cache keys (see get_data_version
+    in app.py), so its cached stats for the collection are dropped.
+    """
+    db[config.CACHE_VERSIONS_COLLECTION].update_one(
+        {"_id": collection_name},
+        {"$inc": {"version": 1}, "$currentDate": {"updatedAt": True}},
+        upsert=True,
+    )
@@ -0,0 +1,165 @@
+# Ingest-time type normalization
+# The FSM API sends dates as strings ("12/01/2021" or "2021-12-01") or epoch
+# milliseconds, money sometimes as strings ("2500.00") and id lists as
+# comma-joined strings. The loader converts them per collection so MongoDB
+# stores real dates, numbers and arrays that indexes, range filters and date
+# operators can use.
+#
+# Rule types:
+#   "date"     - date string -> BSON date (formats in DATE_FORMATS)
+#   "epoch_ms" - epoch milliseconds -> BSON date
+#   "number"   - numeric string -> float ("" -> null)
+#   "id_list"  - "12,15,31" -> [12, 15, 31] ("" -> [])
+#
+# With config.NORMALIZE_KEEP_ORIGINALS the values that were converted are
+# also kept, under "_original".
+
+from datetime import datetime, timedelta
+
+from fetch_engine import config
+
+DATE_FORMATS = ["%m/%d/%Y", "%Y-%m-%d"]
+
+_EPOCH = datetime(1970, 1, 1)
+
+_INSPECTION_ID_LISTS = [
+    "emailInspectionIds",
+    "phoneInspectionIds",
+    "onsiteInspectionIds",
+    "inspectionsWithRatingOne",
+    "inspectionsWithRatingTwo",
+    "inspectionsWithRatingThree",
+    "inspectionsWithRatingFour",
+    "inspectionsWithRatingFive",
+]
+
+_LOCATION_DATES = {
+    "businessLocationDateCreated": "epoch_ms",
+    "lastContacted": "epoch_ms",
+}
+
+NORMALIZATION_RULES = {
+    "leads": _LOCATION_DATES,
+    "customers_activation": _LOCATION_DATES,
+    "customers_active": _LOCATION_DATES,
+    "customers_suspended": _LOCATION_DATES,
+    "customers_terminated": _LOCATION_DATES,
+    "proposals": {
+        "proposedDate": "epoch_ms",
+        "total": "number",
+        "totalBeforeEdit": "number",
+    },
+    "rfps": {
+        "dateCreated": "epoch_ms",
+        "lastUpdated": "epoch_ms",
+        "dateAuctionEnds": "epoch_ms",
+        "inProgressDate": "epoch_ms",
+        "completedDate": "epoch_ms",
+        "dateWorkBegins": "date",
+        "workBegins": "date",
+        "auctionEnds": "date",
+    },
+    "ServiceContracts": {
+        "startDate": "date",
+        "serviceEndDate": "date",
+        "serviceAgreementAmount": "number",
+        "serviceProviderAlloc": "number",
+    },
+    "GeneralLedger": {
+        "transactionDate": "date",
+        "createDate": "date",
+        "amount": "number",
+        "unappliedAmount": "number",
+    },
+    "inspection_dashboard": {field: "id_list" for field in _INSPECTION_ID_LISTS},
+    "invoices": {"postedDate": "date"},
+    "rfp_proposals": {
+        "dateCreated": "epoch_ms",
+        "lastUpdated": "epoch_ms",
+        "proposedDate": "epoch_ms",
+        "lostDate": "epoch_ms",
+    },
+}
+
+
+def to_date(value):
+    if not isinstance(value, str):
+        return value
+    text = value.strip()
+    if not text:
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return value
+
+
+def to_epoch_date(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    try:
+        return _EPOCH + timedelta(milliseconds=value)
+    except (OverflowError, OSError, ValueError):
+        # Out of datetime's range (or NaN) - keep the raw value
+        return value
+
+
+def to_number(value):
+    if not isinstance(value, str):
+        return value
+    text = value.strip().replace(",", "")
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return value
+
+
+def to_id_list(value):
+    if not isinstance(value, str):
+        return value
+    items = [item.strip() for item in value.split(",") if item.strip()]
+    return [int(item) if item.lstrip("-").isdigit() else item for item in items]
+
+
+CONVERTERS = {
+    "date": to_date,
+    "epoch_ms": to_epoch_date,
+    "number": to_number,
+    "id_list": to_id_list,
+}
+
+
+def normalize_record(record, rules, keep_originals=False):
+    """
+    Convert a record's fields according to a collection's rules.
+    Values that can't be converted (unknown date formats, non-numeric
+    strings) are left as they are.
+    """
+    originals = {}
+    for field, rule in rules.items():
+        if field not in record:
+            continue
+        value = record[field]
+        converted = CONVERTERS[rule](value)
+        if converted is not value:
+            record[field] = converted
+            originals[field] = value
+    if keep_originals and originals:
+        record["_original"] = originals
+    return record
+
+
+def normalize_records(collection_name, records, keep_originals=None):
+    """Lazily normalize a stream of records for a collection"""
+    rules = NORMALIZATION_RULES.get(collection_name)
+    if not rules:
+        yield from records
+        return
+    if keep_originals is None:
+        keep_originals = config.NORMALIZE_KEEP_ORIGINALS
+    for record in records:
+        yield normalize_record(record, rules, keep_originals)
@@ -0,0 +1,148 @@
+# Run journal and dead-letter store for ingestion runs
+# Every ingestion, upload and backfill run records its units of work
+# (an endpoint fetch, an endpoint upload, a ledger chunk) in MongoDB as they
+# complete. A rerun with --resume continues the last unfinished run of the
+# same kind and skips the units that already landed.
+#
+# Records that fail to load (no natural key, no date, rejected writes) are
+# kept in the dead-letter store with the error, so they can be inspected and
+# retried on their own (upload_to_mongodb.py --retry-dead-letters).
+#
+# Journal entries and dead letters expire through TTL indexes (see
+# INTERNAL_INDEX_SPECS in index_specs.py).
+
+import uuid
+from datetime import datetime, timezone
+
+from pymongo.errors import PyMongoError
+
+from fetch_engine import config
+from index_specs import ensure_collection_indexes
+
+RUNNING = "running"
+COMPLETE = "complete"
+FAILED = "failed"
+
+
+def ensure_journal_indexes(db):
+    """Create the journal and dead-letter indexes (unique units, TTL)"""
+    for name in (config.RUNS_COLLECTION, config.RUN_UNITS_COLLECTION, config.DEAD_LETTERS_COLLECTION):
+        ensure_collection_indexes(db[name])
+
+
+class RunJournal:
+    """
+    Journal of one run's units of work.
+
+    Args:
+        db: MongoDB database
+        kind: Run kind ("ingest", "upload", "backfill") - --resume only
+            continues runs of the same kind
+        resume: Continue the latest run of this kind that did not complete
+            (a new run is started if there is none)
+        args: Run arguments, stored for reference
+    """
+
+    def __init__(self, db, kind, resume=False, args=None):
+        self.db = db
+        self.kind = kind
+        self.runs = db[config.RUNS_COLLECTION]
+        self.units = db[config.RUN_UNITS_COLLECTION]
+        ensure_journal_indexes(db)
+
+        previous = None
+        if resume:
+            previous = self.runs.find_one({"kind": kind, "status": {"$ne": COMPLETE}}, sort=[("startedAt", -1)])
+        now = datetime.now(timezone.utc)
+        if previous:
+            self.run_id = previous["_id"]
+            self.resumed = True
+            self.runs.update_one({"_id": self.run_id}, {"$set": {"status": RUNNING, "resumedAt": now}})
+            self.done = {
+                doc["unit"] for doc in self.units.find({"run": self.run_id, "status": COMPLETE}, {"unit": 1})
+            }
+        else:
+            self.run_id = f"{kind}-{now:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+            self.resumed = False
+            self.runs.insert_one({"_id": self.run_id, "kind": kind, "status": RUNNING, "startedAt": now, "args": args or {}})
+            self.done = set()
+
+    def is_done(self, unit):
+        """True if the unit completed in this run (before a resume)"""
+        return unit in self.done
+
+    def _record(self, unit, status, info):
+        self.units.update_one(
+            {"run": self.run_id, "unit": unit},
+            {"$set": dict(info, status=status), "$currentDate": {"updatedAt": True}},
+            upsert=True,
+        )
+
+    def complete(self, unit, **info):
+        """Record a completed unit (info: counts etc. kept with it)"""
+        self._record(unit, COMPLETE, info)
+        self.done.add(unit)
+
+    def fail(self, unit, error, **info):
+        """Record a failed unit - it is retried when the run is resumed"""
+        self._record(unit, FAILED, dict(info, error=str(error)))
+
+    def finish(self):
+        """Mark the run complete, or failed if any unit failed (it can then be resumed)"""
+        failed = self.units.count_documents({"run": self.run_id, "status": FAILED})
+        status = FAILED if failed else COMPLETE
+        self.runs.update_one(
+            {"_id": self.run_id},
+            {"$set": {"status": status, "failedUnits": failed}, "$currentDate": {"finishedAt": True}},
+        )
+        return status
+
+    def dead_letter(self, collection_name, record, error, tenant_key=None):
+        """Keep a record that failed to load, with the error"""
+        dead_letter(self.db, collection_name, record, error, run_id=self.run_id, tenant_key=tenant_key)
+
+
+def open_journal(db, kind, resume=False, args=None):
+    """
+    Start (or with resume, continue) a run journal.
+    Returns None without a database or if MongoDB can't be written - the run
+    then goes ahead unjournaled.
+    """
+    if db is None:
+        return None
+    try:
+        journal = RunJournal(db, kind, resume, args)
+    except PyMongoError as e:
+        print(f"⚠️ Run journal unavailable: {e}")
+        return None
+    if journal.resumed:
+        print(f"↩️ Resuming run {journal.run_id} ({len(journal.done)} unit(s) already complete)")
+    return journal
+
+
+def dead_letter(db, collection_name, record, error, run_id=None, tenant_key=None):
+    """
+    Store a record that failed to load.
+
+    Args:
+        db: MongoDB database
+        collection_name: Collection the record was loaded into
+        record: The record (as it was about to be written)
+        error: Why it failed
+        run_id: Run it failed in
+        tenant_key: Tenant the record belongs to
+    """
+    db[config.DEAD_LETTERS_COLLECTION].insert_one({
+        "collection": collection_name,
+        "tenant": tenant_key,
+        "run": run_id,
+        "error": str(error),
+        "attempts": 1,
+        "failedAt": datetime.now(timezone.utc),
+        "record": {k: v for k, v in record.items() if k != "_id"},
+    })
+
+
+def iter_dead_letters(db, collection_name):
+    """A collection's dead letters, oldest first"""
+    return db[config.DEAD_LETTERS_COLLECTION].find({"collection": collection_name}, sort=[("failedAt", 1)])
@@ -0,0 +1,416 @@
+# Local stand-in for the FSM API
+# Serves every endpoint in endpoints.py from the data/*_response.json samples
+# so ingestion can be run and benchmarked offline. The samples are templates:
+# records are cloned (with unique natural keys, see config.NATURAL_KEYS) up
+# to any number of records per endpoint, and paged endpoints honour
+# skip/take and report the synthetic totalElements. The general ledger
+# report returns rows for every day of its startDate..endDate range.
+#
+# Responses are streamed with chunked transfer encoding (gzip-compressed
+# with --gzip), so large pages never have to fit in memory. Latency, error
+# responses (429/5xx, with Retry-After) and dropped connections can be
+# injected to exercise the fetch engine's retries.
+#
+# users/byAuthority has no sample file; its roles are filled with the
+# spusers sample records.
+#
+# Counters are served at /_stub/stats (POST /_stub/reset clears them).
+#
+# Usage:
+#   python stub_server.py                                  # port 8000, sample sizes
+#   python stub_server.py --total 100000 --total rfps=5000 --latency-ms 50
+#   python stub_server.py --error-rate 0.05 --error-status 503 --drop-rate 0.01 --gzip
+#   python ingest.py --base-url http://127.0.0.1:8000 --no-sync-state --output-dir /tmp/landing
+
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Make the project root importable (config.py) when run from data/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from endpoints import ENDPOINTS, RECORD_SET_FIELD
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Records serialized per chunk written to the socket
+CHUNK_RECORDS = 200
+
+
+def template_records(template, records):
+    """The records of a sample response (see the "records" setting in endpoints.py)"""
+    if records is None:
+        return template
+    if records == "by_role":
+        return [user for role in template.values() for user in role.get("content") or []]
+    if isinstance(records, list):
+        return [dict(r, **{RECORD_SET_FIELD: key}) for key in records for r in template.get(key) or []]
+    return template.get(records) or []
+
+
+def load_templates(data_dir=DATA_DIR):
+    """
+    Load the sample response of every endpoint.
+
+    Returns:
+        {name: (sample response, sample records)}
+    """
+    templates = {}
+    for name, endpoint in ENDPOINTS.items():
+        path = os.path.join(data_dir, f"{name}_response.json")
+        if not os.path.exists(path) and endpoint["records"] == "by_role":
+            path = os.path.join(data_dir, "spusers_response.json")
+            with open(path, encoding="utf-8") as f:
+                users = json.load(f)
+            templates[name] = ({}, users)
+            continue
+        with open(path, encoding="utf-8") as f:
+            template = json.load(f)
+        templates[name] = (template, template_records(template, endpoint["records"]))
+    return templates
+
+
+def parse_day(value):
+    """A report date parameter (12/1/2021)"""
+    return datetime.strptime(value, "%m/%d/%Y").date()
+
+
+class StubState:
+    """
+    Settings and counters shared by the server's request threads.
+
+    Args:
+        totals: {endpoint name: records to serve} (default: the sample's size)
+        default_total: Records for endpoints not in totals (None: sample size)
+        ledger_rows_per_day: General ledger rows per day of the report range
+        latency_ms, jitter_ms: Delay before each response (latency + up to jitter)
+        error_rate: Share of requests answered with error_status
+        error_status: HTTP status of injected errors
+        retry_after: Retry-After seconds sent with injected errors (None: omitted)
+        drop_rate: Share of responses cut off mid-body
+        gzip: Compress response bodies (Content-Encoding: gzip)
+        seed: Seed for the error/latency randomness
+    """
+
+    def __init__(
+        self, totals=None, default_total=None, ledger_rows_per_day=30, latency_ms=0.0, jitter_ms=0.0,
+        error_rate=0.0, error_status=503, retry_after=None, drop_rate=0.0, gzip=False, seed=0, data_dir=DATA_DIR,
+    ):
+        self.templates = load_templates(data_dir)
+        self.totals = totals or {}
+        self.default_total = default_total
+        self.ledger_rows_per_day = ledger_rows_per_day
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.drop_rate = drop_rate
+        self.gzip = gzip
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.routes = {(e["method"], e["path"]): name for name, e in ENDPOINTS.items()}
+        self.key_strides = {name: self._key_stride(name) for name in ENDPOINTS}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = {"requests": 0, "responses": 0, "errors": 0, "dropped": 0, "records": 0, "bytes": 0}
+
+    def count(self, **values):
+        with self.lock:
+            for key, value in values.items():
+                self.stats[key] += value
+
+    def draw(self):
+        """(latency seconds, inject error, drop connection) for one request"""
+        with self.lock:
+            latency = (self.latency_ms + self.random.uniform(0, self.jitter_ms)) / 1000
+            return latency, self.random.random() < self.error_rate, self.random.random() < self.drop_rate
+
+    def total(self, name):
+        """Records served for an endpoint"""
+        if name in self.totals:
+            return self.totals[name]
+        if self.default_total is not None:
+            return self.default_total
+        return len(self.templates[name][1])
+
+    def _key_stride(self, name):
+        # Offset added to integer keys per copy of the samples, past the largest sample key
+        records = self.templates[name][1]
+        fields = [f for f in config.NATURAL_KEYS.get(ENDPOINTS[name]["collection"], []) if "." not in f]
+        values = [r.get(f) for r in records for f in fields if isinstance(r.get(f), int)]
+        return max(values, default=0) + 1
+
+    def record(self, name, index):
+        """
+        The index-th synthetic record of an endpoint: a copy of a sample
+        record whose natural key is made unique for every copy of the samples.
+        """
+        records = self.templates[name][1]
+        record = records[index % len(records)]
+        copy_number = index // len(records)
+        if not copy_number:
+            return record
+        record = copy.copy(record)
+        for field in config.NATURAL_KEYS.get(ENDPOINTS[name]["collection"], []):
+            value = record.get(field)
+            if isinstance(value, bool) or value is None or "." in field or field == RECORD_SET_FIELD:
+                continue
+            if isinstance(value, int):
+                record[field] = value + copy_number * self.key_strides[name]
+            elif isinstance(value, str):
+                record[field] = f"{value}-{copy_number}"
+        return record
+
+    def ledger_rows(self, params):
+        """General ledger rows for every day of the report's date range"""
+        try:
+            start, end = parse_day(params["startDate"]), parse_day(params["endDate"])
+        except (KeyError, ValueError):
+            start = end = date(2021, 12, 1)
+        records = self.templates["general_ledger"][1]
+        day = start
+        while day <= end:
+            # The transaction id keeps rows unique across days
+            for i in range(self.ledger_rows_per_day):
+                row = records[i % len(records)]
+                yield dict(row, transactionDate=f"{day:%m/%d/%Y}", transactionId=f"{day:%Y%m%d}-{i}")
+            day += timedelta(days=1)
+
+
+def iter_body(state, name, params, payload):
+    """
+    Serialize an endpoint's response in pieces.
+
+    Paged endpoints return the records selected by the payload's skip/take
+    and the synthetic totalElements; other endpoints return all records.
+    Other top-level values of the sample (aggregates, report summaries) are
+    passed through.
+
+    Yields:
+        (JSON text, records in it)
+    """
+    endpoint = ENDPOINTS[name]
+    template = state.templates[name][0]
+    total = state.total(name)
+
+    if name == "general_ledger":
+        records = state.ledger_rows(params)
+    elif endpoint["pagination"] == "skip_take":
+        skip = int((payload or {}).get("skip") or 0)
+        take = int((payload or {}).get("take") or total)
+        records = (state.record(name, i) for i in range(skip, min(total, skip + take)))
+    else:
+        records = (state.record(name, i) for i in range(total))
+
+    def json_array(items):
+        yield "[", 0
+        batch, first = [], True
+        for item in items:
+            batch.append(json.dumps(item, ensure_ascii=False))
+            if len(batch) >= CHUNK_RECORDS:
+                yield ("" if first else ",") + ",".join(batch), len(batch)
+                batch, first = [], False
+        if batch:
+            yield ("" if first else ",") + ",".join(batch), len(batch)
+        yield "]", 0
+
+    if endpoint["records"] is None:
+        yield from json_array(records)
+        return
+
+    if endpoint["records"] == "by_role":
+        roles = [f"ROLE_{authority}" for authority in (payload or [1])]
+        records = list(records)
+        yield "{", 0
+        for r, role in enumerate(roles):
+            yield ("," if r else "") + json.dumps(role) + ':{"content":', 0
+            yield from json_array(records[r::len(roles)])
+            yield "}", 0
+        yield "}", 0
+        return
+
+    keys = endpoint["records"]
+    if isinstance(keys, str):
+        arrays = {keys: records}
+    else:
+        # Records of several lists (tagged with their list) go back to it
+        arrays = {key: [] for key in keys}
+        for record in records:
+            record = dict(record)
+            arrays[record.pop(RECORD_SET_FIELD)].append(record)
+    meta = {k: v for k, v in template.items() if k not in arrays}
+    if "totalElements" in meta:
+        meta["totalElements"] = total
+    yield "{" + "".join(f"{json.dumps(k)}:{json.dumps(v, ensure_ascii=False)}," for k, v in meta.items()), 0
+    for i, (key, items) in enumerate(arrays.items()):
+        yield ("," if i else "") + json.dumps(key) + ":", 0
+        yield from json_array(items)
+    yield "}", 0
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Request handler - the server's StubState is self.server.state"""
+
+    # Keep-alive, like the real API, so the fetch engine's pooled session reuses connections
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        if data:
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+
+    def _handle(self):
+        state = self.server.state
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        if url.path == "/_stub/stats":
+            return self._send_json(200, state.stats)
+        if url.path == "/_stub/reset":
+            state.reset()
+            return self._send_json(200, state.stats)
+
+        name = state.routes.get((self.command, url.path))
+        if name is None:
+            return self._send_json(404, {"error": f"no endpoint {self.command} {url.path}"})
+        state.count(requests=1)
+
+        latency, error, drop = state.draw()
+        if latency:
+            time.sleep(latency)
+        if error:
+            state.count(errors=1)
+            headers = {"Retry-After": str(state.retry_after)} if state.retry_after is not None else None
+            return self._send_json(state.error_status, {"error": "injected by stub_server"}, headers)
+
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            payload = json.loads(body) if body else None
+        except ValueError:
+            return self._send_json(400, {"error": "invalid JSON body"})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        compressor = None
+        if state.gzip and "gzip" in self.headers.get("Accept-Encoding", ""):
+            self.send_header("Content-Encoding", "gzip")
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        self.end_headers()
+
+        sent = records = 0
+        for text, count in iter_body(state, name, params, payload):
+            data = text.encode("utf-8")
+            if compressor:
+                data = compressor.compress(data)
+            self._write_chunk(data)
+            sent += len(data)
+            records += count
+            if drop and records:
+                # Cut the response off mid-body, as a dropped connection would
+                state.count(dropped=1, bytes=sent)
+                self.close_connection = True
+                return
+        if compressor:
+            data = compressor.flush()
+            self._write_chunk(data)
+            sent += len(data)
+        self.wfile.write(b"0\r\n\r\n")
+        state.count(responses=1, records=records, bytes=sent)
+
+    do_GET = do_POST = _handle
+
+
+def make_server(host="127.0.0.1", port=8000, **settings):
+    """
+    Create the stub server (not started - call serve_forever()).
+
+    Args:
+        settings: StubState settings
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(**settings)
+    return server
+
+
+def parse_totals(values):
+    """--total values: "N" (every endpoint) or "name=N" -> (default, {name: N})"""
+    default, totals = None, {}
+    for value in values or []:
+        name, _, count = value.rpartition("=")
+        if name and name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint: {name}")
+        if name:
+            totals[name] = int(count)
+        else:
+            default = int(count)
+    return default, totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the FSM API endpoints locally from the sample responses")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--total", action="append", metavar="[ENDPOINT=]N",
+        help="Records per endpoint (repeatable; default: the sample's size)",
+    )
+    parser.add_argument("--ledger-rows-per-day", type=int, default=30, help="General ledger rows per report day")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay before each response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra delay, up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=503, help="Status of injected errors (429, 5xx)")
+    parser.add_argument("--retry-after", type=float, help="Retry-After seconds sent with injected errors")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Share of responses cut off mid-body")
+    parser.add_argument("--gzip", action="store_true", help="Gzip response bodies")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for injected latency and errors")
+    args = parser.parse_args(argv)
+    try:
+        default_total, totals = parse_totals(args.total)
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+
+    server = make_server(
+        args.host, args.port, totals=totals, default_total=default_total,
+        ledger_rows_per_day=args.ledger_rows_per_day, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, error_status=args.error_status, retry_after=args.retry_after,
+        drop_rate=args.drop_rate, gzip=args.gzip, seed=args.seed,
+    )
+    print(f"🧪 FSM stub server on http://{args.host}:{args.port} ({len(ENDPOINTS)} endpoints)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,129 @@
+# Incremental sync state for FSM endpoints
+# Each endpoint with a "watermark" field (see endpoints.py) keeps a
+# high-water mark in MongoDB. Runs fetch only records at or after it, and a
+# full fetch is made periodically (FSM_FULL_SYNC_HOURS) to reconcile changes
+# the watermark field does not capture. Each tenant (config.FSM_TENANTS)
+# has its own state.
+# A fetch records its new watermark in the landing file's .meta.json as
+# "pending"; the upload commits it to the sync state only once the records
+# are loaded, so a failed upload is fetched again from the old watermark.
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from fetch_engine import _write_json, config
+from endpoints import ENDPOINTS
+
+SYNC_STATE_COLLECTION = "_sync_state"
+
+
+def sync_state_id(name, tenant=None):
+    """Key of an endpoint's sync state ("<tenant key>/<endpoint>" for a tenant)"""
+    return name if tenant is None else f"{tenant['key']}/{name}"
+
+
+def load_sync_state(db, name, tenant=None):
+    """Get an endpoint's stored sync state (None if it was never synced)"""
+    return db[SYNC_STATE_COLLECTION].find_one({"_id": sync_state_id(name, tenant)})
+
+
+def plan_sync(name, state, full=False, now=None):
+    """
+    Decide how an endpoint is fetched this run.
+
+    Args:
+        name: Key in ENDPOINTS
+        state: Stored sync state from load_sync_state()
+        full: Force a full fetch
+        now: Current time (UTC)
+
+    Returns:
+        The watermark to fetch from, or None for a full fetch
+    """
+    if full or not ENDPOINTS[name].get("watermark") or not state:
+        return None
+    if state.get("watermark") is None:
+        return None
+    now = now or datetime.now(timezone.utc)
+    last_full = state.get("lastFullSync")
+    if last_full is None:
+        return None
+    if last_full.tzinfo is None:
+        last_full = last_full.replace(tzinfo=timezone.utc)
+    if now - last_full >= timedelta(hours=config.FSM_FULL_SYNC_HOURS):
+        return None
+    return state["watermark"]
+
+
+def save_sync_state(db, name, since, result, now=None, tenant=None):
+    """
+    Record a successful fetch.
+
+    A full fetch sets the watermark to the highest value it saw; an
+    incremental fetch only moves it forward.
+
+    Args:
+        db: MongoDB database
+        name: Key in ENDPOINTS
+        since: Watermark the fetch started from (None for a full fetch)
+        result: fetch_endpoint() result
+        now: Current time (UTC)
+        tenant: Entry from config.FSM_TENANTS the fetch was made for
+    """
+    now = now or datetime.now(timezone.utc)
+    update = {
+        "collection": ENDPOINTS[name]["collection"],
+        "field": ENDPOINTS[name].get("watermark"),
+        "lastSync": now,
+        "lastMode": "full" if since is None else "incremental",
+        "lastRecords": result["records"],
+    }
+    watermark = result.get("watermark")
+    if since is None:
+        update["lastFullSync"] = now
+        update["watermark"] = watermark
+    elif watermark is not None and watermark > since:
+        update["watermark"] = watermark
+    if tenant is not None:
+        update["tenant"] = tenant["key"]
+    db[SYNC_STATE_COLLECTION].update_one({"_id": sync_state_id(name, tenant)}, {"$set": update}, upsert=True)
+
+
+def commit_landing_sync(db, meta_path, tenant=None):
+    """
+    Commit a loaded landing file's pending watermark to the sync state.
+
+    The state is not moved back when a later fetch was committed first.
+    The .meta.json is marked "committed" either way.
+
+    Args:
+        db: MongoDB database
+        meta_path: The landing file's .meta.json (see fetch_engine.landing_paths)
+        tenant: Entry from config.FSM_TENANTS the landing file belongs to
+
+    Returns:
+        True if the sync state was updated
+    """
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    sync = meta.get("sync")
+    if not sync or sync.get("status") != "pending":
+        return False
+
+    fetched_at = datetime.fromisoformat(meta["fetchedAt"])
+    state = load_sync_state(db, meta["endpoint"], tenant)
+    last_sync = state.get("lastSync") if state else None
+    if last_sync is not None and last_sync.tzinfo is None:
+        last_sync = last_sync.replace(tzinfo=timezone.utc)
+    committed = last_sync is None or last_sync < fetched_at
+    if committed:
+        result = {"records": meta["records"], "watermark": sync["watermark"]}
+        save_sync_state(db, meta["endpoint"], sync["since"], result, now=fetched_at, tenant=tenant)
+    sync["status"] = "committed"
+    if os.path.exists(meta_path):
+        _write_json(meta_path, meta)
+    return committed
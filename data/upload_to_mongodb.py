@@ -1,97 +1,932 @@
+# Load FSM landing files into MongoDB
+# Every endpoint's landing file (see endpoints.py) is upserted into its
+# collection. Records are streamed from the file and written in fixed-size
+# unordered bulk batches, several collections at a time over the shared
+# MongoClient pool, so memory is bounded by the batch size, not the file size.
+# Records are normalized first (dates, numbers, id lists - see normalize.py).
+# Each document stores a hash of its content; records whose hash is already
+# in the collection are not written again. Once a landing file is loaded,
+# the watermark its fetch recorded is committed to the sync state
+# (sync_state.py).
+#
+# --full-refresh loads into a staging collection instead and validates it.
+# The live collection is copied to <collection>__previous (kept for
+# --rollback), then the staging collection is renamed over the live one in
+# a single rename, so the live collection is never missing. Only landing
+# files from full fetches of every tenant are swapped in.
+#
+# Time-series collections (config.TIMESERIES_COLLECTIONS - the general
+# ledger) get one document per row in a MongoDB time-series collection; each
+# load inserts its rows and then deletes the older rows of the date range it
+# covers (MongoDB 7.0+; older servers use regular collections).
+#
+# With config.MULTI_TENANT every tenant's landing files (data/tenants/<key>/)
+# are loaded into the same collections, each document tagged with its tenant
+# key (config.TENANT_FIELD), which leads the natural keys and indexes.
+#
+# Each run is journaled (run_journal.py): --resume continues the last
+# unfinished upload run, skipping endpoints that already completed. Records
+# that can't be loaded go to the dead-letter store, and
+# --retry-dead-letters loads just those again.
+#
+# --extract-references moves entities embedded in every row (ledger accounts
+# and service providers, rfp proposals - see config.REFERENCE_FIELDS) into
+# reference collections keyed by id, leaving {"id": ...} on the rows.
+#
+# Usage:
+#   python upload_to_mongodb.py                  # every landing file
+#   python upload_to_mongodb.py leads rfps       # selected endpoints
+#   python upload_to_mongodb.py --batch-size 500 --workers 2
+#   python upload_to_mongodb.py --full-refresh rfps
+#   python upload_to_mongodb.py --rollback rfps
+#   python upload_to_mongodb.py --extract-references general_ledger rfps
+#   python upload_to_mongodb.py --resume
+#   python upload_to_mongodb.py --retry-dead-letters leads
+#   python upload_to_mongodb.py --dedupe-natural-keys leads
+
+import os
+import argparse
+import hashlib
 import json
-from pymongo import MongoClient
-from datetime import datetime
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 
-def upload_leads_to_mongodb():
-    # MongoDB connection settings
-    MONGO_URI = "mongodb://localhost:27017/"  # Update with your MongoDB URI
-    DATABASE_NAME = "FMS"  # Update with your database name
-    COLLECTION_NAME = "leads"
-    
-    # Connect to MongoDB
-    try:
-        client = MongoClient(MONGO_URI)
-        db = client[DATABASE_NAME]
-        
-        # Test connection
-        client.admin.command('ping')
-        print("✅ Connected to MongoDB successfully!")
-        
-    except Exception as e:
-        print(f"❌ Failed to connect to MongoDB: {e}")
+from fetch_engine import DATA_DIR, config, iter_records, landing_paths, read_ndjson, tenant_dir
+from endpoints import ENDPOINTS
+from mongo import bump_cache_version, get_database
+from normalize import normalize_records
+from index_specs import ensure_collection_indexes, is_timeseries_layout, natural_key_fields
+from run_journal import iter_dead_letters, open_journal
+from sync_state import commit_landing_sync
+
+STAGING_SUFFIX = "__staging"
+PREVIOUS_SUFFIX = "__previous"
+# metaField key holding the load a time-series document came from
+LOAD_FIELD = "_load"
+
+
+def find_landing_file(name, data_dir=DATA_DIR):
+    """
+    Path of an endpoint's records: its NDJSON landing file, or the saved API
+    response (<endpoint>_response.json) when there is no landing file yet.
+    None if there is neither.
+    """
+    records_path, _ = landing_paths(name, data_dir)
+    if os.path.exists(records_path):
+        return records_path
+    response_path = os.path.join(data_dir, f"{name}_response.json")
+    if os.path.exists(response_path):
+        return response_path
+    return None
+
+
+def landing_sources(name, data_dir=DATA_DIR):
+    """
+    An endpoint's landing files as (tenant, path) pairs: one per configured
+    tenant that has one with config.MULTI_TENANT, otherwise (None, path)
+    for the single landing file. Empty if there are none.
+    """
+    if not config.MULTI_TENANT:
+        path = find_landing_file(name, data_dir)
+        return [(None, path)] if path else []
+    sources = []
+    for tenant in config.FSM_TENANTS:
+        path = find_landing_file(name, tenant_dir(data_dir, tenant))
+        if path:
+            sources.append((tenant, path))
+    return sources
+
+
+def iter_landing_records(name, path):
+    """Stream an endpoint's records from a landing file or saved response"""
+    if path.endswith(".ndjson.gz"):
+        yield from read_ndjson(path)
+    else:
+        with open(path, "rb") as f:
+            yield from iter_records(f, ENDPOINTS[name]["records"])
+
+
+def get_path(record, path):
+    """Get a (possibly dotted) field from a record; None if any part is missing"""
+    value = record
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def natural_key(record, key_fields):
+    """Build the upsert filter for a record (None if it has no key values)"""
+    key = {field: get_path(record, field) for field in key_fields}
+    if all(value is None for value in key.values()):
+        return None
+    return key
+
+
+# Fields added by the loader - not part of a record's content
+LOADER_FIELDS = ("_id", "_importedAt", "_source", "_contentHash")
+
+
+def content_hash(record):
+    """
+    Stable hash of a record's content.
+    Keys are sorted and loader fields ignored, so the same record always
+    hashes the same regardless of field order or when it was loaded.
+    """
+    content = {k: v for k, v in record.items() if k not in LOADER_FIELDS}
+    encoded = json.dumps(content, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def upsert_records(collection, records, key_fields, batch_size=None, on_error=None):
+    """
+    Upsert changed records on their natural key with unordered bulk writes.
+
+    Each batch's content hashes are looked up in the collection first (one
+    projected query on the _contentHash index); records whose hash
+    is already stored are unchanged and are not sent. The rest are matched on
+    key_fields and replaced field by field ($set). _importedAt is only set
+    when a document is first inserted. Records are consumed lazily and at
+    most batch_size records are held at once.
+
+    Args:
+        collection: Target MongoDB collection
+        records: Iterable of records
+        key_fields: Natural key fields (see index_specs.natural_key_fields)
+        batch_size: Operations per bulk_write (default config.UPLOAD_BATCH_SIZE)
+        on_error: Optional callback(record, error) for records without a
+            key and records whose write was rejected (e.g. a dead-letter store)
+
+    Returns:
+        dict with records, inserted, updated, unchanged, skipped (no key),
+        errors and batches counts
+    """
+    batch_size = batch_size or config.UPLOAD_BATCH_SIZE
+    now = datetime.now(timezone.utc)
+    counts = {"records": 0, "inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0, "errors": 0, "batches": 0}
+
+    def write(batch):
+        hashes = [h for h, _, _ in batch]
+        stored = {
+            doc["_contentHash"]
+            for doc in collection.find({"_contentHash": {"$in": hashes}}, {"_contentHash": 1, "_id": 0})
+        }
+        changed = [(h, key, record) for h, key, record in batch if h not in stored]
+        ops = [
+            UpdateOne(
+                key,
+                {
+                    "$set": dict(record, _source="api_import", _contentHash=h),
+                    "$setOnInsert": {"_importedAt": now},
+                },
+                upsert=True,
+            )
+            for h, key, record in changed
+        ]
+        counts["unchanged"] += len(batch) - len(ops)
+        if not ops:
+            return
+        try:
+            result = collection.bulk_write(ops, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            # Unordered: the rest of the batch was still written
+            result = e.details
+            counts["errors"] += len(result.get("writeErrors", []))
+            if on_error:
+                for error in result.get("writeErrors", []):
+                    on_error(changed[error["index"]][2], error.get("errmsg"))
+        counts["batches"] += 1
+        counts["inserted"] += result.get("nUpserted", 0)
+        counts["updated"] += result.get("nModified", 0)
+        counts["unchanged"] += result.get("nMatched", 0) - result.get("nModified", 0)
+
+    batch = []
+    for record in records:
+        counts["records"] += 1
+        key = natural_key(record, key_fields)
+        if key is None:
+            counts["skipped"] += 1
+            if on_error:
+                on_error(record, f"no natural key ({', '.join(key_fields)})")
+            continue
+        batch.append((content_hash(record), key, record))
+        if len(batch) >= batch_size:
+            write(batch)
+            batch = []
+    if batch:
+        write(batch)
+    return counts
+
+
+def validate_staging(db, collection_name, staging, counts):
+    """
+    Check a loaded staging collection before it replaces the live one.
+
+    Returns:
+        None if valid, otherwise the reason it was rejected
+    """
+    if counts["errors"]:
+        return f"{counts['errors']} write errors"
+    staged = staging.count_documents({})
+    if staged != counts["inserted"]:
+        return f"staging has {staged} documents, expected {counts['inserted']}"
+    if collection_name in db.list_collection_names():
+        live = db[collection_name].estimated_document_count()
+        if staged < live * config.FULL_REFRESH_MIN_RATIO:
+            return f"staging has {staged} documents, live has {live} (below FULL_REFRESH_MIN_RATIO)"
+    return None
+
+
+def check_full_sources(name, sources):
+    """
+    Check that an endpoint's landing files can replace its whole collection:
+    every one must come from a full fetch, and with config.MULTI_TENANT
+    every configured tenant must have one.
+
+    Returns:
+        None if they can, otherwise the reason they can't
+    """
+    if config.MULTI_TENANT:
+        landed = {tenant["key"] for tenant, _ in sources}
+        missing = [tenant["key"] for tenant in config.FSM_TENANTS if tenant["key"] not in landed]
+        if missing:
+            return f"no landing file for tenant(s) {', '.join(missing)}"
+    for tenant, path in sources:
+        label = f"{tenant['key']}/{name}" if tenant is not None else name
+        meta_path = landing_paths(name, os.path.dirname(path))[1]
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                mode = (json.load(f).get("sync") or {}).get("mode")
+        except (OSError, ValueError):
+            return f"{label} has no landing metadata - fetch it with ingest.py --full"
+        if mode != "full":
+            return f"{label} was fetched {mode or 'partially'}, not in full - fetch it with ingest.py --full"
+    return None
+
+
+def full_refresh(db, collection_name, records, batch_size=None, on_error=None):
+    """
+    Replace a collection with freshly loaded records without exposing a
+    half-loaded collection to readers.
+
+    The collection's indexes (see index_specs.py) are built on
+    <collection>__staging and the records loaded into it. After the staging
+    collection is validated, the live collection is copied to
+    <collection>__previous (for rollback()) and the staging collection is
+    renamed over the live one with dropTarget. That rename replaces the
+    live collection atomically - readers see the old or the new version,
+    never a missing collection.
+
+    The records must be a full extract (see check_full_sources) - anything
+    not in them is gone from the live collection afterwards.
+
+    Returns:
+        Load counts (see upsert_records)
+
+    Raises:
+        ValueError: if the staging collection fails validation (the live
+            collection is left untouched)
+    """
+    staging = db[collection_name + STAGING_SUFFIX]
+    staging.drop()
+    report_index_failures(ensure_collection_indexes(staging, collection_name))
+    counts = upsert_records(staging, records, natural_key_fields(collection_name), batch_size, on_error)
+
+    problem = validate_staging(db, collection_name, staging, counts)
+    if problem:
+        staging.drop()
+        raise ValueError(f"full refresh of '{collection_name}' rejected: {problem}")
+
+    if collection_name in db.list_collection_names():
+        keep_previous_version(db, collection_name)
+    staging.rename(collection_name, dropTarget=True)
+    bump_cache_version(db, collection_name)
+    return counts
+
+
+def keep_previous_version(db, collection_name):
+    """
+    Copy a collection, indexes included, to <collection>__previous (for
+    rollback()), replacing the last copy. The collection itself is untouched.
+    """
+    previous_name = collection_name + PREVIOUS_SUFFIX
+    collection = db[collection_name]
+    db[previous_name].drop()
+    collection.aggregate([{"$out": previous_name}])
+    for name, info in collection.index_information().items():
+        if name == "_id_":
+            continue
+        options = {k: v for k, v in info.items() if k not in ("key", "v", "ns")}
+        db[previous_name].create_index(info["key"], name=name, **options)
+
+
+def rollback(db, collection_name):
+    """Restore a collection's previous version kept by full_refresh()"""
+    previous_name = collection_name + PREVIOUS_SUFFIX
+    if previous_name not in db.list_collection_names():
+        raise ValueError(f"no previous version of '{collection_name}' to roll back to")
+    db[previous_name].rename(collection_name, dropTarget=True)
+    bump_cache_version(db, collection_name)
+
+
+def get_collection_options(db, collection_name):
+    """Options of an existing collection (None if it doesn't exist)"""
+    for info in db.list_collections(filter={"name": collection_name}):
+        return info.get("options", {})
+    return None
+
+
+def ensure_timeseries_collection(db, collection_name):
+    """
+    Create a collection as a time-series collection (see
+    config.TIMESERIES_COLLECTIONS) if it isn't one yet.
+    An existing regular collection of that name (the row-per-document layout)
+    is copied to <collection>__previous before it is dropped, so a failed
+    conversion loses nothing. Time-series collections can't be renamed into
+    place, so during this one-time conversion the collection is briefly
+    missing until it is recreated.
+    """
+    options = get_collection_options(db, collection_name)
+    if options is not None and "timeseries" in options:
         return
-    
-    # Read JSON file
+    if options is not None:
+        keep_previous_version(db, collection_name)
+        db[collection_name].drop()
+        print(f"📦 Kept regular collection '{collection_name}' as '{collection_name}{PREVIOUS_SUFFIX}'")
+    settings = config.TIMESERIES_COLLECTIONS[collection_name]
+    db.create_collection(
+        collection_name,
+        timeseries={
+            "timeField": settings["timeField"],
+            "metaField": settings["metaField"],
+            "granularity": settings["granularity"],
+        },
+    )
+    print(f"🗓️ Created time-series collection '{collection_name}'")
+
+
+def parse_date(value):
+    """Parse a request date parameter ("12/1/2021" or "2021-12-01"); None if it isn't one"""
+    if isinstance(value, datetime):
+        return value
+    for fmt in ("%m/%d/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(str(value), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def load_time_range(collection_name, meta_path, records):
+    """
+    Date range covered by a landing file: the request's range parameters
+    (rangeParams, recorded in the .meta.json), otherwise the lowest and
+    highest time field value of its records.
+
+    Args:
+        collection_name: Time-series collection
+        meta_path: The landing file's .meta.json (may not exist)
+        records: Iterable of normalized records, used when there is no
+            request range
+
+    Returns:
+        (first day, last day) as datetimes, or None if there are no dated records
+    """
+    settings = config.TIMESERIES_COLLECTIONS[collection_name]
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            params = json.load(f).get("params") or {}
+        start, end = (parse_date(params.get(p)) for p in settings["rangeParams"])
+        if start and end:
+            return start, end
+    first = last = None
+    for record in records:
+        value = record.get(settings["timeField"])
+        if isinstance(value, datetime):
+            first = value if first is None else min(first, value)
+            last = value if last is None else max(last, value)
+    return (first, last) if first is not None else None
+
+
+def replace_time_range(db, collection_name, records, time_range, batch_size=None, tenant_key=None, on_error=None):
+    """
+    Replace a time-series collection's documents in a date range.
+
+    Time-series collections have no unique indexes, limited updates and no
+    transactions or renames, so instead of upserting, the records are
+    inserted in unordered batches, tagged with a load id in the metaField,
+    and only then are the other documents dated within time_range (whole
+    days, None if the records have no dates) deleted. A failed load deletes
+    its own documents again and leaves the range as it was; readers never
+    see the range empty, only briefly both versions. Reloading the same
+    range is idempotent. The metaField subdocument is built from the
+    record's metaFields. With a tenant_key only that tenant's documents are
+    replaced and the key is also stored in the metaField. on_error(record,
+    error) is called for records without a date and rejected inserts.
+    Deleting by the time field needs MongoDB 7.0+ (see
+    index_specs.check_timeseries_support).
+
+    Returns:
+        dict with records, inserted, deleted, skipped (no date), errors and
+        batches counts (updated/unchanged are always 0)
+
+    Raises:
+        PyMongoError: if the load fails (its documents are removed again)
+    """
+    settings = config.TIMESERIES_COLLECTIONS[collection_name]
+    time_field, meta_field = settings["timeField"], settings["metaField"]
+    batch_size = batch_size or config.UPLOAD_BATCH_SIZE
+    collection = db[collection_name]
+    now = datetime.now(timezone.utc)
+    load_id = uuid.uuid4().hex
+    load_key = f"{meta_field}.{LOAD_FIELD}"
+    counts = {"records": 0, "inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0, "errors": 0, "batches": 0}
+
+    def write(batch):
+        counts["batches"] += 1
+        try:
+            counts["inserted"] += len(collection.insert_many(batch, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            counts["inserted"] += e.details.get("nInserted", 0)
+            counts["errors"] += len(e.details.get("writeErrors", []))
+            if on_error:
+                for error in e.details.get("writeErrors", []):
+                    on_error(batch[error["index"]], error.get("errmsg"))
+
     try:
-        with open("leads_response.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
-        print(f"✅ Loaded JSON file successfully!")
-    except Exception as e:
-        print(f"❌ Failed to read JSON file: {e}")
-        return
-    
-    # Get the leads collection
-    collection = db[COLLECTION_NAME]
-    
-    # Extract content array from the response
-    if isinstance(data, dict) and "content" in data:
-        records = data["content"]
-        total_elements = data.get("totalElements", len(records))
-        print(f"📊 Total elements in API: {total_elements}")
-        print(f"📦 Records to upload: {len(records)}")
-    elif isinstance(data, dict) and "onDemand" in data:
-        records = data["onDemand"]
-        print(f"📦 Records to upload (onDemand): {len(records)}")
-    elif isinstance(data, dict) and "rows" in data:
-        # General ledger format - upload the entire document structure
-        records = [data]  # Wrap the entire response as a single document
-        print(f"📦 Uploading general ledger report (full document)")
-        print(f"   - Account Summary items: {len(data.get('accountSummary', []))}")
-        print(f"   - Transaction rows: {len(data.get('rows', []))}")
-    elif isinstance(data, dict) and any(key in data for key in ['Account Manager', 'Operations Manager', 'GM', 'AGM']):
-        # Users by authority format - flatten all users from all roles
-        records = []
-        for role_name, role_data in data.items():
-            if isinstance(role_data, dict) and "content" in role_data:
-                for user in role_data["content"]:
-                    user["_role"] = role_name  # Add role to each user
-                    records.append(user)
-        print(f"📦 Uploading users by authority")
-        print(f"   - Total users across all roles: {len(records)}")
-        for role_name, role_data in data.items():
-            if isinstance(role_data, dict) and "content" in role_data:
-                print(f"   - {role_name}: {len(role_data['content'])} users")
-    elif isinstance(data, list):
-        records = data
-        print(f"📦 Records to upload: {len(records)}")
-    else:
-        print(f"❌ Unexpected data format. Keys found: {list(data.keys()) if isinstance(data, dict) else type(data)}")
+        batch = []
+        for record in records:
+            counts["records"] += 1
+            if not isinstance(record.get(time_field), datetime):
+                counts["skipped"] += 1
+                if on_error:
+                    on_error(record, f"no {time_field} date")
+                continue
+            record[meta_field] = {name: get_path(record, path) for name, path in settings["metaFields"].items()}
+            record[meta_field][LOAD_FIELD] = load_id
+            if tenant_key is not None:
+                record[config.TENANT_FIELD] = tenant_key
+                record[meta_field][config.TENANT_FIELD] = tenant_key
+            record.update(_source="api_import", _importedAt=now)
+            batch.append(record)
+            if len(batch) >= batch_size:
+                write(batch)
+                batch = []
+        if batch:
+            write(batch)
+    except PyMongoError:
+        # The range keeps its old documents - rows left behind if this fails
+        # too are replaced by the next load of the range
+        try:
+            collection.delete_many({load_key: load_id})
+        except PyMongoError:
+            pass
+        raise
+
+    counts["deleted"] = 0
+    if time_range:
+        start, end = time_range
+        query = {time_field: {"$gte": start, "$lt": end + timedelta(days=1)}, load_key: {"$ne": load_id}}
+        if tenant_key is not None:
+            query[f"{meta_field}.{config.TENANT_FIELD}"] = tenant_key
+        counts["deleted"] = collection.delete_many(query).deleted_count
+    return counts
+
+
+def split_references(record, fields):
+    """
+    Replace a record's embedded entities with {"id": ...} references.
+
+    Args:
+        record: Record (changed in place)
+        fields: Field -> reference collection (see config.REFERENCE_FIELDS)
+
+    Returns:
+        List of (reference collection, entity) pairs taken out of the record.
+        Entities without an id are left embedded.
+    """
+    extracted = []
+    for field, target in fields.items():
+        entity = record.get(field)
+        if isinstance(entity, dict) and entity.get("id") is not None and set(entity) != {"id"}:
+            record[field] = {"id": entity["id"]}
+            extracted.append((target, entity))
+    return extracted
+
+
+def extract_references(db, collection_name, records, batch_size=None, counts=None):
+    """
+    Stream records with their embedded entities split off (see
+    split_references) and upsert the entities into their reference
+    collections.
+
+    Each entity id is written once per run, in batches as records go by, so
+    only the ids seen so far are held in memory. Entities keep the tenant key
+    of the record they came from (ids are only unique within a tenant). Reference collections are
+    shared by every load that feeds them and are upserted directly, also
+    during a full refresh of the fact collection.
+
+    Args:
+        db: MongoDB database
+        collection_name: Collection the records are loaded into
+        records: Iterable of (normalized) records
+        batch_size: Entities per bulk write (default config.UPLOAD_BATCH_SIZE)
+        counts: dict receiving upsert counts per reference collection
+
+    Yields:
+        The records, with references in place of the embedded entities
+    """
+    fields = config.REFERENCE_FIELDS.get(collection_name)
+    if not fields:
+        yield from records
         return
-    
-    # Add metadata to each document
+    batch_size = batch_size or config.UPLOAD_BATCH_SIZE
+    counts = counts if counts is not None else {}
+    pending = defaultdict(list)
+    seen = defaultdict(set)
+
+    def flush(target):
+        if target not in counts:
+            report_index_failures(ensure_collection_indexes(db[target]))
+            counts[target] = {}
+        entities = normalize_records(target, pending.pop(target))
+        result = upsert_records(db[target], entities, natural_key_fields(target), batch_size)
+        for key, value in result.items():
+            counts[target][key] = counts[target].get(key, 0) + value
+
     for record in records:
-        record["_importedAt"] = datetime.utcnow()
-        record["_source"] = "api_import"
-    
-    # Insert documents
+        tenant_key = record.get(config.TENANT_FIELD)
+        for target, entity in split_references(record, fields):
+            if (tenant_key, entity["id"]) in seen[target]:
+                continue
+            seen[target].add((tenant_key, entity["id"]))
+            if tenant_key is not None:
+                entity[config.TENANT_FIELD] = tenant_key
+            pending[target].append(entity)
+            if len(pending[target]) >= batch_size:
+                flush(target)
+        yield record
+    for target in list(pending):
+        flush(target)
+    for target, target_counts in counts.items():
+        if target_counts.get("inserted") or target_counts.get("updated"):
+            bump_cache_version(db, target)
+
+
+def report_index_failures(report):
+    for row in report:
+        if row["status"] in ("failed", "conflict"):
+            print(f"⚠️ Index {row['index']} on '{row['collection']}': {row['status']} {row['detail']}")
+
+
+def iter_source_records(name, collection_name, sources):
+    """Normalized records of an endpoint's landing sources, tagged with their tenant key"""
+    for tenant, path in sources:
+        for record in normalize_records(collection_name, iter_landing_records(name, path)):
+            if tenant is not None:
+                record[config.TENANT_FIELD] = tenant["key"]
+            yield record
+
+
+def upload_endpoint(
+    db, name, batch_size=None, data_dir=DATA_DIR, full=False, extract=None, journal=None, dedupe=False
+):
+    """
+    Upload one endpoint's landing file(s) into its collection - one per
+    tenant with config.MULTI_TENANT (see landing_sources).
+
+    Args:
+        full: Replace the collection through a staging collection (see
+            full_refresh) instead of upserting into it
+        extract: Move embedded entities into reference collections (see
+            extract_references; default config.EXTRACT_REFERENCES)
+        journal: Run journal (see run_journal.RunJournal) - endpoints it
+            has as complete are skipped, records that fail to load are
+            dead-lettered
+        dedupe: Delete documents sharing a natural key (newest kept) so its
+            unique index can be built, and rebuild an outdated natural key
+            index (see index_specs.ensure_collection_indexes)
+
+    Returns:
+        dict with endpoint, collection, status, seconds, error, the
+        upsert counts (see upsert_records) and, when extracting, the
+        reference collections' counts under "references"
+    """
+    collection_name = ENDPOINTS[name]["collection"]
+    stats = {"endpoint": name, "collection": collection_name}
+    start = time.perf_counter()
+    unit = f"upload/{name}"
+    if journal and journal.is_done(unit):
+        stats.update(status="skipped", seconds=0.0)
+        print(f"⏭️ {name}: already uploaded in this run")
+        return stats
+
+    sources = landing_sources(name, data_dir)
+    if not sources:
+        stats.update(status="missing", seconds=0.0)
+        return stats
+
+    on_error = None
+    if journal:
+        def on_error(record, error):
+            try:
+                journal.dead_letter(collection_name, record, error, record.get(config.TENANT_FIELD))
+            except PyMongoError as e:
+                print(f"⚠️ {name}: could not dead-letter a record: {e}")
+
+    extract = config.EXTRACT_REFERENCES if extract is None else extract
+    if extract:
+        stats["references"] = {}
     try:
-        if records:
-            result = collection.insert_many(records)
-            print(f"✅ Successfully inserted {len(result.inserted_ids)} documents into '{COLLECTION_NAME}' collection")
+        if is_timeseries_layout(collection_name):
+            # Loads replace their date range (per tenant) - a full refresh is the same load
+            ensure_timeseries_collection(db, collection_name)
+            report_index_failures(ensure_collection_indexes(db[collection_name]))
+            counts = {}
+            for tenant, path in sources:
+                meta_path = landing_paths(name, os.path.dirname(path))[1]
+                time_range = load_time_range(
+                    collection_name, meta_path, iter_source_records(name, collection_name, [(tenant, path)])
+                )
+                records = iter_source_records(name, collection_name, [(tenant, path)])
+                if extract:
+                    records = extract_references(db, collection_name, records, batch_size, stats["references"])
+                tenant_key = tenant["key"] if tenant is not None else None
+                for key, value in replace_time_range(
+                    db, collection_name, records, time_range, batch_size, tenant_key, on_error
+                ).items():
+                    counts[key] = counts.get(key, 0) + value
+                if time_range:
+                    first, last = (d.date().isoformat() for d in time_range)
+                    previous = stats.get("range", [first, last])
+                    stats["range"] = [min(previous[0], first), max(previous[1], last)]
+            if counts["inserted"] or counts["deleted"]:
+                bump_cache_version(db, collection_name)
         else:
-            print("⚠️ No documents to insert")
-    except Exception as e:
-        print(f"❌ Failed to insert documents: {e}")
-        return
-    
-    # Print collection stats
-    doc_count = collection.count_documents({})
-    print(f"📈 Total documents in '{COLLECTION_NAME}' collection: {doc_count}")
-    
-    # Close connection
-    client.close()
-    print("🔌 MongoDB connection closed")
+            records = iter_source_records(name, collection_name, sources)
+            if extract:
+                records = extract_references(db, collection_name, records, batch_size, stats["references"])
+            if full:
+                problem = check_full_sources(name, sources)
+                if problem:
+                    raise ValueError(f"full refresh of '{collection_name}' refused: {problem}")
+                counts = full_refresh(db, collection_name, records, batch_size, on_error)
+            else:
+                # Indexes first - upserts look documents up by natural key and hash
+                report_index_failures(ensure_collection_indexes(db[collection_name], dedupe=dedupe))
+                counts = upsert_records(
+                    db[collection_name], records, natural_key_fields(collection_name), batch_size, on_error
+                )
+                if counts["inserted"] or counts["updated"]:
+                    bump_cache_version(db, collection_name)
+        stats.update(counts, status="ok" if not counts["errors"] else "errors")
+    except (OSError, ValueError, PyMongoError) as e:
+        stats.update(status="failed", error=str(e))
+    if stats["status"] == "ok":
+        # A fetch's watermark only counts once its records are loaded
+        for tenant, path in sources:
+            try:
+                commit_landing_sync(db, landing_paths(name, os.path.dirname(path))[1], tenant)
+            except PyMongoError as e:
+                print(f"⚠️ {name}: could not commit the sync state: {e}")
+    stats["seconds"] = time.perf_counter() - start
+    if journal:
+        counts = {k: stats.get(k, 0) for k in ("records", "inserted", "updated", "errors")}
+        try:
+            if stats["status"] == "failed":
+                journal.fail(unit, stats["error"], **counts)
+            else:
+                journal.complete(unit, **counts)
+        except PyMongoError as e:
+            print(f"⚠️ {name}: could not journal the upload: {e}")
+    print(f"{'✅' if stats['status'] == 'ok' else '❌'} {name} → '{collection_name}' ({stats['seconds']:.2f}s)")
+    return stats
 
-if __name__ == "__main__":
-    upload_leads_to_mongodb()
 
+def retry_dead_letters(db, name, batch_size=None):
+    """
+    Load an endpoint's dead-lettered records again (see run_journal).
+    Records that load are removed from the store; the others keep their
+    letter with the new error and one more attempt.
+
+    Returns:
+        dict with endpoint, collection, records, retried (loaded) and failed
+    """
+    collection_name = ENDPOINTS[name]["collection"]
+    letters = db[config.DEAD_LETTERS_COLLECTION]
+    stats = {"endpoint": name, "collection": collection_name, "records": 0, "retried": 0, "failed": 0}
+
+    by_tenant = {}
+    for letter in iter_dead_letters(db, collection_name):
+        by_tenant.setdefault(letter.get("tenant"), []).append(letter)
+
+    for tenant_key, group in by_tenant.items():
+        records = [letter["record"] for letter in group]
+        errors = {}
+
+        def on_error(record, error):
+            errors[id(record)] = error
+
+        if is_timeseries_layout(collection_name):
+            # No range to replace - just insert the records
+            ensure_timeseries_collection(db, collection_name)
+            replace_time_range(db, collection_name, records, None, batch_size, tenant_key, on_error)
+        else:
+            upsert_records(db[collection_name], records, natural_key_fields(collection_name), batch_size, on_error)
+
+        loaded = [letter["_id"] for letter in group if id(letter["record"]) not in errors]
+        if loaded:
+            letters.delete_many({"_id": {"$in": loaded}})
+        for letter in group:
+            if id(letter["record"]) in errors:
+                letters.update_one(
+                    {"_id": letter["_id"]},
+                    {
+                        "$set": {"error": str(errors[id(letter["record"])])},
+                        "$inc": {"attempts": 1},
+                        "$currentDate": {"failedAt": True},
+                    },
+                )
+        stats["records"] += len(group)
+        stats["retried"] += len(loaded)
+        stats["failed"] += len(group) - len(loaded)
+
+    if stats["retried"]:
+        bump_cache_version(db, collection_name)
+    return stats
+
+
+def upload_to_mongodb(
+    names=None, batch_size=None, workers=None, data_dir=DATA_DIR, full=False, extract=None, resume=False,
+    dedupe=False,
+):
+    """
+    Upload the given endpoints (default: all) into MongoDB, several
+    collections in parallel. With full=True each collection is replaced
+    through a staging collection (see full_refresh); extract moves embedded
+    entities into reference collections (see extract_references); dedupe
+    removes documents sharing a natural key (see upload_endpoint). The run
+    is journaled; resume continues the last unfinished upload run.
+
+    Returns:
+        List of per-endpoint stats (see upload_endpoint), or None if
+        MongoDB is unreachable
+    """
+    try:
+        db = get_database()
+        # Test connection
+        db.client.admin.command("ping")
+        print("✅ Connected to MongoDB successfully!")
+    except PyMongoError as e:
+        print(f"❌ Failed to connect to MongoDB: {e}")
+        return None
+
+    names = list(names or ENDPOINTS)
+    workers = workers or config.UPLOAD_WORKERS
+    journal = open_journal(
+        db, "upload", resume, {"endpoints": names, "full": full, "extract": bool(extract), "dedupe": dedupe}
+    )
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(workers, len(names))) as pool:
+        results = list(
+            pool.map(
+                lambda name: upload_endpoint(db, name, batch_size, data_dir, full, extract, journal, dedupe), names
+            )
+        )
+    print_summary(results, time.perf_counter() - start)
+    if journal:
+        try:
+            print(f"🧾 Run {journal.run_id}: {journal.finish()}")
+        except PyMongoError as e:
+            print(f"⚠️ Could not finish the run journal: {e}")
+    return results
+
+
+def print_summary(results, elapsed):
+    """Print the per-collection upload summary table"""
+    columns = ["records", "inserted", "updated", "unchanged", "skipped", "errors"]
+
+    def skip_ratio(unchanged, records):
+        # Share of records not written because their content was unchanged
+        return f"{unchanged / records:.0%}" if records else "-"
+
+    print("\n" + "=" * 110)
+    print("📊 Upload summary")
+    print("=" * 110)
+    labels = {"skipped": "No key"}
+    print(
+        f"{'Collection':<24}{'Status':<9}"
+        + "".join(f"{labels.get(c, c.title()):>10}" for c in columns)
+        + f"{'Skip %':>8}{'Time':>9}"
+    )
+    print("-" * 110)
+    for r in results:
+        print(
+            f"{r['collection']:<24}{r['status']:<9}"
+            + "".join(f"{r.get(c, 0):>10}" for c in columns)
+            + f"{skip_ratio(r.get('unchanged', 0), r.get('records', 0)):>8}"
+            + f"{r['seconds']:>8.2f}s"
+        )
+    print("-" * 110)
+    totals = {c: sum(r.get(c, 0) for r in results) for c in columns}
+    print(
+        f"{'Total':<33}"
+        + "".join(f"{totals[c]:>10}" for c in columns)
+        + f"{skip_ratio(totals['unchanged'], totals['records']):>8}"
+        + f"{elapsed:>8.2f}s"
+    )
+    for r in results:
+        if "range" in r:
+            print(f"🗓️ {r['collection']}: replaced {r['range'][0]} to {r['range'][1]} ({r.get('deleted', 0)} deleted)")
+        for target, counts in r.get("references", {}).items():
+            print(
+                f"🔗 {r['collection']} → '{target}': {counts.get('records', 0)} entities, "
+                f"{counts.get('inserted', 0)} inserted, {counts.get('updated', 0)} updated"
+            )
+    dead_letters = sum(r.get("errors", 0) + r.get("skipped", 0) for r in results)
+    if dead_letters:
+        print(f"📮 {dead_letters} record(s) not loaded - see '{config.DEAD_LETTERS_COLLECTION}' (--retry-dead-letters)")
+    for r in results:
+        if r["status"] == "missing":
+            print(f"⚠️ {r['endpoint']}: no landing file")
+        elif r.get("error"):
+            print(f"❌ {r['endpoint']}: {r['error']}")
+
+
+def upload_leads_to_mongodb():
+    upload_to_mongodb(["leads"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upsert FSM landing files into MongoDB")
+    parser.add_argument("endpoints", nargs="*", help="Endpoints to upload (default: all)")
+    parser.add_argument("--batch-size", type=int, help="Operations per bulk write")
+    parser.add_argument("--workers", type=int, help="Collections written at once")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Directory with the landing files")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--full-refresh", action="store_true", help="Replace collections via a staging collection swap")
+    mode.add_argument("--rollback", action="store_true", help="Restore the collections' previous versions")
+    mode.add_argument("--resume", action="store_true", help="Continue the last unfinished upload run")
+    mode.add_argument(
+        "--retry-dead-letters", action="store_true", help="Load the dead-lettered records of failed loads again"
+    )
+    parser.add_argument(
+        "--extract-references",
+        action="store_true",
+        default=config.EXTRACT_REFERENCES,
+        help="Move embedded entities into reference collections (config.REFERENCE_FIELDS)",
+    )
+    parser.add_argument(
+        "--dedupe-natural-keys",
+        action="store_true",
+        help="Delete documents sharing a natural key (newest kept) so its unique index can be built",
+    )
+    args = parser.parse_args(argv)
+
+    unknown = [n for n in args.endpoints if n not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoint(s): {', '.join(unknown)} (available: {', '.join(ENDPOINTS)})")
+
+    if args.rollback:
+        if not args.endpoints:
+            parser.error("--rollback needs the endpoints to roll back")
+        db = get_database()
+        for name in args.endpoints:
+            collection_name = ENDPOINTS[name]["collection"]
+            try:
+                rollback(db, collection_name)
+                print(f"✅ Rolled back '{collection_name}'")
+            except (ValueError, PyMongoError) as e:
+                print(f"❌ {e}")
+                return 1
+        return 0
+
+    if args.retry_dead_letters:
+        db = get_database()
+        failed = 0
+        for name in args.endpoints or ENDPOINTS:
+            try:
+                stats = retry_dead_letters(db, name, args.batch_size)
+            except PyMongoError as e:
+                print(f"❌ {name}: {e}")
+                return 1
+            if stats["records"]:
+                print(f"📮 {name}: {stats['retried']} of {stats['records']} dead letter(s) loaded, {stats['failed']} still failing")
+            failed += stats["failed"]
+        return 0 if not failed else 1
+
+    results = upload_to_mongodb(
+        args.endpoints, args.batch_size, args.workers, args.data_dir, args.full_refresh, args.extract_references,
+        args.resume, args.dedupe_natural_keys,
+    )
+    return 0 if results is not None and all(r["status"] in ("ok", "missing", "skipped") for r in results) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
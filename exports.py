@@ -0,0 +1,510 @@
+# Export helpers for FMS Query Engine results
+# Serializes result DataFrames into downloadable file formats
+
+import os
+import csv
+import json
+import time
+import uuid
+import threading
+from datetime import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from bson import ObjectId
+from schema_catalog import apply_schema_hints
+
+# =============================================================================
+# EXPORT FORMATS
+# =============================================================================
+# Each format maps to the download button label, file extension and MIME type
+EXPORT_FORMATS = {
+    "csv": {"label": "📄 Download CSV", "extension": "csv", "mime": "text/csv"},
+    "json": {"label": "📋 Download JSON", "extension": "json", "mime": "application/json"},
+    "ndjson": {"label": "🧾 Download NDJSON", "extension": "ndjson", "mime": "application/x-ndjson"},
+    "parquet": {"label": "🗜️ Download Parquet", "extension": "parquet", "mime": "application/vnd.apache.parquet"},
+    "arrow": {"label": "🏹 Download Arrow", "extension": "arrow", "mime": "application/vnd.apache.arrow.file"},
+}
+
+# Formats offered for the (limited) results shown on the page
+DISPLAY_EXPORT_FORMATS = ["csv", "json", "ndjson", "parquet", "arrow"]
+
+# Compression codec for Parquet and Arrow IPC files
+COLUMNAR_COMPRESSION = "zstd"
+
+
+def _flatten_nested_columns(df):
+    """Store nested documents/arrays as JSON strings so columns have a single type"""
+    df = df.copy()
+    for column in df.columns:
+        if df[column].dtype == object:
+            values = df[column].map(_export_value)
+            # Columns mixing value types (e.g. numbers and strings) are stored as strings
+            kinds = {type(v) for v in values if not pd.isna(v)}
+            if len(kinds) > 1:
+                values = values.map(lambda v: v if pd.isna(v) else str(v))
+            df[column] = values
+    return df
+
+
+def _normalize_arrow_schema(schema):
+    """
+    Make an inferred schema safe to reuse across batches:
+    all-null columns become strings and dictionaries use int32 indices.
+    """
+    fields = []
+    for field in schema:
+        if pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        elif pa.types.is_dictionary(field.type):
+            field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+        elif pa.types.is_timestamp(field.type):
+            field = field.with_type(pa.timestamp("ms"))
+        fields.append(field)
+    return pa.schema(fields)
+
+
+def frame_to_arrow(df, schema=None):
+    """
+    Convert a result DataFrame into an Arrow table with a proper schema.
+
+    Dates become timestamps, amounts floats and status/state fields
+    dictionary-encoded categoricals (see schema_catalog.FIELD_TYPE_HINTS).
+
+    Args:
+        df: Result DataFrame
+        schema: Optional schema to conform to (used for later streaming batches)
+
+    Returns:
+        pyarrow.Table
+    """
+    typed = _flatten_nested_columns(apply_schema_hints(df))
+    if schema is not None:
+        typed = typed.reindex(columns=schema.names)
+    table = pa.Table.from_pandas(typed, preserve_index=False)
+    if schema is None:
+        schema = _normalize_arrow_schema(table.schema)
+    return table.cast(schema, safe=False)
+
+
+def serialize_frame(df, fmt):
+    """
+    Serialize a result DataFrame into the bytes of a download file.
+
+    Args:
+        df: The DataFrame shown in the results tab
+        fmt: One of the keys in EXPORT_FORMATS
+
+    Returns:
+        Encoded file contents (bytes)
+    """
+    if fmt == "csv":
+        return df.to_csv(index=False).encode("utf-8")
+    elif fmt == "json":
+        return df.to_json(orient="records", indent=2, date_format="iso").encode("utf-8")
+    elif fmt == "ndjson":
+        # One compact record per line - no indentation overhead
+        return df.to_json(orient="records", lines=True, date_format="iso").encode("utf-8")
+    elif fmt == "parquet":
+        sink = pa.BufferOutputStream()
+        pq.write_table(frame_to_arrow(df), sink, compression=COLUMNAR_COMPRESSION)
+        return sink.getvalue().to_pybytes()
+    elif fmt == "arrow":
+        table = frame_to_arrow(df)
+        sink = pa.BufferOutputStream()
+        options = pa.ipc.IpcWriteOptions(compression=COLUMNAR_COMPRESSION)
+        with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+
+def export_file_name(fmt, timestamp):
+    """Build the download file name for an export format"""
+    return f"fms_results_{timestamp.strftime('%Y%m%d_%H%M%S')}.{EXPORT_FORMATS[fmt]['extension']}"
+
+
+# =============================================================================
+# STREAMING FULL-RESULT EXPORT
+# =============================================================================
+# Full exports re-run the query plan without the display limit and stream the
+# cursor to a file on disk in fixed-size batches, so memory stays bounded by
+# the batch size instead of the result size.
+FULL_EXPORT_FORMATS = ["csv", "ndjson", "parquet", "arrow"]
+
+# Background export jobs for this process, keyed by job id
+_export_jobs = {}
+_export_jobs_lock = threading.Lock()
+
+
+def _export_value(value):
+    """Convert a MongoDB value into a flat, file-friendly value"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str, ensure_ascii=False)
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+
+def _records_to_frame(records, hidden_columns):
+    """Build a flat DataFrame from a batch of MongoDB documents"""
+    rows = [
+        {k: _export_value(v) for k, v in doc.items() if k not in hidden_columns}
+        for doc in records
+    ]
+    return pd.DataFrame(rows)
+
+
+def _is_number(data_type):
+    return pa.types.is_integer(data_type) or pa.types.is_floating(data_type)
+
+
+def _widen_type(current, other):
+    """
+    The narrowest type holding the values of both types:
+    ints and floats become float64, anything else mixed becomes strings.
+    """
+    if current == other or pa.types.is_null(other):
+        return current
+    if pa.types.is_null(current):
+        return other
+    if pa.types.is_dictionary(current) and pa.types.is_dictionary(other):
+        return pa.dictionary(pa.int32(), _widen_type(current.value_type, other.value_type))
+    if pa.types.is_integer(current) and pa.types.is_integer(other):
+        return pa.int64()
+    if _is_number(current) and _is_number(other):
+        return pa.float64()
+    if pa.types.is_timestamp(current) and pa.types.is_timestamp(other):
+        return pa.timestamp("ms")
+    return pa.string()
+
+
+def _widen_schema(schema, other):
+    """Merge a batch's schema into the schema so far - new fields are appended"""
+    types = {field.name: field.type for field in schema}
+    for field in other:
+        types[field.name] = _widen_type(types[field.name], field.type) if field.name in types else field.type
+    return pa.schema(list(types.items()))
+
+
+def _conform_table(table, schema):
+    """Cast a table to a (wider) schema, filling fields it lacks with nulls"""
+    columns = []
+    for field in schema:
+        if field.name in table.column_names:
+            columns.append(table.column(field.name).cast(field.type, safe=False))
+        else:
+            columns.append(pa.chunked_array([pa.nulls(table.num_rows, field.type)]))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+class _CsvBatchWriter:
+    def __init__(self, path, hidden_columns):
+        self.path = path
+        self.file = open(path, "w", encoding="utf-8", newline="")
+        self.hidden_columns = hidden_columns
+        self.columns = None
+        self.widened = False
+
+    def write_batch(self, records):
+        df = _records_to_frame(records, self.hidden_columns)
+        if self.columns is None:
+            self.columns = list(df.columns)
+            df.to_csv(self.file, index=False)
+            return
+        known = set(self.columns)
+        new_columns = [column for column in df.columns if column not in known]
+        if new_columns:
+            # Fields first seen in a later batch are appended; the header is
+            # rewritten on close
+            self.columns.extend(new_columns)
+            self.widened = True
+        df.reindex(columns=self.columns).to_csv(self.file, header=False, index=False)
+
+    def close(self):
+        self.file.close()
+        if self.widened:
+            self._rewrite_header()
+
+    def _rewrite_header(self):
+        """Rewrite the file with the full header, padding rows written before a column appeared"""
+        width = len(self.columns)
+        tmp_path = f"{self.path}.tmp"
+        with open(self.path, encoding="utf-8", newline="") as src, \
+                open(tmp_path, "w", encoding="utf-8", newline="") as dst:
+            reader = csv.reader(src)
+            writer = csv.writer(dst, lineterminator=os.linesep)
+            next(reader, None)
+            writer.writerow(self.columns)
+            for row in reader:
+                writer.writerow(row + [""] * (width - len(row)))
+        os.replace(tmp_path, self.path)
+
+
+class _NdjsonBatchWriter:
+    def __init__(self, path, hidden_columns):
+        self.file = open(path, "w", encoding="utf-8")
+        self.hidden_columns = hidden_columns
+
+    def write_batch(self, records):
+        for doc in records:
+            record = {k: v for k, v in doc.items() if k not in self.hidden_columns}
+            self.file.write(json.dumps(record, default=str, ensure_ascii=False))
+            self.file.write("\n")
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetBatchWriter:
+    """
+    The schema comes from the first batch and widens when later batches add
+    fields or change a field's type. Each widening starts a new segment
+    file; on close the segments are rewritten into one file with the final
+    schema, so a result whose schema is stable is written in a single pass.
+    """
+
+    def __init__(self, path, hidden_columns):
+        self.path = path
+        self.hidden_columns = hidden_columns
+        self.writer = None
+        self.schema = None  # Widened inferred schema (may hold null types)
+        self.file_schema = None  # Schema of the segment being written
+        self.segments = []
+
+    def _open(self, path, schema):
+        return pq.ParquetWriter(path, schema, compression=COLUMNAR_COMPRESSION)
+
+    def _close_writer(self):
+        self.writer.close()
+        self.writer = None
+
+    def _write(self, table):
+        self.writer.write_table(table)
+
+    def _read_segment(self, path):
+        return pq.ParquetFile(path).iter_batches()
+
+    def _start_segment(self, schema):
+        if self.writer is not None:
+            self._close_writer()
+        path = self.path if not self.segments else f"{self.path}.part{len(self.segments)}"
+        self.segments.append(path)
+        self.schema = schema
+        self.file_schema = _normalize_arrow_schema(schema)
+        self.writer = self._open(path, self.file_schema)
+
+    def write_batch(self, records):
+        df = pd.DataFrame([
+            {k: v for k, v in doc.items() if k not in self.hidden_columns}
+            for doc in records
+        ])
+        typed = _flatten_nested_columns(apply_schema_hints(df))
+        table = pa.Table.from_pandas(typed, preserve_index=False)
+        schema = _widen_schema(self.schema or pa.schema([]), table.schema)
+        if self.writer is None or not schema.equals(self.schema):
+            self._start_segment(schema)
+        self._write(_conform_table(table, self.file_schema))
+
+    def close(self):
+        if self.writer is None:
+            # No records - still produce a valid (empty) file
+            self._start_segment(pa.schema([]))
+        self._close_writer()
+        if len(self.segments) > 1:
+            self._merge_segments()
+
+    def _merge_segments(self):
+        """Rewrite every segment into the export file with the final schema"""
+        self.segments[0] = f"{self.path}.part0"
+        os.replace(self.path, self.segments[0])
+        self.writer = self._open(self.path, self.file_schema)
+        for path in self.segments:
+            for batch in self._read_segment(path):
+                self._write(_conform_table(pa.Table.from_batches([batch]), self.file_schema))
+            os.remove(path)
+        self._close_writer()
+
+
+class _ArrowBatchWriter(_ParquetBatchWriter):
+    def _open(self, path, schema):
+        # Dictionary values seen so far per column - IPC files only allow
+        # dictionaries to grow (deltas), never to be replaced between batches
+        self.dictionaries = {}
+        self.sink = pa.OSFile(path, "wb")
+        options = pa.ipc.IpcWriteOptions(compression=COLUMNAR_COMPRESSION, emit_dictionary_deltas=True)
+        return pa.ipc.new_file(self.sink, schema, options=options)
+
+    def _close_writer(self):
+        super()._close_writer()
+        self.sink.close()
+
+    def _write(self, table):
+        self.writer.write_table(self._unify_dictionaries(table))
+
+    def _read_segment(self, path):
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+
+    def _unify_dictionaries(self, table):
+        columns = []
+        for field, column in zip(table.schema, table.columns):
+            if pa.types.is_dictionary(field.type):
+                values = column.cast(field.type.value_type).combine_chunks()
+                known = self.dictionaries.setdefault(field.name, [])
+                seen = set(known)
+                for value in pc.unique(values).drop_null().to_pylist():
+                    if value not in seen:
+                        known.append(value)
+                        seen.add(value)
+                dictionary = pa.array(known, type=field.type.value_type)
+                indices = pc.index_in(values, value_set=dictionary).cast(pa.int32())
+                column = pa.DictionaryArray.from_arrays(indices, dictionary)
+            columns.append(column)
+        return pa.Table.from_arrays(columns, schema=table.schema)
+
+
+_BATCH_WRITERS = {
+    "csv": _CsvBatchWriter,
+    "ndjson": _NdjsonBatchWriter,
+    "parquet": _ParquetBatchWriter,
+    "arrow": _ArrowBatchWriter,
+}
+
+
+class ExportJob:
+    """A background full-result export streaming a query to a file on disk"""
+
+    def __init__(self, fmt, path):
+        self.id = uuid.uuid4().hex
+        self.fmt = fmt
+        self.path = path
+        self.status = "pending"  # pending | running | done | failed
+        self.processed = 0
+        self.total = None
+        self.error = None
+        self.started_at = datetime.now()
+        self.finished_at = None
+
+    @property
+    def progress(self):
+        """Fraction complete (0-1), or None when the total is unknown"""
+        if self.status == "done":
+            return 1.0
+        if not self.total:
+            return None
+        return min(self.processed / self.total, 1.0)
+
+    @property
+    def file_size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def run(self, cursor_factory, hidden_columns, batch_size, count_fn=None):
+        """Stream every cursor from cursor_factory into the export file"""
+        self.status = "running"
+        writer = None
+        try:
+            if count_fn is not None:
+                try:
+                    self.total = count_fn()
+                except Exception:
+                    # Progress is shown without a total - no reason to fail the export
+                    self.total = None
+            writer = _BATCH_WRITERS[self.fmt](self.path, hidden_columns)
+            batch = []
+            for source_collection, cursor in cursor_factory():
+                for doc in cursor:
+                    if source_collection:
+                        doc["_source_collection"] = source_collection
+                    batch.append(doc)
+                    if len(batch) >= batch_size:
+                        writer.write_batch(batch)
+                        self.processed += len(batch)
+                        batch = []
+            if batch:
+                writer.write_batch(batch)
+                self.processed += len(batch)
+            writer.close()
+            writer = None
+            self.status = "done"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            if writer is not None:
+                try:
+                    writer.close()
+                except Exception:
+                    pass
+        finally:
+            self.finished_at = datetime.now()
+
+
+def cleanup_old_exports(export_dir, max_age_hours):
+    """Delete finished export files older than max_age_hours"""
+    if not os.path.isdir(export_dir):
+        return
+    cutoff = time.time() - max_age_hours * 3600
+    for name in os.listdir(export_dir):
+        path = os.path.join(export_dir, name)
+        try:
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+    with _export_jobs_lock:
+        for job_id, job in list(_export_jobs.items()):
+            if job.status in ("done", "failed") and not os.path.exists(job.path):
+                del _export_jobs[job_id]
+
+
+def start_export_job(cursor_factory, fmt, export_dir, hidden_columns=(), batch_size=5000, count_fn=None):
+    """
+    Start a background export that streams a full query result to disk.
+
+    Args:
+        cursor_factory: Callable returning an iterable of (source_collection, cursor)
+        fmt: One of FULL_EXPORT_FORMATS
+        export_dir: Directory where the export file is written
+        hidden_columns: Internal columns to leave out of the file
+        batch_size: Number of documents buffered per write
+        count_fn: Optional callable returning the expected record count (for progress)
+
+    Returns:
+        The ExportJob (poll it with get_export_job)
+    """
+    if fmt not in FULL_EXPORT_FORMATS:
+        raise ValueError(f"Unsupported full export format: {fmt}")
+    os.makedirs(export_dir, exist_ok=True)
+    job = ExportJob(fmt, None)
+    job.path = os.path.join(export_dir, f"fms_full_{job.id}.{EXPORT_FORMATS[fmt]['extension']}")
+    with _export_jobs_lock:
+        _export_jobs[job.id] = job
+    thread = threading.Thread(
+        target=job.run,
+        args=(cursor_factory, set(hidden_columns), batch_size, count_fn),
+        name=f"export-{job.id[:8]}",
+        daemon=True,
+    )
+    thread.start()
+    return job
+
+
+def get_export_job(job_id):
+    """Look up a background export job by id (None if unknown or cleaned up)"""
+    with _export_jobs_lock:
+        return _export_jobs.get(job_id)
+
+
+def read_export_file(path):
+    """
+    Read a finished export file for its download button's deferred data
+    callback, so it is only read when the download is clicked (Streamlit
+    buffers the clicked download in memory either way). The file is closed
+    once read.
+    """
+    with open(path, "rb") as f:
+        return f.read()
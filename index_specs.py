@@ -0,0 +1,396 @@
+# Index specifications for FMS collections
+# Declares the indexes every collection should have and applies them
+# idempotently. Used by the data loader (before writing) and at app startup.
+#
+# Each spec is a dict with:
+#   keys    - list of (field, direction) pairs
+#   name    - optional; defaults to pymongo's "field_1_other_-1" naming
+#   options - optional create_index options: unique, collation,
+#             partialFilterExpression, expireAfterSeconds
+#
+# Every collection also gets a unique index on its natural key
+# (config.NATURAL_KEYS, used by the loader's upserts) and an index on
+# _contentHash (the loader's change detection). Only when the loader is run
+# with --dedupe-natural-keys are documents that already share a natural key
+# deleted (newest kept) before that index is built, and an index built for
+# an older configured key rebuilt; otherwise both are reported. Time-series collections
+# (config.TIMESERIES_COLLECTIONS) are loaded by date range instead and use
+# TIMESERIES_INDEX_SPECS - they can't have unique indexes.
+#
+# With config.MULTI_TENANT the tenant key leads the natural key and every
+# index, so each tenant's queries read a contiguous range of each index.
+#
+# The loader's internal collections (run journal, dead letters) are listed in
+# INTERNAL_INDEX_SPECS and expire old entries with TTL indexes.
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+import config
+
+# Name of the loader's unique natural key index
+NATURAL_KEY_INDEX = "natural_key"
+
+# Indexes earlier specs created that no query can use, dropped when indexes
+# are ensured. The case-insensitive collation indexes on names only serve
+# queries passing the same collation, and the app matches names with
+# case-insensitive $regex instead (see make_case_insensitive in app.py).
+RETIRED_INDEXES = {"companyName_ci", "name_ci"}
+
+_CUSTOMER_INDEXES = [
+    {"keys": [("serviceAddressState", ASCENDING)]},
+    {"keys": [("serviceContractStatus", ASCENDING)]},
+]
+
+INDEX_SPECS = {
+    "leads": [
+        {"keys": [("serviceAddressState", ASCENDING)]},
+        {"keys": [("status", ASCENDING)]},
+        {"keys": [("businessLocationDateCreated", DESCENDING)]},
+    ],
+    "proposals": [
+        {"keys": [("serviceAddressState", ASCENDING)]},
+        {"keys": [("proposalStatus", ASCENDING), ("proposedDate", DESCENDING)]},
+        {"keys": [("proposedDate", DESCENDING)]},
+    ],
+    "ServiceContracts": [
+        {"keys": [("companyState", ASCENDING)]},
+        {"keys": [("status", ASCENDING), ("startDate", DESCENDING)]},
+        {"keys": [("customerKey", ASCENDING)]},
+    ],
+    "rfps": [
+        {"keys": [("status", ASCENDING)]},
+        {"keys": [("lastUpdated", DESCENDING)]},
+        {"keys": [("dateCreated", DESCENDING)]},
+        # Most rfps are still open - only index the completed ones
+        {
+            "keys": [("completedDate", DESCENDING)],
+            "options": {"partialFilterExpression": {"completedDate": {"$type": "date"}}},
+        },
+    ],
+    "customers_activation": _CUSTOMER_INDEXES,
+    "customers_active": _CUSTOMER_INDEXES,
+    "customers_suspended": _CUSTOMER_INDEXES,
+    "customers_terminated": _CUSTOMER_INDEXES,
+    "serviceproviders": [
+        {"keys": [("address.state", ASCENDING)]},
+        {"keys": [("activeState", ASCENDING)]},
+    ],
+    "spusers": [
+        {"keys": [("username", ASCENDING)]},
+        {"keys": [("email", ASCENDING)]},
+    ],
+    "inspection_dashboard": [
+        {"keys": [("userName", ASCENDING)]},
+    ],
+    "UsersInspection": [
+        {"keys": [("_role", ASCENDING)]},
+    ],
+    "GeneralLedger": [
+        {"keys": [("transactionDate", ASCENDING)]},
+        {"keys": [("transactionType", ASCENDING), ("transactionDate", ASCENDING)]},
+        # Rows carry either a customer or a service provider
+        {
+            "keys": [("customer.id", ASCENDING)],
+            "options": {"partialFilterExpression": {"customer": {"$type": "object"}}},
+        },
+        {
+            "keys": [("serviceProvider.id", ASCENDING)],
+            "options": {"partialFilterExpression": {"serviceProvider": {"$type": "object"}}},
+        },
+    ],
+    # Reference collections (config.REFERENCE_FIELDS) - joined on "id",
+    # which the natural-key index covers
+    "accounts": [
+        {"keys": [("accountType", ASCENDING)]},
+        {"keys": [("acctNum", ASCENDING)]},
+    ],
+    "invoices": [
+        {"keys": [("postedDate", DESCENDING)]},
+    ],
+    "rfp_proposals": [
+        {"keys": [("status", ASCENDING)]},
+        {"keys": [("businessLocationId", ASCENDING)]},
+    ],
+}
+
+# Time-series layout - the time field itself is covered by the bucket index
+TIMESERIES_INDEX_SPECS = {
+    "GeneralLedger": [
+        {"keys": [("ledger.transactionType", ASCENDING), ("transactionDate", ASCENDING)]},
+        {"keys": [("ledger.creditAccountId", ASCENDING), ("transactionDate", ASCENDING)]},
+        {"keys": [("ledger.debitAccountId", ASCENDING), ("transactionDate", ASCENDING)]},
+        {"keys": [("customer.id", ASCENDING), ("transactionDate", ASCENDING)]},
+        {"keys": [("serviceProvider.id", ASCENDING), ("transactionDate", ASCENDING)]},
+    ],
+}
+
+DAY_SECONDS = 24 * 60 * 60
+
+INTERNAL_INDEX_SPECS = {
+    config.RUNS_COLLECTION: [
+        {"keys": [("kind", ASCENDING), ("startedAt", DESCENDING)]},
+        {"keys": [("startedAt", ASCENDING)], "options": {"expireAfterSeconds": config.RUN_JOURNAL_TTL_DAYS * DAY_SECONDS}},
+    ],
+    config.RUN_UNITS_COLLECTION: [
+        {"keys": [("run", ASCENDING), ("unit", ASCENDING)], "options": {"unique": True}},
+        {"keys": [("updatedAt", ASCENDING)], "options": {"expireAfterSeconds": config.RUN_JOURNAL_TTL_DAYS * DAY_SECONDS}},
+    ],
+    config.DEAD_LETTERS_COLLECTION: [
+        {"keys": [("collection", ASCENDING), ("failedAt", ASCENDING)]},
+        {"keys": [("failedAt", ASCENDING)], "options": {"expireAfterSeconds": config.DEAD_LETTER_TTL_DAYS * DAY_SECONDS}},
+    ],
+}
+
+
+# Range loads delete a time-series collection's documents by their time
+# field, which MongoDB only allows from 7.0 (5.x/6.x only delete on the
+# metaField). Older servers fall back to the regular layout.
+TIMESERIES_MIN_SERVER_VERSION = (7, 0)
+_server_supports_timeseries = True
+
+
+def check_timeseries_support(client):
+    """
+    Check the server version once per process (the loader's and the app's
+    client) and fall back to the regular layout for the time-series
+    collections (see is_timeseries_layout) on servers older than
+    TIMESERIES_MIN_SERVER_VERSION. An unreachable server changes nothing.
+
+    Returns:
+        True if the time-series layout can be used
+    """
+    global _server_supports_timeseries
+    try:
+        version = tuple(client.server_info()["versionArray"][:2])
+    except (PyMongoError, KeyError):
+        return _server_supports_timeseries
+    _server_supports_timeseries = version >= TIMESERIES_MIN_SERVER_VERSION
+    if config.USE_TIMESERIES and not _server_supports_timeseries:
+        print(
+            f"⚠️ MongoDB {'.'.join(map(str, version))} can't replace time-series date ranges "
+            f"(needs {'.'.join(map(str, TIMESERIES_MIN_SERVER_VERSION))}+) - using regular collections"
+        )
+    return _server_supports_timeseries
+
+
+def is_timeseries_layout(collection_name):
+    """True if a collection is stored as a time-series collection (configured and supported by the server)"""
+    return config.USE_TIMESERIES and _server_supports_timeseries and collection_name in config.TIMESERIES_COLLECTIONS
+
+
+def tenant_key_field(collection_name):
+    """
+    Field holding the tenant key in a collection's indexes and tenant filters
+    (None unless config.MULTI_TENANT). Time-series collections keep it in
+    their metaField, which MongoDB groups buckets by.
+    """
+    if not config.MULTI_TENANT:
+        return None
+    if is_timeseries_layout(collection_name):
+        return f"{config.TIMESERIES_COLLECTIONS[collection_name]['metaField']}.{config.TENANT_FIELD}"
+    return config.TENANT_FIELD
+
+
+def natural_key_fields(collection_name):
+    """A collection's natural key (config.NATURAL_KEYS), led by the tenant key when multi-tenant"""
+    fields = list(config.NATURAL_KEYS[collection_name])
+    return [config.TENANT_FIELD] + fields if config.MULTI_TENANT else fields
+
+
+def index_name(spec):
+    """Name of a spec's index (pymongo's default naming unless given)"""
+    return spec.get("name") or "_".join(f"{field}_{direction}" for field, direction in spec["keys"])
+
+
+def get_index_specs(collection_name):
+    """All desired indexes for a collection, including the loader's indexes"""
+    if collection_name in INTERNAL_INDEX_SPECS:
+        return list(INTERNAL_INDEX_SPECS[collection_name])
+    tenant_field = tenant_key_field(collection_name)
+    loader_specs = []
+    if is_timeseries_layout(collection_name):
+        specs = list(TIMESERIES_INDEX_SPECS.get(collection_name, []))
+    else:
+        specs = list(INDEX_SPECS.get(collection_name, []))
+        if collection_name in config.NATURAL_KEYS:
+            loader_specs.append({
+                "keys": [(field, ASCENDING) for field in natural_key_fields(collection_name)],
+                "name": NATURAL_KEY_INDEX,
+                "options": {"unique": True},
+            })
+            loader_specs.append({"keys": [("_contentHash", ASCENDING)]})
+    if tenant_field:
+        specs = [dict(spec, keys=[(tenant_field, ASCENDING)] + spec["keys"]) for spec in specs]
+    return loader_specs + specs
+
+
+def _matches(spec, info):
+    """True if an existing index (index_information() entry) matches a spec"""
+    if [tuple(k) for k in info["key"]] != [tuple(k) for k in spec["keys"]]:
+        return False
+    options = spec.get("options", {})
+    if bool(info.get("unique")) != bool(options.get("unique")):
+        return False
+    if info.get("partialFilterExpression") != options.get("partialFilterExpression"):
+        return False
+    if info.get("expireAfterSeconds") != options.get("expireAfterSeconds"):
+        return False
+    collation = options.get("collation")
+    existing_collation = info.get("collation")
+    if collation is None or existing_collation is None:
+        return collation is None and existing_collation is None
+    return all(existing_collation.get(k) == v for k, v in collation.items())
+
+
+def dedupe_natural_keys(collection, key_fields, batch_size=1000):
+    """
+    Delete documents that share a natural key, keeping the newest of each
+    (latest _importedAt, then _id). Needed once before the unique natural
+    key index can be built on a collection loaded without it.
+
+    Returns:
+        Number of documents deleted
+    """
+    pipeline = [
+        {"$sort": {"_importedAt": DESCENDING, "_id": DESCENDING}},
+        {"$group": {
+            # Positional names - group keys can't contain the dots of nested paths
+            "_id": {f"k{i}": f"${field}" for i, field in enumerate(key_fields)},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    deleted = 0
+    stale = []
+    for group in collection.aggregate(pipeline, allowDiskUse=True):
+        stale.extend(group["ids"][1:])
+        if len(stale) >= batch_size:
+            deleted += collection.delete_many({"_id": {"$in": stale}}).deleted_count
+            stale = []
+    if stale:
+        deleted += collection.delete_many({"_id": {"$in": stale}}).deleted_count
+    return deleted
+
+
+def _rebuild_natural_key(collection, spec):
+    """
+    Replace an outdated natural key index without a window in which the
+    collection has no unique key: the new key is first enforced by a
+    stand-in index (last field descending - a different key pattern with the
+    same uniqueness), then the old index is swapped for the new one.
+    """
+    options = spec.get("options", {})
+    stand_in = NATURAL_KEY_INDEX + "_rebuild"
+    keys = spec["keys"][:-1] + [(spec["keys"][-1][0], DESCENDING)]
+    collection.create_index(keys, name=stand_in, background=True, **options)
+    collection.drop_index(NATURAL_KEY_INDEX)
+    collection.create_index(spec["keys"], name=NATURAL_KEY_INDEX, background=True, **options)
+    collection.drop_index(stand_in)
+
+
+def _create_index(collection, name, spec, existing, dedupe=False):
+    """
+    Create a spec's index. With dedupe, documents sharing a natural key are
+    deleted (newest kept) before the natural key index is built, and an
+    existing natural key index with another definition is rebuilt.
+    """
+    detail = ""
+    if name == NATURAL_KEY_INDEX and dedupe:
+        deleted = dedupe_natural_keys(collection, [field for field, _ in spec["keys"]])
+        if deleted:
+            detail = f"removed {deleted} duplicate(s)"
+        if name in existing:
+            _rebuild_natural_key(collection, spec)
+            return detail
+    # background is ignored by MongoDB 4.2+, which never blocks
+    # the collection for the whole build
+    collection.create_index(spec["keys"], name=name, background=True, **spec.get("options", {}))
+    return detail
+
+
+def ensure_collection_indexes(collection, collection_name=None, create=True, dedupe=False):
+    """
+    Compare a collection's indexes with its specs and create missing ones.
+
+    Args:
+        collection: pymongo Collection (may be a staging copy)
+        collection_name: Collection whose specs apply (default collection.name)
+        create: Create missing indexes (False only reports)
+        dedupe: Delete documents sharing a natural key before building its
+            unique index, and rebuild a natural key index with a different
+            definition. Deletes data - only the loader's explicit
+            --dedupe-natural-keys passes it, never the app.
+
+    Returns:
+        List of dicts with collection, index, keys, status and detail.
+        status is "ok", "created", "missing" (create=False), "conflict"
+        (same name, different definition - left alone unless dedupe
+        rebuilds the natural key), "failed" (e.g. duplicates block a unique
+        index), "extra" (exists but not in the specs) or "dropped" (one of
+        RETIRED_INDEXES).
+    """
+    collection_name = collection_name or collection.name
+    existing = collection.index_information()
+    report = []
+    desired_names = set()
+
+    for spec in get_index_specs(collection_name):
+        name = index_name(spec)
+        desired_names.add(name)
+        row = {"collection": collection.name, "index": name, "keys": spec["keys"], "detail": ""}
+        if name in existing and _matches(spec, existing[name]):
+            row["status"] = "ok"
+        elif name in existing and (name != NATURAL_KEY_INDEX or not create or not dedupe):
+            row["status"] = "conflict"
+            if name == NATURAL_KEY_INDEX:
+                row["detail"] = "rebuild it with upload_to_mongodb.py --dedupe-natural-keys"
+        elif not create:
+            row["status"] = "missing"
+        else:
+            try:
+                row["detail"] = _create_index(collection, name, spec, existing, dedupe)
+                row["status"] = "created"
+            except PyMongoError as e:
+                row["status"] = "failed"
+                row["detail"] = str(e)
+        report.append(row)
+
+    for name, info in existing.items():
+        if name == "_id_" or name in desired_names:
+            continue
+        row = {"collection": collection.name, "index": name, "keys": info["key"], "status": "extra", "detail": ""}
+        if name in RETIRED_INDEXES and create:
+            try:
+                collection.drop_index(name)
+                row["status"] = "dropped"
+            except PyMongoError as e:
+                row["status"] = "failed"
+                row["detail"] = str(e)
+        report.append(row)
+    return report
+
+
+def ensure_indexes(db, collections=None, create=True):
+    """
+    Apply the index specs to the given collections (default config.COLLECTIONS).
+    Collections that don't exist yet are reported and left for the loader,
+    so no empty collections are created.
+
+    Returns:
+        Combined report (see ensure_collection_indexes)
+    """
+    report = []
+    try:
+        existing = set(db.list_collection_names())
+    except PyMongoError as e:
+        return [{"collection": "*", "index": "*", "keys": [], "status": "failed", "detail": str(e)}]
+    for collection_name in collections or config.COLLECTIONS:
+        if collection_name not in existing:
+            report.append({"collection": collection_name, "index": "*", "keys": [], "status": "no collection", "detail": ""})
+            continue
+        try:
+            report.extend(ensure_collection_indexes(db[collection_name], collection_name, create))
+        except PyMongoError as e:
+            report.append({"collection": collection_name, "index": "*", "keys": [], "status": "failed", "detail": str(e)})
+    return report
@@ -0,0 +1,218 @@
+# Result history for FMS Query Engine sessions
+# Keeps recent query results per session within a memory budget, spilling
+# older results to compressed pickle snapshots on local disk
+
+import os
+import json
+import pickle
+import shutil
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+import pyarrow as pa
+from exports import COLUMNAR_COMPRESSION
+
+# All live histories in this process, for process-level accounting and eviction
+_histories = weakref.WeakValueDictionary()
+_lock = threading.RLock()
+
+
+def frame_memory_bytes(df, sample_size=100):
+    """
+    Approximate in-memory size of a DataFrame.
+
+    pandas' deep memory usage only counts the outer container of nested
+    documents, so columns holding dicts/lists are estimated from the
+    serialized size of a sample of their values.
+    """
+    if df is None:
+        return 0
+    usage = df.memory_usage(index=True, deep=True)
+    total = int(usage.sum())
+    for column in df.columns:
+        if df[column].dtype != object:
+            continue
+        sample = [v for v in df[column].head(sample_size) if isinstance(v, (dict, list))]
+        if sample:
+            avg_size = sum(len(json.dumps(v, default=str)) for v in sample) / len(sample)
+            nested_share = len(sample) / min(len(df), sample_size)
+            total += int(avg_size * nested_share * len(df))
+    return total
+
+
+class HistoryEntry:
+    """A stored query result - held in memory or spilled to disk"""
+
+    def __init__(self, entry_id, df, meta):
+        self.id = entry_id
+        self.meta = meta
+        self.df = df
+        self.memory_bytes = frame_memory_bytes(df)
+        self.spill_path = None
+        self.disk_bytes = 0
+        self.last_access = time.monotonic()
+
+    @property
+    def spilled(self):
+        return self.df is None and self.spill_path is not None
+
+
+class ResultHistory:
+    """
+    LRU store of a session's query results with a byte budget.
+
+    Results over the session budget (or the process-wide budget) are spilled,
+    least recently used first, to zstd-compressed pickles of the DataFrame
+    and reloaded transparently by get(), dtypes, nested documents and mixed
+    value types intact. At most max_entries results are kept at all.
+    """
+
+    def __init__(self, budget_bytes, spill_dir, max_entries=20, process_budget_bytes=None, label=None):
+        self.id = uuid.uuid4().hex
+        self.label = label or self.id[:8]
+        self.budget_bytes = budget_bytes
+        self.process_budget_bytes = process_budget_bytes
+        self.max_entries = max_entries
+        self.spill_dir = os.path.join(spill_dir, self.id)
+        self.entries = OrderedDict()  # Least recently used first
+        with _lock:
+            _histories[self.id] = self
+        # Remove spilled files when the session's history is garbage collected
+        weakref.finalize(self, shutil.rmtree, self.spill_dir, True)
+
+    @property
+    def memory_bytes(self):
+        return sum(e.memory_bytes for e in self.entries.values() if e.df is not None)
+
+    @property
+    def disk_bytes(self):
+        return sum(e.disk_bytes for e in self.entries.values() if e.spilled)
+
+    def add(self, entry_id, df, meta):
+        """Store a result as the most recent entry, evicting older ones as needed"""
+        with _lock:
+            self.entries[entry_id] = HistoryEntry(entry_id, df, meta)
+            self.entries.move_to_end(entry_id)
+            while len(self.entries) > self.max_entries:
+                _, dropped = self.entries.popitem(last=False)
+                self._delete_spill(dropped)
+            self._enforce_budgets(keep=entry_id)
+
+    def get(self, entry_id):
+        """Get a result's DataFrame, reloading it from disk if it was spilled"""
+        with _lock:
+            entry = self.entries.get(entry_id)
+            if entry is None:
+                return None
+            if entry.spilled:
+                with pa.CompressedInputStream(entry.spill_path, COLUMNAR_COMPRESSION) as f:
+                    entry.df = pickle.load(f)
+                entry.memory_bytes = frame_memory_bytes(entry.df)
+                self._delete_spill(entry)
+            entry.last_access = time.monotonic()
+            self.entries.move_to_end(entry_id)
+            self._enforce_budgets(keep=entry_id)
+            return entry.df
+
+    def get_meta(self, entry_id):
+        entry = self.entries.get(entry_id)
+        return entry.meta if entry else None
+
+    def list_entries(self):
+        """Entries newest first, as (entry_id, meta, spilled)"""
+        with _lock:
+            return [(e.id, e.meta, e.spilled) for e in reversed(self.entries.values())]
+
+    def clear(self):
+        with _lock:
+            for entry in self.entries.values():
+                self._delete_spill(entry)
+            self.entries.clear()
+
+    def _spill(self, entry):
+        """Write an in-memory entry to a compressed snapshot and drop the frame"""
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"{entry.id}.pkl.zst")
+        with pa.CompressedOutputStream(path, COLUMNAR_COMPRESSION) as f:
+            pickle.dump(entry.df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        entry.spill_path = path
+        entry.disk_bytes = os.path.getsize(path)
+        entry.df = None
+        entry.memory_bytes = 0
+
+    def _delete_spill(self, entry):
+        if entry.spill_path:
+            try:
+                os.remove(entry.spill_path)
+            except OSError:
+                pass
+        entry.spill_path = None
+        entry.disk_bytes = 0
+
+    def _spill_candidates(self, keep):
+        return [e for e in self.entries.values() if e.df is not None and e.id != keep and e.memory_bytes]
+
+    def _enforce_budgets(self, keep=None):
+        # Session budget - spill this session's least recently used results
+        for entry in self._spill_candidates(keep):
+            if self.memory_bytes <= self.budget_bytes:
+                break
+            self._spill(entry)
+
+        # Process budget - spill the least recently used results of any session
+        if self.process_budget_bytes:
+            while process_memory_bytes() > self.process_budget_bytes:
+                candidates = [
+                    (entry.last_access, history, entry)
+                    for history in list(_histories.values())
+                    for entry in history._spill_candidates(keep)
+                ]
+                if not candidates:
+                    break
+                _, history, entry = min(candidates, key=lambda c: c[0])
+                history._spill(entry)
+
+
+def process_memory_bytes():
+    """Total bytes held in memory by all result histories in this process"""
+    with _lock:
+        return sum(h.memory_bytes for h in list(_histories.values()))
+
+
+def get_process_rss_bytes():
+    """Current resident set size of this process (None if unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def get_history_stats():
+    """
+    Memory accounting for all result histories in this process.
+
+    Returns:
+        dict with process totals and a per-session breakdown
+    """
+    with _lock:
+        sessions = []
+        for history in list(_histories.values()):
+            entries = list(history.entries.values())
+            sessions.append({
+                "session": history.label,
+                "entries": len(entries),
+                "in_memory": sum(1 for e in entries if e.df is not None),
+                "spilled": sum(1 for e in entries if e.spilled),
+                "memory_bytes": history.memory_bytes,
+                "disk_bytes": history.disk_bytes,
+                "budget_bytes": history.budget_bytes,
+            })
+        return {
+            "sessions": sessions,
+            "memory_bytes": sum(s["memory_bytes"] for s in sessions),
+            "disk_bytes": sum(s["disk_bytes"] for s in sessions),
+            "process_rss_bytes": get_process_rss_bytes(),
+        }
@@ -0,0 +1,227 @@
+# Schema catalog for FMS collections
+# Field-level type hints used to build typed DataFrames and export schemas
+
+import pandas as pd
+
+# =============================================================================
+# FIELD TYPE HINTS
+# =============================================================================
+# Maps field names (as they appear in results) to their logical type:
+#   "date"     - date strings, "12/01/2021" (MM/DD/YYYY) or "2021-12-01" (ISO)
+#   "epoch_ms" - epoch-millisecond timestamps (e.g. 1621850300000)
+#   "amount"   - money values, sometimes sent as strings ("2500.00")
+#   "category" - low-cardinality codes and statuses
+FIELD_TYPE_HINTS = {
+    # Date strings
+    "transactionDate": "date",       # GeneralLedger
+    "createDate": "date",            # GeneralLedger
+    "startDate": "date",             # ServiceContracts
+    "serviceEndDate": "date",        # ServiceContracts
+    "dateWorkBegins": "date",        # rfps
+    "workBegins": "date",            # rfps
+    "auctionEnds": "date",           # rfps
+    # Epoch-millisecond timestamps
+    "businessLocationDateCreated": "epoch_ms",
+    "dateCreated": "epoch_ms",
+    "lastUpdated": "epoch_ms",
+    "lastContacted": "epoch_ms",
+    "proposedDate": "epoch_ms",
+    "dateAuctionEnds": "epoch_ms",
+    "inProgressDate": "epoch_ms",
+    "completedDate": "epoch_ms",
+    # Money
+    "amount": "amount",
+    "unappliedAmount": "amount",
+    "debitAmount": "amount",
+    "creditAmount": "amount",
+    "total": "amount",
+    "totalBeforeEdit": "amount",
+    "suggestedPrice": "amount",
+    "serviceAgreementAmount": "amount",
+    "serviceProviderAlloc": "amount",
+    "vendorAdvanceBalance": "amount",
+    # Categoricals
+    "serviceAddressState": "category",
+    "companyState": "category",
+    "status": "category",
+    "proposalStatus": "category",
+    "proposalStatusDescription": "category",
+    "serviceContractStatus": "category",
+    "serviceType": "category",
+    "serviceTypeDescription": "category",
+    "specialServiceOnly": "category",
+    "transactionType": "category",
+    "terminationReason": "category",
+    "activeState": "category",
+    "vendorCategory": "category",
+    "industry": "category",
+    "terms": "category",
+    "primaryFlag": "category",
+    "period": "category",
+    "_source_collection": "category",
+}
+
+# Formats tried (in order) when parsing "date" fields
+DATE_FORMATS = ["%m/%d/%Y", "%Y-%m-%d"]
+
+
+def get_field_hint(field_name):
+    """
+    Get the logical type hint for a field.
+    Nested fields ("address.state") are looked up by their last segment.
+    Returns None if the catalog has no hint for the field.
+    """
+    if field_name in FIELD_TYPE_HINTS:
+        return FIELD_TYPE_HINTS[field_name]
+    return FIELD_TYPE_HINTS.get(str(field_name).rsplit(".", 1)[-1])
+
+
+def parse_date_column(series):
+    """Parse date strings vectorized, trying each of DATE_FORMATS in turn"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    values = series.where(series.astype(str).str.strip() != "")
+    parsed = pd.to_datetime(values, format=DATE_FORMATS[0], errors="coerce")
+    for fmt in DATE_FORMATS[1:]:
+        missing = parsed.isna() & values.notna()
+        if not missing.any():
+            break
+        parsed = parsed.fillna(pd.to_datetime(values[missing], format=fmt, errors="coerce"))
+    return parsed
+
+
+def _is_scalar_column(series):
+    """True if a column holds no nested dicts/lists (safe to hash and convert)"""
+    return not series.map(lambda v: isinstance(v, (dict, list))).any()
+
+
+def _all_parsed(series, parsed):
+    """True if every non-null, non-blank value in series was converted (none coerced to NaN/NaT)"""
+    present = series.notna()
+    if series.dtype == object or pd.api.types.is_string_dtype(series):
+        present &= series.astype(str).str.strip() != ""
+    return not (parsed.isna() & present).any()
+
+
+def _has_mixed_types(series):
+    """True if a column's values are not all of one Python type (e.g. 5 and "N/A")"""
+    return series.dtype == object and len({type(v) for v in series.dropna()}) > 1
+
+
+def apply_schema_hints(df):
+    """
+    Convert result columns to their catalog types.
+
+    - "date" strings and "epoch_ms" numbers become datetime64 columns
+    - "amount" values become float64 (string amounts are parsed)
+    - "category" fields become pandas categoricals
+
+    A column is only converted when every value in it converts; a column
+    with values that don't (e.g. an "N/A" amount) is left unchanged rather
+    than losing them. Columns without a hint, holding nested documents or
+    (for categoricals) mixing value types are left unchanged too.
+
+    Args:
+        df: Result DataFrame
+
+    Returns:
+        A new DataFrame with typed columns
+    """
+    df = df.copy()
+    for column in df.columns:
+        hint = get_field_hint(column)
+        if hint is None:
+            continue
+        series = df[column]
+        if series.dtype == object and not _is_scalar_column(series):
+            continue
+        if hint == "date":
+            parsed = parse_date_column(series)
+        elif hint == "epoch_ms":
+            if pd.api.types.is_datetime64_any_dtype(series):
+                continue
+            numbers = pd.to_numeric(series, errors="coerce")
+            if not _all_parsed(series, numbers):
+                continue
+            try:
+                parsed = pd.to_datetime(numbers, unit="ms")
+            except (ValueError, OverflowError):
+                continue
+        elif hint == "amount":
+            parsed = pd.to_numeric(series, errors="coerce").astype("float64")
+        elif hint == "category":
+            if not _has_mixed_types(series):
+                df[column] = series.astype("category")
+            continue
+        else:
+            continue
+        if _all_parsed(series, parsed):
+            df[column] = parsed
+    return df
+
+
+# Object/string columns whose share of distinct values is at or below this
+# ratio are stored as categoricals even without a catalog hint
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+CATEGORY_MIN_ROWS = 20
+
+
+def _downcast_numeric(series, hint):
+    """Downcast a numeric column to the smallest dtype that holds it exactly"""
+    if pd.api.types.is_bool_dtype(series):
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        return pd.to_numeric(series, downcast="integer")
+    if pd.api.types.is_float_dtype(series) and hint != "amount":
+        # Money stays float64; other floats only shrink when no precision is lost
+        downcast = series.astype("float32")
+        if (downcast.astype("float64") == series)[series.notna()].all():
+            return downcast
+    return series
+
+
+def optimize_frame_dtypes(df):
+    """
+    Shrink a result DataFrame's memory footprint.
+
+    Applies the catalog type hints (dates, amounts, categoricals), then
+    stores other repetitive string columns as categoricals and downcasts
+    numeric columns. Nested document columns are left as they are.
+
+    Args:
+        df: Result DataFrame
+
+    Returns:
+        (optimized DataFrame, report dict with before/after bytes and
+        the dtype change of every converted column)
+    """
+    before_bytes = int(df.memory_usage(index=True, deep=True).sum())
+    optimized = apply_schema_hints(df)
+    
+    for column in optimized.columns:
+        series = optimized[column]
+        hint = get_field_hint(column)
+        if pd.api.types.is_numeric_dtype(series):
+            optimized[column] = _downcast_numeric(series, hint)
+        elif (
+            hint is None
+            and len(series) >= CATEGORY_MIN_ROWS
+            and pd.api.types.is_string_dtype(series)
+            and _is_scalar_column(series)
+            and series.nunique(dropna=True) <= len(series) * CATEGORY_MAX_UNIQUE_RATIO
+        ):
+            optimized[column] = series.astype("category")
+    
+    after_bytes = int(optimized.memory_usage(index=True, deep=True).sum())
+    changes = {
+        column: (str(df[column].dtype), str(optimized[column].dtype))
+        for column in df.columns
+        if str(df[column].dtype) != str(optimized[column].dtype)
+    }
+    report = {
+        "before_bytes": before_bytes,
+        "after_bytes": after_bytes,
+        "saved_bytes": before_bytes - after_bytes,
+        "columns": changes,
+    }
+    return optimized, report
@@ -0,0 +1,84 @@
+# Shared fixtures for the unit tests
+# Modules are imported the way the app and the data/ scripts run them: from
+# the repository root and from data/. MongoDB is replaced by mongomock and
+# the FSM API by the local stub server (data/stub_server.py).
+#
+# Usage (pip install -r tests/requirements.txt):
+#   pytest
+#   pytest tests/test_exports.py -k csv
+
+import logging
+import os
+import sys
+import threading
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "data"))
+
+# app.py runs its page setup on import; outside `streamlit run` that only
+# logs "missing ScriptRunContext" warnings
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+import mongomock
+import mongomock.collection
+
+# pymongo 4.9+ passes sort= to bulk update operations, which mongomock
+# does not accept yet
+_add_update = mongomock.collection.BulkOperationBuilder.add_update
+mongomock.collection.BulkOperationBuilder.add_update = (
+    lambda self, *args, sort=None, **kwargs: _add_update(self, *args, **kwargs)
+)
+
+
+@pytest.fixture
+def db():
+    """An empty in-memory database"""
+    return mongomock.MongoClient().get_database("fms_test")
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """An empty landing directory"""
+    path = tmp_path / "data"
+    path.mkdir()
+    return str(path)
+
+
+@pytest.fixture
+def stub_api(monkeypatch, tmp_path):
+    """
+    The stub FSM API serving the data/ samples on a free local port, with
+    paged fetches resuming from a temporary directory.
+    Yields its StubState (settings and counters can be changed in a test).
+    """
+    import fetch_engine
+    from fetch_engine import config, rate_limiter
+    from stub_server import make_server
+
+    server = make_server(port=0)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    monkeypatch.setattr(config, "FSM_API_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(rate_limiter, "rate", 0)
+    monkeypatch.setattr(fetch_engine, "PAGES_DIR", str(tmp_path / "pages"))
+    yield server.state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def tenants(monkeypatch):
+    """Two configured tenants with tenant-partitioned storage"""
+    import config
+
+    entries = [
+        {"key": "east", "tenant": "East Train-TAX", "authToken": "east-token", "franchise": "Boston"},
+        {"key": "west", "tenant": "West Train-TAX", "authToken": "west-token", "franchise": "Cleveland"},
+    ]
+    monkeypatch.setattr(config, "FSM_TENANTS", entries)
+    monkeypatch.setattr(config, "MULTI_TENANT", True)
+    return entries
@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+
+import app
+
+
+def test_export_bytes_are_serialized_once_per_result_and_format(monkeypatch):
+    calls = []
+
+    def serialize(df, fmt):
+        calls.append(fmt)
+        return fmt.encode()
+
+    monkeypatch.setattr(app, "serialize_frame", serialize)
+    app.get_export_bytes.clear()
+    df = pd.DataFrame({"name": ["a"]})
+    assert app.get_export_bytes("result-1", "csv", df) == b"csv"
+    assert app.get_export_bytes("result-1", "csv", df) == b"csv"
+    assert app.get_export_bytes("result-1", "ndjson", df) == b"ndjson"
+    assert app.get_export_bytes("result-2", "csv", df) == b"csv"
+    assert calls == ["csv", "ndjson", "csv"]
+
+
+@pytest.mark.parametrize("franchise, expected", [("Boston", ["east"]), ("All Franchises", None), ("Dover", [])])
+def test_users_see_their_franchise_tenants(monkeypatch, tenants, franchise, expected):
+    monkeypatch.setitem(app.st.session_state, "user", {"franchise": franchise})
+    assert app.get_user_tenant_filter() == expected
+
+
+def test_single_tenant_storage_has_no_tenant_filter(monkeypatch):
+    monkeypatch.setattr(app.config, "MULTI_TENANT", False)
+    assert app.get_user_tenant_filter() is None
+
+
+def test_tenant_filter_leads_the_query(tenants):
+    query = {"status": "Available"}
+    assert app.apply_tenant_filter_to_query(query, ["east"], "leads") == {
+        "$and": [{"_tenant": {"$in": ["east"]}}, query],
+    }
+    assert app.apply_tenant_filter_to_query({}, ["east"], "GeneralLedger") == {"ledger._tenant": {"$in": ["east"]}}
+    assert app.apply_tenant_filter_to_query(query, None, "leads") is query
+
+
+@pytest.mark.parametrize("result, expected", [
+    ({"success": True, "data": [{"count": 42}], "count": 1}, 42),
+    ({"success": True, "data": [], "count": 0}, None),
+    ({"success": False, "error": "Unknown operation: count"}, None),
+])
+def test_export_count_is_unknown_when_the_count_fails(monkeypatch, result, expected):
+    monkeypatch.setattr(app, "execute_query", lambda db, query_obj, user_filters=None: result)
+    assert app.count_query_records(None, {"collection": "leads", "query": {}}) == expected
+
+
+@pytest.mark.parametrize("projection, expected", [
+    (None, {"_tenant": 0, "_original": 0}),
+    ({"notes": 0}, {"notes": 0, "_tenant": 0, "_original": 0}),
+    ({"companyName": 1, "_id": 0}, {"companyName": 1, "_id": 0}),
+])
+def test_find_projections_leave_out_internal_fields(projection, expected):
+    assert app.hide_internal_fields(projection) == expected
+
+
+def test_internal_fields_are_not_returned_or_exported(db):
+    db.leads.insert_one({"companyName": "a", "_tenant": "east", "_original": {"squareFootage": "1,200"}})
+    [(_, cursor)] = app.iter_query_cursors(db, {"collection": "leads", "query": {}}, user_filters=(None, None))
+    [doc] = list(cursor)
+    assert "_tenant" not in doc and "_original" not in doc
+    assert {"_tenant", "_original"} <= set(app.HIDDEN_RESULT_COLUMNS)
@@ -0,0 +1,99 @@
+import json
+import os
+from datetime import date
+
+import pytest
+
+import config
+from backfill_general_ledger import ENDPOINT, backfill, chunk_name, fetch_chunk, month_chunks, split_chunk
+from fetch_engine import landing_paths, read_ndjson, tenant_dir
+
+
+def test_month_chunks_follow_calendar_months():
+    assert month_chunks(date(2021, 11, 15), date(2022, 2, 3)) == [
+        (date(2021, 11, 15), date(2021, 11, 30)),
+        (date(2021, 12, 1), date(2021, 12, 31)),
+        (date(2022, 1, 1), date(2022, 1, 31)),
+        (date(2022, 2, 1), date(2022, 2, 3)),
+    ]
+    assert month_chunks(date(2024, 2, 29), date(2024, 2, 29)) == [(date(2024, 2, 29), date(2024, 2, 29))]
+
+
+def test_split_chunk_halves_down_to_single_days():
+    assert split_chunk((date(2021, 12, 1), date(2021, 12, 31))) == [
+        (date(2021, 12, 1), date(2021, 12, 16)), (date(2021, 12, 17), date(2021, 12, 31)),
+    ]
+    assert split_chunk((date(2021, 12, 1), date(2021, 12, 2))) == [
+        (date(2021, 12, 1), date(2021, 12, 1)), (date(2021, 12, 2), date(2021, 12, 2)),
+    ]
+    assert split_chunk((date(2021, 12, 1), date(2021, 12, 1))) is None
+
+
+def landed_days(data_dir):
+    return sorted({row["transactionDate"] for row in read_ndjson(landing_paths(ENDPOINT, data_dir)[0])})
+
+
+def test_backfill_lands_every_day_in_order(data_dir, stub_api, tmp_path):
+    stub_api.ledger_rows_per_day = 2
+    summaries = backfill(date(2021, 11, 20), date(2022, 1, 10), workers=3, output_dir=data_dir, resume_dir=str(tmp_path))
+    assert [(s["start"], s["end"]) for s in summaries] == [
+        ("2021-11-20", "2021-11-30"), ("2021-12-01", "2021-12-31"), ("2022-01-01", "2022-01-10"),
+    ]
+    rows = list(read_ndjson(landing_paths(ENDPOINT, data_dir)[0]))
+    assert len(rows) == 52 * 2
+    assert rows[0]["transactionDate"] == "11/20/2021" and rows[-1]["transactionDate"] == "01/10/2022"
+    with open(landing_paths(ENDPOINT, data_dir)[1]) as f:
+        meta = json.load(f)
+    assert (meta["params"]["startDate"], meta["params"]["endDate"], meta["records"]) == ("11/20/2021", "1/10/2022", 104)
+    assert not os.path.exists(os.path.join(str(tmp_path), ENDPOINT + "_backfill"))
+
+
+def test_large_chunks_are_split(data_dir, stub_api, tmp_path, monkeypatch):
+    stub_api.ledger_rows_per_day = 2
+    monkeypatch.setattr(config, "FSM_LEDGER_CHUNK_MAX_ROWS", 20)
+    stats = {}
+    summaries = backfill(date(2021, 12, 1), date(2021, 12, 31), output_dir=data_dir, resume_dir=str(tmp_path), stats=stats)
+    assert stats["splits"] == 3
+    assert [(s["start"], s["end"]) for s in summaries] == [
+        ("2021-12-01", "2021-12-08"), ("2021-12-09", "2021-12-16"),
+        ("2021-12-17", "2021-12-24"), ("2021-12-25", "2021-12-31"),
+    ]
+    assert all(s["records"] <= 20 for s in summaries)
+    assert len(landed_days(data_dir)) == 31
+
+
+def test_single_days_are_never_split(data_dir, stub_api, tmp_path, monkeypatch):
+    stub_api.ledger_rows_per_day = 3
+    monkeypatch.setattr(config, "FSM_LEDGER_CHUNK_MAX_ROWS", 1)
+    summaries = backfill(date(2021, 12, 1), date(2021, 12, 2), output_dir=data_dir, resume_dir=str(tmp_path))
+    assert [s["records"] for s in summaries] == [3, 3]
+
+
+def test_saved_chunks_are_not_fetched_again(data_dir, stub_api, tmp_path):
+    stub_api.ledger_rows_per_day = 1
+    state_dir = os.path.join(str(tmp_path), ENDPOINT + "_backfill")
+    os.makedirs(state_dir)
+    december = (date(2021, 12, 1), date(2021, 12, 31))
+    fetch_chunk(december, state_dir)
+    assert os.path.exists(os.path.join(state_dir, chunk_name(december) + ".json"))
+    stub_api.reset()
+
+    backfill(date(2021, 11, 1), date(2021, 12, 31), output_dir=data_dir, resume_dir=str(tmp_path))
+    assert stub_api.stats["requests"] == 1
+    assert len(landed_days(data_dir)) == 61
+
+
+def test_chunks_are_loaded_as_they_land(db, data_dir, stub_api, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "USE_TIMESERIES", False)
+    stub_api.ledger_rows_per_day = 2
+    stats = {}
+    backfill(date(2021, 12, 1), date(2022, 1, 31), output_dir=data_dir, resume_dir=str(tmp_path), db=db, stats=stats)
+    assert stats["loaded"] == 62 * 2
+    assert db.GeneralLedger.count_documents({}) == 62 * 2
+
+
+@pytest.mark.parametrize("tenant", [None, {"key": "east", "tenant": "East", "authToken": "token", "franchise": None}])
+def test_tenants_backfill_into_their_own_directories(data_dir, stub_api, tmp_path, tenant):
+    stub_api.ledger_rows_per_day = 1
+    backfill(date(2021, 12, 1), date(2021, 12, 3), output_dir=data_dir, resume_dir=str(tmp_path), tenant=tenant)
+    assert os.path.exists(landing_paths(ENDPOINT, tenant_dir(data_dir, tenant))[0])
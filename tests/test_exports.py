@@ -0,0 +1,155 @@
+import csv
+import json
+import time
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from exports import (
+    FULL_EXPORT_FORMATS, _BATCH_WRITERS, export_file_name, read_export_file, serialize_frame, start_export_job,
+)
+
+
+def write_export(tmp_path, fmt, batches, hidden_columns=()):
+    path = str(tmp_path / f"export.{fmt}")
+    writer = _BATCH_WRITERS[fmt](path, set(hidden_columns))
+    for batch in batches:
+        writer.write_batch(batch)
+    writer.close()
+    return path
+
+
+def read_export(path, fmt):
+    if fmt == "csv":
+        with open(path, encoding="utf-8", newline="") as f:
+            return list(csv.DictReader(f))
+    if fmt == "ndjson":
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+    if fmt == "parquet":
+        return pq.read_table(path).to_pylist()
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all().to_pylist()
+
+
+@pytest.mark.parametrize("fmt", FULL_EXPORT_FORMATS)
+def test_batches_are_written_in_order(tmp_path, fmt):
+    batches = [[{"_id": i, "companyName": f"Company {i}"} for i in range(start, start + 3)] for start in (0, 3, 6)]
+    rows = read_export(write_export(tmp_path, fmt, batches), fmt)
+    assert [str(row["_id"]) for row in rows] == [str(i) for i in range(9)]
+
+
+@pytest.mark.parametrize("fmt", FULL_EXPORT_FORMATS)
+def test_hidden_columns_are_left_out(tmp_path, fmt):
+    rows = read_export(write_export(tmp_path, fmt, [[{"name": "a", "_contentHash": "x"}]], ["_contentHash"]), fmt)
+    assert "_contentHash" not in rows[0]
+
+
+@pytest.mark.parametrize("fmt", FULL_EXPORT_FORMATS)
+def test_fields_first_seen_in_a_later_batch_are_kept(tmp_path, fmt):
+    batches = [
+        [{"name": "a", "city": "Boston"}] * 2,
+        [{"name": "b", "city": "Akron", "squareFootage": 1200}],
+    ]
+    path = write_export(tmp_path, fmt, batches)
+    rows = read_export(path, fmt)
+    assert len(rows) == 3
+    assert str(rows[2]["squareFootage"]) == "1200"
+    assert rows[0].get("squareFootage") in (None, "")
+    assert not list(tmp_path.glob("*.part*"))
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+@pytest.mark.parametrize("first, later", [
+    (5, "N/A"),
+    (True, "yes"),
+])
+def test_type_drift_widens_to_strings(tmp_path, fmt, first, later):
+    batches = [[{"value": first}] * 2, [{"value": later}]]
+    rows = read_export(write_export(tmp_path, fmt, batches), fmt)
+    assert [row["value"] for row in rows] == [str(first).lower() if isinstance(first, bool) else str(first)] * 2 + [later]
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_ints_then_floats_widen_to_floats(tmp_path, fmt):
+    rows = read_export(write_export(tmp_path, fmt, [[{"amount": 5}], [{"amount": 2.5}]]), fmt)
+    assert [row["amount"] for row in rows] == [5.0, 2.5]
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_typed_columns(tmp_path, fmt):
+    batches = [[{"transactionDate": "12/01/2021", "amount": "2500.00", "status": "Available"}]]
+    path = write_export(tmp_path, fmt, batches)
+    schema = pq.read_schema(path) if fmt == "parquet" else pa.ipc.open_file(pa.memory_map(path)).schema
+    assert pa.types.is_timestamp(schema.field("transactionDate").type)
+    assert schema.field("amount").type == pa.float64()
+    assert pa.types.is_dictionary(schema.field("status").type)
+
+
+def test_arrow_dictionaries_grow_across_batches(tmp_path):
+    batches = [[{"status": "Available"}], [{"status": "Proposed"}], [{"status": "Available"}]]
+    rows = read_export(write_export(tmp_path, "arrow", batches), "arrow")
+    assert [row["status"] for row in rows] == ["Available", "Proposed", "Available"]
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_empty_export_is_a_valid_file(tmp_path, fmt):
+    assert read_export(write_export(tmp_path, fmt, []), fmt) == []
+
+
+def test_export_job_streams_cursors(tmp_path):
+    def cursors():
+        yield "leads", iter([{"name": "a"}, {"name": "b"}])
+        yield "proposals", iter([{"name": "c"}])
+
+    job = start_export_job(cursors, "ndjson", str(tmp_path), batch_size=2, count_fn=lambda: 3)
+    deadline = time.monotonic() + 10
+    while job.status not in ("done", "failed") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.status == "done"
+    assert job.processed == 3
+    assert [row["_source_collection"] for row in read_export(job.path, "ndjson")] == ["leads", "leads", "proposals"]
+
+
+@pytest.mark.parametrize("fmt", ["csv", "json", "ndjson", "parquet", "arrow"])
+def test_serialize_frame(fmt):
+    data = serialize_frame(pd.DataFrame({"name": ["a", "b"], "amount": [1.5, 2.0]}), fmt)
+    assert isinstance(data, bytes) and data
+
+
+def test_serialized_text_formats():
+    df = pd.DataFrame({"name": ["a", "b"], "created": pd.to_datetime(["2025-01-01", "2025-01-02"])})
+    assert serialize_frame(df, "csv").decode().splitlines()[0] == "name,created"
+    assert [row["name"] for row in json.loads(serialize_frame(df, "json"))] == ["a", "b"]
+    lines = serialize_frame(df, "ndjson").decode().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["created"].startswith("2025-01-01T")
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        serialize_frame(pd.DataFrame(), "xlsx")
+
+
+def test_export_file_name():
+    assert export_file_name("ndjson", datetime(2025, 1, 2, 3, 4, 5)) == "fms_results_20250102_030405.ndjson"
+
+
+def test_read_export_file(tmp_path):
+    path = write_export(tmp_path, "ndjson", [[{"name": "a"}]])
+    assert json.loads(read_export_file(path)) == {"name": "a"}
+
+
+def test_failed_count_does_not_fail_the_export(tmp_path):
+    def count():
+        raise KeyError("count")
+
+    job = start_export_job(lambda: [("leads", iter([{"name": "a"}]))], "ndjson", str(tmp_path), count_fn=count)
+    deadline = time.monotonic() + 10
+    while job.status not in ("done", "failed") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.status == "done"
+    assert job.total is None and job.processed == 1
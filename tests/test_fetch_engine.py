@@ -0,0 +1,232 @@
+import io
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+import requests
+
+import fetch_engine
+from endpoints import ENDPOINTS, RECORD_SET_FIELD
+from fetch_engine import (
+    RateLimiter, _load_saved_pages, _retry_delay, build_request, config, fetch_all_pages, fetch_endpoint,
+    iter_records, landing_paths, open_response, read_ndjson, write_ndjson,
+)
+from ingest import run_ingestion
+
+
+def test_every_endpoint_is_complete():
+    for name, endpoint in ENDPOINTS.items():
+        assert endpoint["method"] in ("GET", "POST"), name
+        assert endpoint["path"].startswith("/api/"), name
+        assert endpoint["output"].endswith(".ndjson.gz"), name
+        assert endpoint["collection"] in config.COLLECTIONS, name
+        if endpoint.get("watermark"):
+            assert endpoint["pagination"] == "skip_take", name
+
+
+def test_post_request_carries_the_payload():
+    request = build_request(ENDPOINTS["leads"])
+    assert request["method"] == "POST"
+    assert request["url"] == config.FSM_API_BASE_URL.rstrip("/") + "/api/grid-data/leads"
+    assert request["json"] == ENDPOINTS["leads"]["payload"]
+    assert request["params"] == ENDPOINTS["leads"]["params"]
+    assert "headers" not in request
+
+
+def test_tenant_request_uses_its_credentials():
+    tenant = {"key": "boston", "tenant": "Boston Train-TAX", "authToken": "secret"}
+    request = build_request(ENDPOINTS["leads"], payload={"take": 1}, tenant=tenant)
+    assert request["json"] == {"take": 1}
+    assert request["headers"] == {"x-tenant": "Boston Train-TAX"}
+    assert request["cookies"] == {"AUTH-TOKEN": "secret"}
+
+
+# The general ledger report is generated per day of its range (see test_backfill_general_ledger.py)
+@pytest.mark.parametrize("name", [n for n, e in ENDPOINTS.items() if not e["pagination"] and n != "general_ledger"])
+def test_unpaged_endpoints_land_every_record(stub_api, data_dir, name):
+    result = fetch_endpoint(name, data_dir)
+    records_path, meta_path = landing_paths(name, data_dir)
+    landed = list(read_ndjson(records_path))
+    assert result["records"] == len(landed) == stub_api.total(name)
+    with open(meta_path) as f:
+        meta = json.load(f)
+    assert (meta["endpoint"], meta["collection"], meta["records"]) == (name, ENDPOINTS[name]["collection"], len(landed))
+
+
+def test_paged_endpoint_fetches_every_page(stub_api, tmp_path):
+    stub_api.totals["leads"] = 250
+    output = str(tmp_path / "leads.ndjson.gz")
+    result = fetch_all_pages("leads", output, page_size=100, resume_dir=str(tmp_path / "pages"))
+    landed = list(read_ndjson(output))
+    assert result["records"] == len(landed) == 250
+    assert result["meta"]["totalElements"] == 250
+    assert len({record["businessLocationId"] for record in landed}) == 250
+    assert result["watermark"] == max(record["businessLocationDateCreated"] for record in landed)
+    assert stub_api.stats["requests"] == 3
+    assert not (tmp_path / "pages" / "leads").exists()
+
+
+def test_interrupted_paged_fetch_resumes_from_saved_pages(stub_api, tmp_path, monkeypatch):
+    stub_api.totals["leads"] = 250
+    output = str(tmp_path / "leads.ndjson.gz")
+    resume_dir = str(tmp_path / "pages")
+    fetch_page = fetch_engine.fetch_to_file
+
+    def fail_last_page(request, *args, **kwargs):
+        if request["json"]["skip"] == 200:
+            raise requests.exceptions.ConnectionError("connection reset")
+        return fetch_page(request, *args, **kwargs)
+
+    with monkeypatch.context() as m:
+        m.setattr(fetch_engine, "fetch_to_file", fail_last_page)
+        with pytest.raises(requests.exceptions.ConnectionError):
+            fetch_all_pages("leads", output, page_size=100, workers=1, resume_dir=resume_dir)
+    assert stub_api.stats["requests"] == 2
+
+    result = fetch_all_pages("leads", output, page_size=100, resume_dir=resume_dir)
+    assert stub_api.stats["requests"] == 3
+    assert result["records"] == 250
+    assert [r["businessLocationId"] for r in read_ndjson(output)] == [stub_api.record("leads", i)["businessLocationId"] for i in range(250)]
+
+
+def test_saved_pages_of_another_plan_are_discarded(tmp_path):
+    state_dir = str(tmp_path / "leads")
+    plan = {"page_size": 100, "params": None, "payload": {}}
+    assert _load_saved_pages(state_dir, plan) == {}
+    (tmp_path / "leads" / "page_00000.ndjson.gz").write_bytes(b"")
+    (tmp_path / "leads" / "page_00000.json").write_text(json.dumps({"records": 0, "meta": {}}))
+    assert list(_load_saved_pages(state_dir, plan)) == [0]
+    assert _load_saved_pages(state_dir, dict(plan, page_size=50)) == {}
+
+
+class FakeResponse:
+    def __init__(self, retry_after=None):
+        self.headers = {"Retry-After": retry_after} if retry_after is not None else {}
+
+
+def test_retry_delay_honours_retry_after(monkeypatch):
+    monkeypatch.setattr(config, "FSM_BACKOFF_SECONDS", 0.5)
+    assert _retry_delay(FakeResponse("3"), 0) == 3.0
+    assert 59 <= _retry_delay(FakeResponse(format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)), 0) <= 60
+    assert _retry_delay(FakeResponse(), 2) == 2.0
+    assert _retry_delay(None, 0) == 0.5
+
+
+def test_rate_limiter_spaces_requests_after_the_burst():
+    limiter = RateLimiter(rate=50, burst=2)
+    start = time.monotonic()
+    for _ in range(7):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_transient_errors_are_retried(stub_api, monkeypatch):
+    monkeypatch.setattr(config, "FSM_BACKOFF_SECONDS", 0)
+    outcomes = iter([(0, True, False), (0, True, False), (0, False, False)])
+    stub_api.draw = lambda: next(outcomes)
+    stats = {}
+    response = open_response(build_request(ENDPOINTS["spusers"]), stats)
+    response.close()
+    assert response.status_code == 200
+    assert (stats["requests"], stats["retries"]) == (3, 2)
+
+
+def test_retries_give_up_after_the_limit(stub_api, monkeypatch):
+    monkeypatch.setattr(config, "FSM_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(config, "FSM_MAX_RETRIES", 2)
+    stub_api.error_rate, stub_api.error_status, stub_api.retry_after = 1.0, 429, 0
+    stats = {}
+    with pytest.raises(requests.exceptions.HTTPError):
+        open_response(build_request(ENDPOINTS["spusers"]), stats)
+    assert (stats["requests"], stats["retries"]) == (3, 2)
+
+
+def test_ingestion_fetches_endpoints_concurrently(stub_api, data_dir):
+    names = ["spusers", "serviceproviders", "inspection_dashboard", "leads"]
+    stub_api.latency_ms = 200
+    results, elapsed = run_ingestion(names, workers=4, output_dir=data_dir)
+    assert [r["endpoint"] for r in results] == names
+    assert all(r["status"] == "ok" and r["mode"] == "full" for r in results)
+    # One after the other would take at least 4 x 200ms
+    assert elapsed < 0.6
+
+
+def test_records_are_parsed_from_the_stream_with_the_other_values_as_meta():
+    body = b'{"totalElements": 2, "content": [{"id": 1}, {"id": 2}], "summary": {"total": 3.5}}'
+    meta = {}
+    assert list(iter_records(io.BytesIO(body), "content", meta)) == [{"id": 1}, {"id": 2}]
+    assert meta == {"totalElements": 2, "summary": {"total": 3.5}}
+
+
+def test_list_responses_and_users_by_role():
+    assert list(iter_records(io.BytesIO(b'[{"id": 1}]'), None)) == [{"id": 1}]
+    body = b'{"ROLE_1": {"content": [{"id": 1}]}, "ROLE_2": {"content": [{"id": 2}, {"id": 3}]}}'
+    users = list(iter_records(io.BytesIO(body), "by_role"))
+    assert [(u["id"], u["_role"]) for u in users] == [(1, "ROLE_1"), (2, "ROLE_2"), (3, "ROLE_2")]
+
+
+def test_every_record_list_is_parsed_and_tagged_with_its_list():
+    body = b'{"onDemand": [{"id": 1}], "total": 3, "recurring": [{"id": 1}, {"id": 2, "visits": [{"day": 1}]}]}'
+    meta = {}
+    records = list(iter_records(io.BytesIO(body), ["onDemand", "recurring"], meta))
+    assert records == [
+        {"id": 1, RECORD_SET_FIELD: "onDemand"},
+        {"id": 1, RECORD_SET_FIELD: "recurring"},
+        {"id": 2, "visits": [{"day": 1}], RECORD_SET_FIELD: "recurring"},
+    ]
+    assert meta == {"total": 3}
+
+
+def test_service_contracts_land_both_record_lists(data_dir, stub_api):
+    run_ingestion(["servicecontracts"], output_dir=data_dir)
+    records_path, meta_path = landing_paths("servicecontracts", data_dir)
+    sets = Counter(r[RECORD_SET_FIELD] for r in read_ndjson(records_path))
+    assert sets == {"onDemand": 31, "recurring": 44}
+    with open(meta_path) as f:
+        meta = json.load(f)
+    assert "onDemand" not in meta and "recurring" not in meta
+
+
+def test_ndjson_landing_files_round_trip(tmp_path):
+    path = str(tmp_path / "leads.ndjson.gz")
+    records = [{"id": 1, "name": "Café"}, {"id": 2, "proposals": [{"total": 1.5}]}]
+    assert write_ndjson(path, iter(records)) == 2
+    assert list(read_ndjson(path)) == records
+    assert [p.name for p in tmp_path.iterdir()] == ["leads.ndjson.gz"]
+    # Gzip members concatenate - how paged fetches merge their pages
+    with open(path, "ab") as out, open(path, "rb") as f:
+        out.write(f.read())
+    assert list(read_ndjson(path)) == records + records
+
+
+def test_compressed_responses_are_decoded(stub_api, data_dir):
+    stub_api.gzip = True
+    stats = {}
+    assert fetch_endpoint("spusers", data_dir, stats=stats)["records"] == stub_api.total("spusers")
+    assert stub_api.stats["bytes"] == stats["bytes"]
+
+
+def test_dropped_connection_is_fetched_again(stub_api, data_dir, monkeypatch):
+    monkeypatch.setattr(config, "FSM_BACKOFF_SECONDS", 0)
+    stub_api.totals["leads"] = 500
+    stub_api.drop_rate = 0.5
+    stats = {}
+    assert fetch_endpoint("leads", data_dir, stats=stats)["records"] == 500
+    assert stats["retries"] == stub_api.stats["dropped"] > 0
+    assert sum(1 for _ in read_ndjson(landing_paths("leads", data_dir)[0])) == 500
+
+
+def test_dropped_connection_fails_the_fetch_once_out_of_retries(stub_api, data_dir, monkeypatch):
+    monkeypatch.setattr(config, "FSM_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(config, "FSM_MAX_RETRIES", 2)
+    stub_api.totals["leads"] = 500
+    stub_api.drop_rate = 1.0
+    stats = {}
+    assert fetch_endpoint("leads", data_dir, stats=stats) is None
+    assert "error" in stats
+    assert (stats["requests"], stats["retries"]) == (3, 2)
+    assert not os.path.exists(landing_paths("leads", data_dir)[0])
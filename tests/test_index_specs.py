@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+
+import config
+import index_specs
+from index_specs import (
+    check_timeseries_support, dedupe_natural_keys, ensure_collection_indexes, ensure_indexes, get_index_specs,
+    index_name, is_timeseries_layout, natural_key_fields,
+)
+
+
+def statuses(report):
+    return {row["index"]: row["status"] for row in report}
+
+
+def test_specs_include_the_loader_indexes():
+    names = [index_name(spec) for spec in get_index_specs("leads")]
+    assert names[:2] == ["natural_key", "_contentHash_1"]
+    assert "serviceAddressState_1" in names
+    natural_key = get_index_specs("leads")[0]
+    assert natural_key["options"] == {"unique": True}
+    assert natural_key["keys"] == [(field, 1) for field in natural_key_fields("leads")]
+
+
+def test_tenant_key_leads_every_index(monkeypatch):
+    monkeypatch.setattr(config, "MULTI_TENANT", True)
+    assert natural_key_fields("leads") == [config.TENANT_FIELD, "businessLocationId"]
+    for spec in get_index_specs("leads"):
+        if index_name(spec) != "_contentHash_1":
+            assert spec["keys"][0][0] == config.TENANT_FIELD
+
+
+def test_internal_collections_expire_old_entries():
+    ttl = [spec for spec in get_index_specs(config.DEAD_LETTERS_COLLECTION) if "expireAfterSeconds" in spec.get("options", {})]
+    assert ttl and ttl[0]["keys"] == [("failedAt", 1)]
+    assert all(index_name(spec) != "natural_key" for spec in get_index_specs(config.RUNS_COLLECTION))
+
+
+def test_indexes_are_created_once(db):
+    db.spusers.insert_one({"id": 1})
+    first = statuses(ensure_collection_indexes(db.spusers))
+    second = statuses(ensure_collection_indexes(db.spusers))
+    assert set(first.values()) == {"created"}
+    assert set(second.values()) == {"ok"}
+
+
+def test_report_only_mode_creates_nothing(db):
+    db.leads.insert_one({"businessLocationId": 1})
+    report = statuses(ensure_collection_indexes(db.leads, create=False))
+    assert set(report.values()) == {"missing"}
+    assert list(db.leads.index_information()) == ["_id_"]
+
+
+def test_unknown_and_conflicting_indexes_are_reported(db):
+    db.leads.create_index("squareFootage")
+    db.leads.create_index("squareFootage", name="status_1")
+    report = statuses(ensure_collection_indexes(db.leads))
+    assert report["squareFootage_1"] == "extra"
+    assert report["status_1"] == "conflict"
+
+
+def test_retired_collation_indexes_are_dropped(db):
+    db.leads.create_index("companyName", name="companyName_ci", collation={"locale": "en", "strength": 2})
+    assert statuses(ensure_collection_indexes(db.leads, create=False))["companyName_ci"] == "extra"
+    assert statuses(ensure_collection_indexes(db.leads))["companyName_ci"] == "dropped"
+    assert "companyName_ci" not in db.leads.index_information()
+
+
+def test_missing_collections_are_not_created(db):
+    report = ensure_indexes(db, ["leads"])
+    assert report == [{"collection": "leads", "index": "*", "keys": [], "status": "no collection", "detail": ""}]
+    assert "leads" not in db.list_collection_names()
+
+
+def test_dedupe_keeps_the_newest_document(db):
+    now = datetime(2025, 1, 1)
+    db.leads.insert_many([
+        {"businessLocationId": 1, "companyName": "old", "_importedAt": now - timedelta(days=1)},
+        {"businessLocationId": 1, "companyName": "new", "_importedAt": now},
+        {"businessLocationId": 2, "companyName": "only"},
+    ])
+    assert dedupe_natural_keys(db.leads, ["businessLocationId"], batch_size=1) == 1
+    assert sorted(doc["companyName"] for doc in db.leads.find()) == ["new", "only"]
+    assert dedupe_natural_keys(db.leads, ["businessLocationId"]) == 0
+
+
+def test_dedupe_groups_on_nested_fields(db):
+    db.accounts.insert_many([{"ledger": {"id": 1}, "n": i} for i in range(3)] + [{"ledger": {"id": 2}}])
+    assert dedupe_natural_keys(db.accounts, ["ledger.id"]) == 2
+    assert db.accounts.count_documents({}) == 2
+
+
+def test_duplicates_block_the_unique_index_without_dedupe(db):
+    db.leads.insert_many([{"businessLocationId": 1, "n": i} for i in range(3)])
+    report = {row["index"]: row for row in ensure_collection_indexes(db.leads)}
+    assert report["natural_key"]["status"] == "failed"
+    assert db.leads.count_documents({}) == 3
+    assert ensure_indexes(db, ["leads"]) and db.leads.count_documents({}) == 3
+
+
+def test_unique_index_is_built_after_deduplicating(db):
+    db.leads.insert_many([{"businessLocationId": 1, "n": i} for i in range(3)])
+    report = {row["index"]: row for row in ensure_collection_indexes(db.leads, dedupe=True)}
+    assert report["natural_key"]["status"] == "created"
+    assert report["natural_key"]["detail"] == "removed 2 duplicate(s)"
+    assert db.leads.count_documents({}) == 1
+
+
+def test_changed_natural_key_is_only_reported_without_dedupe(db):
+    db.leads.insert_many([{"businessLocationId": 1, "amount": 1}, {"businessLocationId": 1, "amount": 2}])
+    db.leads.create_index([("businessLocationId", 1), ("amount", 1)], name="natural_key", unique=True)
+    report = {row["index"]: row for row in ensure_collection_indexes(db.leads)}
+    assert report["natural_key"]["status"] == "conflict"
+    assert "--dedupe-natural-keys" in report["natural_key"]["detail"]
+    assert db.leads.count_documents({}) == 2
+
+
+def test_changed_natural_key_is_rebuilt(db, monkeypatch):
+    db.leads.insert_many([{"businessLocationId": 1, "amount": 1}, {"businessLocationId": 1, "amount": 2}])
+    db.leads.create_index([("businessLocationId", 1), ("amount", 1)], name="natural_key", unique=True)
+    unique_keys = []
+    drop_index = type(db.leads).drop_index
+
+    def recording_drop_index(self, name, **kwargs):
+        drop_index(self, name, **kwargs)
+        unique_keys.append(sorted(n for n, info in self.index_information().items() if info.get("unique")))
+
+    monkeypatch.setattr(type(db.leads), "drop_index", recording_drop_index)
+    assert statuses(ensure_collection_indexes(db.leads, dedupe=True))["natural_key"] == "created"
+    assert db.leads.index_information()["natural_key"]["key"] == [("businessLocationId", 1)]
+    assert "natural_key_rebuild" not in db.leads.index_information()
+    assert db.leads.count_documents({}) == 1
+    # A unique natural key is in place throughout the rebuild
+    assert all(unique_keys)
+
+
+@pytest.mark.parametrize("version, supported", [([6, 0, 14, 0], False), ([7, 0, 2, 0], True)])
+def test_time_series_layout_needs_mongodb_7(monkeypatch, version, supported):
+    monkeypatch.setattr(index_specs, "_server_supports_timeseries", True)
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(client, "server_info", lambda: {"versionArray": version})
+    assert check_timeseries_support(client) is supported
+    assert is_timeseries_layout("GeneralLedger") is (supported and config.USE_TIMESERIES)
@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pytest
+
+from normalize import normalize_record, normalize_records, to_date, to_epoch_date, to_id_list, to_number
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("12/01/2021", datetime(2021, 12, 1)),
+    ("2021-12-01", datetime(2021, 12, 1)),
+    (" 2021-12-01 ", datetime(2021, 12, 1)),
+    ("", None),
+    ("soon", "soon"),
+    (None, None),
+])
+def test_to_date(value, expected):
+    assert to_date(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    (1621850300000, datetime(2021, 5, 24, 9, 58, 20)),
+    (0, datetime(1970, 1, 1)),
+    (True, True),
+    ("1621850300000", "1621850300000"),
+    (None, None),
+])
+def test_to_epoch_date(value, expected):
+    assert to_epoch_date(value) == expected
+
+
+@pytest.mark.parametrize("value", [10**20, -10**20, float("inf")])
+def test_out_of_range_epochs_keep_the_raw_value(value):
+    assert to_epoch_date(value) == value
+
+
+def test_nan_epoch_keeps_the_raw_value():
+    value = float("nan")
+    assert to_epoch_date(value) is value
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2500.00", 2500.0),
+    ("1,250.50", 1250.5),
+    ("", None),
+    ("N/A", "N/A"),
+    (12, 12),
+])
+def test_to_number(value, expected):
+    assert to_number(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("12,15, 31", [12, 15, 31]),
+    ("", []),
+    ("12,x", [12, "x"]),
+    ([1, 2], [1, 2]),
+])
+def test_to_id_list(value, expected):
+    assert to_id_list(value) == expected
+
+
+def test_originals_are_kept_only_for_converted_fields():
+    record = normalize_record(
+        {"total": "2500.00", "totalBeforeEdit": "N/A", "proposedDate": 0},
+        {"total": "number", "totalBeforeEdit": "number", "proposedDate": "epoch_ms", "missing": "date"},
+        keep_originals=True,
+    )
+    assert record["total"] == 2500.0
+    assert record["totalBeforeEdit"] == "N/A"
+    assert record["_original"] == {"total": "2500.00", "proposedDate": 0}
+    assert "missing" not in record
+
+
+def test_collections_without_rules_pass_through():
+    records = [{"anything": "12/01/2021"}]
+    assert list(normalize_records("spusers", records)) == records
+
+
+def test_records_are_normalized_lazily():
+    def records():
+        yield {"amount": "1.5"}
+        raise AssertionError("read past the first record")
+
+    assert next(normalize_records("GeneralLedger", records(), keep_originals=False)) == {"amount": 1.5}
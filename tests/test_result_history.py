@@ -0,0 +1,82 @@
+import os
+
+import pandas as pd
+import pytest
+from bson import ObjectId
+
+from result_history import ResultHistory, frame_memory_bytes, get_history_stats
+
+
+def make_frame(rows=200):
+    return pd.DataFrame({
+        "_id": [str(ObjectId()) for _ in range(rows)],
+        "companyName": [f"Company {i}" for i in range(rows)],
+        "squareFootage": pd.Series(range(rows), dtype="int16"),
+        "status": pd.Categorical(["Available", "Proposed"] * (rows // 2)),
+        "dateCreated": pd.date_range("2024-01-01", periods=rows, freq="h"),
+        "proposals": [[{"total": i, "services": ["Janitorial"]}] for i in range(rows)],
+        "suggestedPrice": [i if i % 2 else "N/A" for i in range(rows)],
+    })
+
+
+@pytest.fixture
+def history(tmp_path):
+    return ResultHistory(budget_bytes=1, spill_dir=str(tmp_path), max_entries=3)
+
+
+def test_spilled_results_round_trip_unchanged(history):
+    first, second = make_frame(), make_frame()
+    history.add("first", first, {"question": "one"})
+    history.add("second", second, {"question": "two"})
+
+    assert dict((entry_id, spilled) for entry_id, _, spilled in history.list_entries()) == {"first": True, "second": False}
+    assert history.disk_bytes > 0
+    pd.testing.assert_frame_equal(history.get("first"), first)
+
+
+def test_reload_spills_the_other_entry_and_removes_its_file(history):
+    history.add("first", make_frame(), {})
+    history.add("second", make_frame(), {})
+    spill_path = history.entries["first"].spill_path
+    history.get("first")
+    assert not os.path.exists(spill_path)
+    assert history.entries["second"].spilled
+    assert not history.entries["first"].spilled
+
+
+def test_max_entries_drops_the_oldest(history):
+    for i in range(4):
+        history.add(str(i), make_frame(10), {"i": i})
+    assert [entry_id for entry_id, _, _ in history.list_entries()] == ["3", "2", "1"]
+    assert history.get("0") is None
+
+
+def test_entries_within_budget_stay_in_memory(tmp_path):
+    history = ResultHistory(budget_bytes=10 * 1024 * 1024, spill_dir=str(tmp_path))
+    history.add("first", make_frame(), {})
+    history.add("second", make_frame(), {})
+    assert not any(spilled for _, _, spilled in history.list_entries())
+    assert history.memory_bytes > 0
+
+
+def test_clear_removes_spilled_files(history):
+    history.add("first", make_frame(), {})
+    history.add("second", make_frame(), {})
+    spill_path = history.entries["first"].spill_path
+    history.clear()
+    assert not os.path.exists(spill_path)
+    assert history.list_entries() == []
+
+
+def test_nested_documents_count_towards_memory():
+    flat = pd.DataFrame({"proposals": ["x"] * 100})
+    nested = pd.DataFrame({"proposals": [[{"description": "x" * 1000}]] * 100})
+    assert frame_memory_bytes(nested) > frame_memory_bytes(flat) + 100 * 1000
+
+
+def test_history_stats_cover_every_session(history):
+    history.add("first", make_frame(), {})
+    history.add("second", make_frame(), {})
+    sessions = {s["session"]: s for s in get_history_stats()["sessions"]}
+    assert sessions[history.label]["spilled"] == 1
+    assert sessions[history.label]["in_memory"] == 1
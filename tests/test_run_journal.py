@@ -0,0 +1,89 @@
+import os
+
+import config
+from fetch_engine import landing_paths, write_ndjson
+from ingest import run_ingestion
+from run_journal import COMPLETE, FAILED, RunJournal, dead_letter, iter_dead_letters, open_journal
+from upload_to_mongodb import retry_dead_letters, upload_endpoint
+
+
+def test_resume_continues_the_unfinished_run(db):
+    journal = RunJournal(db, "upload")
+    journal.complete("upload/leads", records=3)
+    journal.fail("upload/rfps", "connection reset")
+    assert journal.finish() == FAILED
+
+    resumed = RunJournal(db, "upload", resume=True)
+    assert resumed.resumed and resumed.run_id == journal.run_id
+    assert resumed.is_done("upload/leads")
+    assert not resumed.is_done("upload/rfps")
+
+    resumed.complete("upload/rfps")
+    assert resumed.finish() == COMPLETE
+    assert db[config.RUNS_COLLECTION].find_one({"_id": journal.run_id})["failedUnits"] == 0
+
+
+def test_completed_runs_and_other_kinds_are_not_resumed(db):
+    journal = RunJournal(db, "upload")
+    journal.complete("upload/leads")
+    assert journal.finish() == COMPLETE
+    RunJournal(db, "ingest")
+
+    resumed = RunJournal(db, "upload", resume=True)
+    assert not resumed.resumed
+    assert resumed.run_id != journal.run_id
+    assert resumed.done == set()
+
+
+def test_no_database_means_no_journal():
+    assert open_journal(None, "ingest") is None
+
+
+def test_resumed_ingestion_skips_landed_endpoints(db, data_dir, stub_api):
+    journal = open_journal(db, "ingest")
+    run_ingestion(["leads", "rfps"], output_dir=data_dir, journal=journal)
+    os.remove(landing_paths("rfps", data_dir)[0])
+    stub_api.reset()
+
+    results, _ = run_ingestion(["leads", "rfps"], output_dir=data_dir, journal=open_journal(db, "ingest", resume=True))
+    assert [r["status"] for r in results] == ["skipped", "ok"]
+    assert stub_api.stats["requests"] == 1
+
+
+def leads_with_a_keyless_record(data_dir):
+    records = [{"businessLocationId": i, "companyName": f"Company {i}"} for i in range(3)]
+    records.append({"companyName": "no key"})
+    write_ndjson(landing_paths("leads", data_dir)[0], records)
+
+
+def test_failed_records_are_dead_lettered(db, data_dir):
+    leads_with_a_keyless_record(data_dir)
+    journal = open_journal(db, "upload")
+    stats = upload_endpoint(db, "leads", data_dir=data_dir, journal=journal)
+    assert (stats["inserted"], stats["skipped"]) == (3, 1)
+    letters = list(iter_dead_letters(db, "leads"))
+    assert [(letter["record"]["companyName"], letter["run"]) for letter in letters] == [("no key", journal.run_id)]
+    assert journal.is_done("upload/leads")
+
+
+def test_resumed_upload_skips_uploaded_endpoints(db, data_dir):
+    leads_with_a_keyless_record(data_dir)
+    journal = open_journal(db, "upload")
+    upload_endpoint(db, "leads", data_dir=data_dir, journal=journal)
+    journal.fail("upload/rfps", "interrupted")
+    journal.finish()
+
+    resumed = open_journal(db, "upload", resume=True)
+    assert upload_endpoint(db, "leads", data_dir=data_dir, journal=resumed)["status"] == "skipped"
+    assert db[config.DEAD_LETTERS_COLLECTION].count_documents({}) == 1
+
+
+def test_retried_dead_letters_load_or_stay(db):
+    dead_letter(db, "leads", {"businessLocationId": 7, "companyName": "fixed"}, "connection reset")
+    dead_letter(db, "leads", {"companyName": "still no key"}, "no natural key (businessLocationId)")
+
+    stats = retry_dead_letters(db, "leads")
+    assert (stats["records"], stats["retried"], stats["failed"]) == (2, 1, 1)
+    assert db.leads.find_one({"businessLocationId": 7})["companyName"] == "fixed"
+    [letter] = iter_dead_letters(db, "leads")
+    assert (letter["record"]["companyName"], letter["attempts"]) == ("still no key", 2)
@@ -0,0 +1,74 @@
+import pandas as pd
+
+from schema_catalog import apply_schema_hints, get_field_hint, optimize_frame_dtypes
+
+
+def test_nested_fields_use_their_last_segment():
+    assert get_field_hint("address.serviceAddressState") == "category"
+    assert get_field_hint("companyName") is None
+
+
+def test_hinted_columns_are_typed():
+    df = apply_schema_hints(pd.DataFrame({
+        "transactionDate": ["12/01/2021", "2021-12-02", None],
+        "dateCreated": [1621850300000, None, 1621850400000],
+        "amount": ["2500.00", 12, None],
+        "status": ["Available", "Proposed", "Available"],
+    }))
+    assert pd.api.types.is_datetime64_any_dtype(df["transactionDate"])
+    assert df["transactionDate"].iloc[1] == pd.Timestamp("2021-12-02")
+    assert pd.api.types.is_datetime64_any_dtype(df["dateCreated"])
+    assert df["amount"].tolist()[:2] == [2500.0, 12.0]
+    assert isinstance(df["status"].dtype, pd.CategoricalDtype)
+
+
+def test_columns_with_unparseable_values_are_left_unchanged():
+    original = pd.DataFrame({
+        "transactionDate": ["12/01/2021", "soon"],
+        "dateCreated": [1621850300000, "N/A"],
+        "amount": ["2500.00", "N/A"],
+    })
+    df = apply_schema_hints(original)
+    for column in original.columns:
+        assert df[column].tolist() == original[column].tolist()
+
+
+def test_blank_values_count_as_missing():
+    df = apply_schema_hints(pd.DataFrame({"amount": ["2500.00", ""], "createDate": ["12/01/2021", " "]}))
+    assert df["amount"].dtype == "float64"
+    assert pd.api.types.is_datetime64_any_dtype(df["createDate"])
+
+
+def test_out_of_range_epochs_are_left_unchanged():
+    df = apply_schema_hints(pd.DataFrame({"lastUpdated": [1621850300000, 10**20]}))
+    assert df["lastUpdated"].tolist() == [1621850300000, 10**20]
+
+
+def test_mixed_type_categoricals_stay_object():
+    df = apply_schema_hints(pd.DataFrame({"status": [1, "Available", None]}))
+    assert df["status"].dtype == object
+    assert df["status"].tolist()[:2] == [1, "Available"]
+
+
+def test_nested_documents_are_left_unchanged():
+    df = apply_schema_hints(pd.DataFrame({"status": [{"code": "A"}, {"code": "B"}]}))
+    assert df["status"].tolist() == [{"code": "A"}, {"code": "B"}]
+
+
+def test_optimize_frame_dtypes_shrinks_and_reports():
+    rows = 100
+    df = pd.DataFrame({
+        "city": ["Boston", "Akron"] * (rows // 2),
+        "squareFootage": list(range(rows)),
+        "amount": [1.5] * rows,
+        "ratio": [0.5] * rows,
+    })
+    optimized, report = optimize_frame_dtypes(df)
+    assert isinstance(optimized["city"].dtype, pd.CategoricalDtype)
+    assert optimized["squareFootage"].dtype == "int8"
+    assert optimized["amount"].dtype == "float64"
+    assert optimized["ratio"].dtype == "float32"
+    assert report["after_bytes"] < report["before_bytes"]
+    assert report["saved_bytes"] == report["before_bytes"] - report["after_bytes"]
+    assert "city" in report["columns"]
+    assert optimized["squareFootage"].tolist() == df["squareFootage"].tolist()
@@ -0,0 +1,107 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo.errors import PyMongoError
+
+import upload_to_mongodb
+from fetch_engine import config, landing_paths
+from ingest import ingest_endpoint
+from sync_state import commit_landing_sync, load_sync_state, plan_sync, save_sync_state
+from upload_to_mongodb import upload_endpoint
+
+NOW = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+
+def read_meta(data_dir, name="leads"):
+    with open(landing_paths(name, data_dir)[1]) as f:
+        return json.load(f)
+
+
+def test_no_state_plans_a_full_fetch():
+    assert plan_sync("leads", None, now=NOW) is None
+
+
+def test_endpoints_without_a_watermark_are_always_fetched_in_full():
+    state = {"watermark": 5, "lastFullSync": NOW}
+    assert plan_sync("general_ledger", state, now=NOW) is None
+
+
+def test_recent_full_sync_plans_an_incremental_fetch():
+    state = {"watermark": 5, "lastFullSync": NOW - timedelta(hours=1)}
+    assert plan_sync("leads", state, now=NOW) == 5
+    assert plan_sync("leads", state, full=True, now=NOW) is None
+
+
+def test_full_sync_is_due_after_the_interval():
+    state = {"watermark": 5, "lastFullSync": NOW - timedelta(hours=config.FSM_FULL_SYNC_HOURS)}
+    assert plan_sync("leads", state, now=NOW) is None
+
+
+def test_incremental_fetches_only_move_the_watermark_forward(db):
+    save_sync_state(db, "leads", None, {"records": 10, "watermark": 100}, now=NOW)
+    save_sync_state(db, "leads", 100, {"records": 0, "watermark": 50}, now=NOW)
+    state = load_sync_state(db, "leads")
+    assert state["watermark"] == 100
+    assert state["lastMode"] == "incremental"
+    save_sync_state(db, "leads", 100, {"records": 3, "watermark": 120}, now=NOW)
+    assert load_sync_state(db, "leads")["watermark"] == 120
+
+
+def test_tenants_have_their_own_state(db):
+    tenant = {"key": "boston", "tenant": "boston"}
+    save_sync_state(db, "leads", None, {"records": 1, "watermark": 7}, now=NOW, tenant=tenant)
+    assert load_sync_state(db, "leads") is None
+    assert load_sync_state(db, "leads", tenant)["watermark"] == 7
+
+
+def test_fetch_leaves_the_watermark_pending(db, data_dir, stub_api):
+    stats = ingest_endpoint("leads", data_dir, db)
+    assert stats["status"] == "ok"
+    assert read_meta(data_dir)["sync"]["status"] == "pending"
+    assert load_sync_state(db, "leads") is None
+
+
+def test_failed_upload_is_fetched_again_from_the_old_watermark(db, data_dir, stub_api, monkeypatch):
+    save_sync_state(db, "leads", None, {"records": 0, "watermark": 0}, now=datetime.now(timezone.utc) - timedelta(minutes=1))
+
+    assert ingest_endpoint("leads", data_dir, db)["mode"] == "incr"
+    fetched = read_meta(data_dir)["sync"]
+    assert fetched["since"] == 0 and fetched["watermark"] > 0
+
+    def fail(*args, **kwargs):
+        raise PyMongoError("connection lost")
+
+    with monkeypatch.context() as m:
+        m.setattr(upload_to_mongodb, "upsert_records", fail)
+        assert upload_endpoint(db, "leads", data_dir=data_dir)["status"] == "failed"
+    assert load_sync_state(db, "leads")["watermark"] == 0
+    assert read_meta(data_dir)["sync"]["status"] == "pending"
+
+    # The next run fetches from the old watermark again, then commits once loaded
+    ingest_endpoint("leads", data_dir, db)
+    assert read_meta(data_dir)["sync"]["since"] == 0
+    assert upload_endpoint(db, "leads", data_dir=data_dir)["status"] == "ok"
+    assert load_sync_state(db, "leads")["watermark"] == fetched["watermark"]
+    assert read_meta(data_dir)["sync"]["status"] == "committed"
+
+
+def test_commit_never_moves_back_past_a_later_fetch(db, data_dir, stub_api):
+    ingest_endpoint("leads", data_dir, db)
+    meta_path = landing_paths("leads", data_dir)[1]
+    later = datetime.now(timezone.utc) + timedelta(hours=1)
+    save_sync_state(db, "leads", None, {"records": 1, "watermark": 10**15}, now=later)
+
+    assert commit_landing_sync(db, meta_path) is False
+    assert load_sync_state(db, "leads")["watermark"] == 10**15
+    assert read_meta(data_dir)["sync"]["status"] == "committed"
+    # A committed landing file is not committed twice
+    assert commit_landing_sync(db, meta_path) is False
+
+
+@pytest.mark.parametrize("meta", [None, "not json", {"endpoint": "leads"}])
+def test_commit_ignores_landing_files_without_pending_sync(db, tmp_path, meta):
+    meta_path = tmp_path / "leads.meta.json"
+    if meta is not None:
+        meta_path.write_text(meta if isinstance(meta, str) else json.dumps(meta))
+    assert commit_landing_sync(db, str(meta_path)) is False
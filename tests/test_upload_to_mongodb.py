@@ -0,0 +1,424 @@
+import json
+import os
+import shutil
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.errors import PyMongoError
+
+import config
+import upload_to_mongodb
+from endpoints import ENDPOINTS
+from fetch_engine import DATA_DIR as SAMPLE_DIR, landing_paths, tenant_dir, write_ndjson
+from ingest import ingest_endpoint, run_ingestion
+from index_specs import natural_key_fields
+from sync_state import load_sync_state
+from upload_to_mongodb import (
+    LOADER_FIELDS, check_full_sources, content_hash, extract_references, find_landing_file, iter_landing_records,
+    load_time_range, natural_key, parse_date, replace_time_range, rollback, split_references, upload_endpoint,
+    upsert_records,
+)
+
+LEDGER_KEY = natural_key_fields("GeneralLedger")
+
+
+def ledger_row(transaction_id, amount=100.0, **fields):
+    return dict({
+        "transactionType": "Customer Invoice",
+        "transactionId": transaction_id,
+        "refNum": f"INV-{transaction_id}",
+        "creditAccount": {"id": 1},
+        "debitAccount": {"id": 2},
+        "amount": amount,
+    }, **fields)
+
+
+def test_natural_key_reads_nested_fields():
+    assert natural_key(ledger_row("T1"), LEDGER_KEY) == {
+        "transactionType": "Customer Invoice", "transactionId": "T1", "refNum": "INV-T1",
+        "creditAccount.id": 1, "debitAccount.id": 2,
+    }
+    assert natural_key({"other": 1}, ["id"]) is None
+
+
+def test_ledger_key_is_the_transaction_identity():
+    assert "amount" not in config.NATURAL_KEYS["GeneralLedger"]
+
+
+def test_content_hash_ignores_field_order_and_loader_fields():
+    assert content_hash({"a": 1, "b": 2}) == content_hash({"b": 2, "a": 1, "_importedAt": "x", "_contentHash": "y"})
+    assert content_hash({"a": 1}) != content_hash({"a": 2})
+
+
+def test_upserts_are_idempotent(db):
+    records = [ledger_row(f"T{i}") for i in range(5)]
+    first = upsert_records(db.GeneralLedger, records, LEDGER_KEY, batch_size=2)
+    second = upsert_records(db.GeneralLedger, records, LEDGER_KEY, batch_size=2)
+    assert (first["inserted"], first["batches"]) == (5, 3)
+    assert (second["inserted"], second["updated"], second["unchanged"]) == (0, 0, 5)
+    assert db.GeneralLedger.count_documents({}) == 5
+
+
+def test_corrected_amount_updates_the_ledger_line(db):
+    upsert_records(db.GeneralLedger, [ledger_row("T1", 100.0)], LEDGER_KEY)
+    imported_at = db.GeneralLedger.find_one()["_importedAt"]
+    counts = upsert_records(db.GeneralLedger, [ledger_row("T1", 120.0)], LEDGER_KEY)
+    assert counts["updated"] == 1
+    doc = db.GeneralLedger.find_one()
+    assert db.GeneralLedger.count_documents({}) == 1
+    assert doc["amount"] == 120.0
+    assert doc["_importedAt"] == imported_at
+
+
+def test_records_without_a_key_are_skipped(db):
+    errors = []
+    counts = upsert_records(db.leads, [{"companyName": "x"}], ["businessLocationId"], on_error=lambda r, e: errors.append(e))
+    assert counts["skipped"] == 1
+    assert db.leads.count_documents({}) == 0
+    assert errors == ["no natural key (businessLocationId)"]
+
+
+@pytest.fixture
+def leads_landing(data_dir):
+    """data_dir holding the leads sample response as its landing file"""
+    shutil.copy(os.path.join(SAMPLE_DIR, "leads_response.json"), data_dir)
+    return data_dir
+
+
+@pytest.fixture
+def duplicated_leads(db, leads_landing):
+    """A leads collection loaded before it had a unique natural key, holding duplicates"""
+    upload_endpoint(db, "leads", data_dir=leads_landing)
+    db.leads.drop_index("natural_key")
+    docs = list(db.leads.find({}, {"_id": 0}))
+    stale = []
+    for doc in docs[:3]:
+        copy = {k: v for k, v in doc.items() if k not in LOADER_FIELDS}
+        copy["companyName"] = "stale copy"
+        stale.append(dict(copy, _contentHash=content_hash(copy), _importedAt=doc["_importedAt"] - timedelta(days=1)))
+    db.leads.insert_many(stale)
+    return docs
+
+
+def test_reload_of_a_duplicated_collection_converges(db, leads_landing, duplicated_leads):
+    count = len(duplicated_leads)
+    assert db.leads.count_documents({}) == count + 3
+
+    # Only an explicit dedupe deletes documents
+    upload_endpoint(db, "leads", data_dir=leads_landing)
+    assert db.leads.count_documents({}) == count + 3
+    assert "natural_key" not in db.leads.index_information()
+
+    first = upload_endpoint(db, "leads", data_dir=leads_landing, dedupe=True)
+    assert first["status"] == "ok"
+    assert db.leads.count_documents({}) == count
+    assert db.leads.count_documents({"companyName": "stale copy"}) == 0
+    assert "natural_key" in db.leads.index_information()
+
+    second = upload_endpoint(db, "leads", data_dir=leads_landing)
+    assert second["status"] == "ok"
+    assert (second["inserted"], second["updated"]) == (0, 0)
+    assert db.leads.count_documents({}) == count
+
+
+def landing_mode(data_dir, name, mode):
+    """Rewrite a landing file's recorded fetch mode"""
+    meta_path = landing_paths(name, data_dir)[1]
+    with open(meta_path) as f:
+        meta = json.load(f)
+    meta["sync"]["mode"] = mode
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+
+
+@pytest.fixture
+def full_landing(db, data_dir, stub_api):
+    """data_dir holding a full fetch of leads"""
+    assert ingest_endpoint("leads", data_dir)["status"] == "ok"
+    return data_dir
+
+
+def test_full_refresh_swaps_staging_in_and_keeps_the_previous_version(db, full_landing):
+    db.leads.insert_one({"businessLocationId": -1, "companyName": "live"})
+    db.leads.create_index("companyName", name="live_index")
+
+    stats = upload_endpoint(db, "leads", data_dir=full_landing, full=True)
+    assert stats["status"] == "ok"
+    collections = db.list_collection_names()
+    assert "leads__staging" not in collections
+    assert db.leads.count_documents({}) == stats["inserted"] > 0
+    assert db.leads.count_documents({"companyName": "live"}) == 0
+    assert "natural_key" in db.leads.index_information()
+    # The old live collection was kept, indexes and all
+    assert list(db.leads__previous.find({}, {"_id": 0})) == [{"businessLocationId": -1, "companyName": "live"}]
+    assert "live_index" in db.leads__previous.index_information()
+
+    rollback(db, "leads")
+    assert list(db.leads.find({}, {"_id": 0})) == [{"businessLocationId": -1, "companyName": "live"}]
+    assert "leads__previous" not in db.list_collection_names()
+
+
+def test_failed_swap_leaves_the_live_collection_in_place(db, full_landing, monkeypatch):
+    db.leads.insert_one({"businessLocationId": -1, "companyName": "live"})
+    staging_name = "leads" + upload_to_mongodb.STAGING_SUFFIX
+    rename = type(db.leads).rename
+
+    def failing_rename(self, new_name, **kwargs):
+        if self.name == staging_name:
+            raise PyMongoError("rename interrupted")
+        return rename(self, new_name, **kwargs)
+
+    monkeypatch.setattr(type(db.leads), "rename", failing_rename)
+    stats = upload_endpoint(db, "leads", data_dir=full_landing, full=True)
+    assert stats["status"] == "failed"
+    assert list(db.leads.find({}, {"_id": 0})) == [{"businessLocationId": -1, "companyName": "live"}]
+
+
+def test_full_refresh_of_a_new_collection(db, full_landing):
+    assert upload_endpoint(db, "leads", data_dir=full_landing, full=True)["status"] == "ok"
+    assert db.leads.count_documents({}) > 0
+    assert "leads__previous" not in db.list_collection_names()
+
+
+@pytest.mark.parametrize("mode", ["incremental", None])
+def test_full_refresh_refuses_partial_landing_files(db, full_landing, mode):
+    landing_mode(full_landing, "leads", mode)
+    db.leads.insert_one({"businessLocationId": -1})
+    stats = upload_endpoint(db, "leads", data_dir=full_landing, full=True)
+    assert stats["status"] == "failed"
+    assert "not in full" in stats["error"]
+    assert list(db.leads.find({}, {"_id": 0})) == [{"businessLocationId": -1}]
+    assert "leads__staging" not in db.list_collection_names()
+
+
+def test_full_refresh_refuses_landing_files_without_metadata(db, leads_landing):
+    stats = upload_endpoint(db, "leads", data_dir=leads_landing, full=True)
+    assert stats["status"] == "failed"
+    assert "no landing metadata" in stats["error"]
+
+
+def test_full_refresh_needs_every_tenant(monkeypatch, full_landing):
+    boston, akron = {"key": "boston", "tenant": "boston"}, {"key": "akron", "tenant": "akron"}
+    monkeypatch.setattr(config, "MULTI_TENANT", True)
+    monkeypatch.setattr(config, "FSM_TENANTS", [boston, akron])
+    path = landing_paths("leads", full_landing)[0]
+    assert check_full_sources("leads", [(boston, path)]) == "no landing file for tenant(s) akron"
+    assert check_full_sources("leads", [(boston, path), (akron, path)]) is None
+
+
+def test_full_refresh_rejects_a_short_staging_collection(db, full_landing):
+    db.leads.insert_many([{"businessLocationId": -i} for i in range(1, 1001)])
+    stats = upload_endpoint(db, "leads", data_dir=full_landing, full=True)
+    assert stats["status"] == "failed"
+    assert "FULL_REFRESH_MIN_RATIO" in stats["error"]
+    assert db.leads.count_documents({}) == 1000
+    assert "leads__staging" not in db.list_collection_names()
+
+
+def test_records_are_written_batch_by_batch_as_they_stream(db):
+    written = []
+
+    def records():
+        for i in range(5):
+            if i == 4:
+                written.append(db.leads.count_documents({}))
+            yield {"businessLocationId": i}
+
+    counts = upsert_records(db.leads, records(), ["businessLocationId"], batch_size=2)
+    assert written == [4]
+    assert (counts["records"], counts["inserted"], counts["batches"]) == (5, 5, 3)
+
+
+def test_landing_files_and_saved_responses_hold_the_same_records(data_dir, leads_landing):
+    saved = list(iter_landing_records("leads", os.path.join(leads_landing, "leads_response.json")))
+    path = landing_paths("leads", data_dir)[0]
+    write_ndjson(path, iter(saved))
+    assert find_landing_file("leads", data_dir) == path
+    assert list(iter_landing_records("leads", path)) == saved
+
+
+def test_endpoints_upload_in_parallel(db, data_dir, stub_api, monkeypatch):
+    names = ["leads", "proposals", "spusers", "serviceproviders", "servicecontracts"]
+    run_ingestion(names, output_dir=data_dir)
+    monkeypatch.setattr(upload_to_mongodb, "get_database", lambda: db)
+    results = upload_to_mongodb.upload_to_mongodb(names, batch_size=50, workers=4, data_dir=data_dir)
+    assert [r["status"] for r in results] == ["ok"] * len(names)
+    for name, result in zip(names, results):
+        collection = ENDPOINTS[name]["collection"]
+        assert db[collection].count_documents({}) == result["inserted"] == stub_api.total(name)
+
+
+def test_unchanged_records_are_not_sent(db):
+    records = [{"businessLocationId": i, "status": "Available"} for i in range(4)]
+    upsert_records(db.leads, records, ["businessLocationId"])
+    sent = []
+    bulk_write = db.leads.bulk_write
+
+    class Recording:
+        name = db.leads.name
+
+        def __getattr__(self, attr):
+            return getattr(db.leads, attr)
+
+        def bulk_write(self, ops, **kwargs):
+            sent.extend(ops)
+            return bulk_write(ops, **kwargs)
+
+    records[2] = dict(records[2], status="Proposed")
+    counts = upsert_records(Recording(), records, ["businessLocationId"])
+    assert (counts["unchanged"], counts["updated"], counts["inserted"]) == (3, 1, 0)
+    assert len(sent) == 1
+    doc = db.leads.find_one({"businessLocationId": 2})
+    assert doc["status"] == "Proposed"
+    assert doc["_contentHash"] == content_hash(records[2])
+
+
+def test_content_hash_covers_nested_documents():
+    record = {"id": 1, "proposals": [{"total": 1}]}
+    assert content_hash(record) != content_hash({"id": 1, "proposals": [{"total": 2}]})
+
+
+def ledger_row_with_entities(transaction_id, account_name="Cash", tenant=None):
+    row = ledger_row(transaction_id, creditAccount={"id": 1, "name": account_name}, debitAccount={"id": 2, "name": "Revenue"})
+    row["invoice"] = {"id": None, "number": "draft"}
+    if tenant is not None:
+        row[config.TENANT_FIELD] = tenant
+    return row
+
+
+def test_split_references_keeps_only_ids():
+    row = ledger_row_with_entities("T1")
+    extracted = split_references(row, config.REFERENCE_FIELDS["GeneralLedger"])
+    assert extracted == [("accounts", {"id": 1, "name": "Cash"}), ("accounts", {"id": 2, "name": "Revenue"})]
+    assert (row["creditAccount"], row["debitAccount"]) == ({"id": 1}, {"id": 2})
+    assert row["invoice"] == {"id": None, "number": "draft"}
+    assert split_references(row, config.REFERENCE_FIELDS["GeneralLedger"]) == []
+
+
+def test_extracted_entities_are_upserted_once(db):
+    counts = {}
+    rows = list(extract_references(
+        db, "GeneralLedger", [ledger_row_with_entities(f"T{i}") for i in range(5)], batch_size=2, counts=counts,
+    ))
+    assert [row["creditAccount"] for row in rows] == [{"id": 1}] * 5
+    assert sorted(doc["id"] for doc in db.accounts.find()) == [1, 2]
+    assert counts["accounts"]["inserted"] == 2
+
+    counts = {}
+    list(extract_references(db, "GeneralLedger", [ledger_row_with_entities("T9", "Cash (renamed)")], counts=counts))
+    assert counts["accounts"]["updated"] == 1
+    assert db.accounts.find_one({"id": 1})["name"] == "Cash (renamed)"
+
+
+def test_extracted_entities_keep_their_tenant(db, monkeypatch):
+    monkeypatch.setattr(config, "MULTI_TENANT", True)
+    rows = [ledger_row_with_entities("T1", tenant="east"), ledger_row_with_entities("T1", "West cash", tenant="west")]
+    list(extract_references(db, "GeneralLedger", rows))
+    names = {doc[config.TENANT_FIELD]: doc["name"] for doc in db.accounts.find({"id": 1})}
+    assert names == {"east": "Cash", "west": "West cash"}
+
+
+def test_collections_without_reference_fields_pass_through(db):
+    records = [{"businessLocationId": 1, "status": {"id": 3, "name": "Available"}}]
+    assert list(extract_references(db, "leads", records)) == records
+    assert db.list_collection_names() == []
+
+
+def test_parse_date_accepts_request_formats():
+    assert parse_date("12/1/2021") == datetime(2021, 12, 1)
+    assert parse_date("2021-12-01") == datetime(2021, 12, 1)
+    assert parse_date("December") is None
+
+
+def test_time_range_comes_from_the_request_parameters(tmp_path):
+    meta_path = tmp_path / "general_ledger.meta.json"
+    meta_path.write_text(json.dumps({"params": {"startDate": "12/1/2021", "endDate": "12/31/2021"}}))
+    assert load_time_range("GeneralLedger", str(meta_path), []) == (datetime(2021, 12, 1), datetime(2021, 12, 31))
+
+
+def test_time_range_falls_back_to_the_records(tmp_path):
+    records = [{"transactionDate": datetime(2021, 12, day)} for day in (9, 2, 20)] + [{"transactionDate": None}]
+    assert load_time_range("GeneralLedger", str(tmp_path / "missing.json"), records) == (
+        datetime(2021, 12, 2), datetime(2021, 12, 20),
+    )
+    assert load_time_range("GeneralLedger", str(tmp_path / "missing.json"), [{}]) is None
+
+
+def dated_rows(days, amount=100.0):
+    return [ledger_row(f"T{day}", amount, transactionDate=datetime(2021, 12, day, 15)) for day in days]
+
+
+def test_reloading_a_time_range_replaces_it(db):
+    replace_time_range(db, "GeneralLedger", dated_rows([1, 2, 3]), None)
+    december_2 = (datetime(2021, 12, 2), datetime(2021, 12, 2))
+    counts = replace_time_range(db, "GeneralLedger", dated_rows([2], 120.0), december_2)
+    assert (counts["deleted"], counts["inserted"]) == (1, 1)
+    assert sorted(doc["amount"] for doc in db.GeneralLedger.find()) == [100.0, 100.0, 120.0]
+
+    again = replace_time_range(db, "GeneralLedger", dated_rows([2], 120.0), december_2)
+    assert (again["deleted"], again["inserted"]) == (1, 1)
+    assert db.GeneralLedger.count_documents({}) == 3
+
+
+def test_time_series_documents_get_their_meta_field(db):
+    replace_time_range(db, "GeneralLedger", dated_rows([1]), None)
+    meta = db.GeneralLedger.find_one()["ledger"]
+    assert meta.pop("_load")
+    assert meta == {"transactionType": "Customer Invoice", "creditAccountId": 1, "debitAccountId": 2}
+
+
+def test_failed_range_load_keeps_the_old_documents(db, monkeypatch):
+    december = (datetime(2021, 12, 1), datetime(2021, 12, 31))
+    replace_time_range(db, "GeneralLedger", dated_rows([1, 2, 3]), december)
+    insert_many = type(db.GeneralLedger).insert_many
+    batches = []
+
+    def failing_insert_many(self, documents, **kwargs):
+        batches.append(documents)
+        if len(batches) > 1:
+            raise PyMongoError("connection reset")
+        return insert_many(self, documents, **kwargs)
+
+    monkeypatch.setattr(type(db.GeneralLedger), "insert_many", failing_insert_many)
+    with pytest.raises(PyMongoError):
+        replace_time_range(db, "GeneralLedger", dated_rows([1, 2, 3], 120.0), december, batch_size=2)
+    assert sorted(doc["amount"] for doc in db.GeneralLedger.find()) == [100.0, 100.0, 100.0]
+
+
+def test_time_range_replacement_is_per_tenant(db):
+    december = (datetime(2021, 12, 1), datetime(2021, 12, 31))
+    replace_time_range(db, "GeneralLedger", dated_rows([1, 2]), december, tenant_key="east")
+    replace_time_range(db, "GeneralLedger", dated_rows([1]), december, tenant_key="west")
+    counts = replace_time_range(db, "GeneralLedger", dated_rows([5]), december, tenant_key="west")
+    assert counts["deleted"] == 1
+    assert db.GeneralLedger.count_documents({"ledger._tenant": "east"}) == 2
+    assert [doc["transactionId"] for doc in db.GeneralLedger.find({"_tenant": "west"})] == ["T5"]
+
+
+def test_undated_rows_are_skipped(db):
+    errors = []
+    counts = replace_time_range(
+        db, "GeneralLedger", [ledger_row("T1")] + dated_rows([1]), None, on_error=lambda r, e: errors.append(e),
+    )
+    assert (counts["skipped"], counts["inserted"]) == (1, 1)
+    assert errors == ["no transactionDate date"]
+
+
+def test_tenants_load_into_their_own_partition(db, data_dir, stub_api, tenants):
+    results, _ = run_ingestion(["leads"], output_dir=data_dir, db=db)
+    assert [(r["tenant"], r["status"]) for r in results] == [("east", "ok"), ("west", "ok")]
+    assert all(os.path.exists(landing_paths("leads", tenant_dir(data_dir, t))[0]) for t in tenants)
+    assert not os.path.exists(landing_paths("leads", data_dir)[0])
+
+    stats = upload_endpoint(db, "leads", data_dir=data_dir)
+    per_tenant = stats["records"] // 2
+    assert stats["inserted"] == stats["records"]
+    assert [db.leads.count_documents({config.TENANT_FIELD: t["key"]}) for t in tenants] == [per_tenant, per_tenant]
+    assert db.leads.index_information()["natural_key"]["key"][0] == (config.TENANT_FIELD, 1)
+    assert all(load_sync_state(db, "leads", t)["tenant"] == t["key"] for t in tenants)
+
+
+def test_a_tenant_without_landing_files_is_left_alone(db, data_dir, stub_api, tenants):
+    run_ingestion(["leads"], output_dir=data_dir, tenants=tenants[:1])
+    upload_endpoint(db, "leads", data_dir=data_dir)
+    assert db.leads.distinct(config.TENANT_FIELD) == ["east"]